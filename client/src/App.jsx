@@ -32,6 +32,10 @@ function App() {
         body: formData,
       });
 
+      if (response.status === 429) {
+        // LLM queue full: the server says when to come back
+        throw new Error(`Server busy, retry in ${response.headers.get("Retry-After")}s`);
+      }
       if (!response.ok) {
         throw new Error(`Server error: ${response.status}`);
       }
@@ -61,6 +65,22 @@ function App() {
             } else if (event.type === "ai_token") {
               // Phase 2: stream AI tokens
               setAiRawText((prev) => prev + event.token);
+            } else if (event.type === "ai_field") {
+              // Phase 2b: a top-level AI field completed and validated
+              setAiAnalysis((prev) => ({ ...(prev || {}), [event.key]: event.value }));
+              if (event.risk_score !== undefined) {
+                setRiskScore(event.risk_score);
+              }
+            } else if (event.type === "ai_queued") {
+              // Waiting for a free LLM slot
+              setAiRawText(`Waiting for the model (position ${event.position} in queue)...`);
+            } else if (event.type === "ai_part") {
+              // Large diff analyzed in parts; fields arrive once merged
+              setAiRawText(`Analyzed ${event.done} of ${event.total} parts...`);
+            } else if (event.type === "ai_retry") {
+              // Malformed output: the model is starting over
+              setAiRawText("");
+              setAiAnalysis(null);
             } else if (event.type === "ai_done") {
               // Phase 3: final structured result
               setAiAnalysis(event.ai_analysis);
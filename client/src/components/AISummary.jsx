@@ -55,8 +55,35 @@ function AISummary({ ai, isStreaming, rawText }) {
     return <span className="text-slate-300 text-sm leading-relaxed">{String(parsed)}</span>;
   };
 
+  const renderFields = (fields) => (
+    <div className="space-y-6">
+      {Object.entries(fields).map(([key, value], idx) => {
+        const formattedKey = key.replace(/_/g, ' ');
+        let icon = <Info size={16} className="text-blue-400" />;
+
+        if (key.toLowerCase().includes('risk') || key.toLowerCase().includes('break')) {
+          icon = <AlertTriangle size={16} className="text-amber-400" />;
+        } else if (key.toLowerCase().includes('security') || key.toLowerCase().includes('pii')) {
+          icon = <Shield size={16} className="text-emerald-400" />;
+        }
+
+        return (
+          <div key={idx} className="group">
+            <h4 className="flex items-center gap-2 text-sm font-semibold text-slate-100 mb-2 capitalize">
+              {icon}
+              {formattedKey}
+            </h4>
+            <div className="pl-6 border-l-2 border-slate-800 group-hover:border-blue-500/30 transition-colors">
+              {renderValue(value)}
+            </div>
+          </div>
+        );
+      })}
+    </div>
+  );
+
   const renderContent = () => {
-    // Streaming state — show raw text with a cursor
+    // Streaming state — show fields completed so far, then raw text with a cursor
     if (isStreaming) {
       return (
         <div className="space-y-3">
@@ -64,6 +91,7 @@ function AISummary({ ai, isStreaming, rawText }) {
             <Loader2 size={14} className="animate-spin" />
             <span>AI is analyzing your API changes...</span>
           </div>
+          {ai && typeof ai === 'object' && !ai.error && renderFields(ai)}
           <div className="font-mono text-xs text-slate-400 bg-slate-950/50 rounded-lg p-4 border border-blue-500/10 min-h-[120px] whitespace-pre-wrap break-words leading-relaxed">
             {rawText}
             <span className="inline-block w-2 h-4 bg-blue-400 ml-0.5 animate-pulse align-middle" />
@@ -94,32 +122,7 @@ function AISummary({ ai, isStreaming, rawText }) {
     }
     
     if (typeof ai === 'object') {
-      return (
-        <div className="space-y-6">
-          {Object.entries(ai).map(([key, value], idx) => {
-            const formattedKey = key.replace(/_/g, ' ');
-            let icon = <Info size={16} className="text-blue-400" />;
-            
-            if (key.toLowerCase().includes('risk') || key.toLowerCase().includes('break')) {
-              icon = <AlertTriangle size={16} className="text-amber-400" />;
-            } else if (key.toLowerCase().includes('security') || key.toLowerCase().includes('pii')) {
-              icon = <Shield size={16} className="text-emerald-400" />;
-            }
-
-            return (
-              <div key={idx} className="group">
-                <h4 className="flex items-center gap-2 text-sm font-semibold text-slate-100 mb-2 capitalize">
-                  {icon}
-                  {formattedKey}
-                </h4>
-                <div className="pl-6 border-l-2 border-slate-800 group-hover:border-blue-500/30 transition-colors">
-                  {renderValue(value)}
-                </div>
-              </div>
-            );
-          })}
-        </div>
-      );
+      return renderFields(ai);
     }
   };
 
@@ -0,0 +1,174 @@
+"""
+Admission control for LLM-bound analyses.
+
+At most ADMISSION_MAX_ACTIVE analyses generate at once; up to
+ADMISSION_MAX_QUEUE more wait for a slot, and beyond that new analyses are
+refused (HTTP 429 with a Retry-After estimate) instead of piling onto one
+Ollama instance until everyone times out.
+
+Waiting analyses are admitted smallest prompt first (estimated tokens), so a
+small diff isn't stuck behind a giant spec's generation. Waiting earns
+credit (ADMISSION_AGING tokens per second) so large ones still get through.
+
+Slots are held by single-flight generations (see singleflight.py): callers
+that coalesce onto a running or queued flight don't take another slot.
+"""
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+
+from backends import LatencyWindow
+from metrics import admission_wait_seconds
+from prompts import estimate_tokens
+
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_AGING = float(os.getenv("ADMISSION_AGING", "200"))
+# Retry-After (seconds) before any generation time has been measured
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+
+class AdmissionRejected(Exception):
+    """The admission queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One analysis' place in the gate: wait for the grant, run, then release."""
+
+    def __init__(self, gate, cost, seq):
+        self.gate = gate
+        self.cost = cost
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.position = 0
+        self.granted_at = None
+        self._granted = threading.Event()
+        self._waker = None
+
+    @property
+    def granted(self):
+        return self._granted.is_set()
+
+    def priority(self, now):
+        """Lower goes first: estimated tokens minus credit for time waited."""
+        return (self.cost - (now - self.enqueued) * self.gate.aging, self.seq)
+
+    def wait(self, timeout=None):
+        return self._granted.wait(timeout)
+
+    async def wait_async(self):
+        if self.granted:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waker = lambda: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        # Granted between the first check and installing the waker
+        if self.granted:
+            return
+        await future
+
+    def _grant(self):
+        self.granted_at = time.monotonic()
+        self._granted.set()
+        waker = self._waker
+        if waker:
+            waker()
+
+    def release(self):
+        self.gate._release(self)
+
+
+class AdmissionGate:
+    """Bounded concurrency with a bounded, size-prioritized wait queue."""
+
+    def __init__(self, max_active=ADMISSION_MAX_ACTIVE, max_queue=ADMISSION_MAX_QUEUE, aging=ADMISSION_AGING):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.aging = aging
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.queue_wait = LatencyWindow()
+        self.service_time = LatencyWindow()
+
+    def admit(self, prompts, bounded=True):
+        """Reserve a place for an analysis of `prompts`; see reserve."""
+        return self.reserve(sum(estimate_tokens(prompt) for prompt in prompts), bounded)
+
+    def reserve(self, cost, bounded=True):
+        """
+        A Ticket for work of `cost` tokens, granted now if a slot is free,
+        otherwise queued. Raises AdmissionRejected when the queue is full,
+        unless `bounded` is False (background jobs, already bounded upstream).
+        """
+        with self._lock:
+            ticket = Ticket(self, cost, next(self._seq))
+            if self._active < self.max_active:
+                self._active += 1
+                self.admitted += 1
+                ticket._grant()
+                return ticket
+            if bounded and len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"{len(self._queue)} analyses already waiting for the LLM",
+                    self._retry_after(),
+                )
+            self._queue.append(ticket)
+            ticket.position = len(self._queue)
+            return ticket
+
+    def _release(self, ticket):
+        with self._lock:
+            if not ticket.granted:
+                # Its waiter was cancelled before the grant: just leave the queue
+                self._queue.remove(ticket)
+                return
+        now = time.monotonic()
+        self.queue_wait.add(ticket.granted_at - ticket.enqueued)
+        admission_wait_seconds.observe(ticket.granted_at - ticket.enqueued)
+        self.service_time.add(now - ticket.granted_at)
+        with self._lock:
+            if not self._queue:
+                self._active -= 1
+                return
+            # The slot passes straight to the best waiting ticket
+            best = min(self._queue, key=lambda t: t.priority(now))
+            self._queue.remove(best)
+            self.admitted += 1
+            best._grant()
+
+    def _retry_after(self):
+        """Seconds until a queue place is likely free: the queue ahead drained at the measured pace."""
+        service = self.service_time.percentile(50)
+        if service is None:
+            return max(1, math.ceil(ADMISSION_RETRY_AFTER))
+        return max(1, math.ceil(service * (len(self._queue) + 1) / self.max_active))
+
+    def stats(self):
+        wait_p50 = self.queue_wait.percentile(50)
+        wait_p95 = self.queue_wait.percentile(95)
+        with self._lock:
+            return {
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "queue_wait_p50_ms": round(wait_p50 * 1000, 1) if wait_p50 is not None else None,
+                "queue_wait_p95_ms": round(wait_p95 * 1000, 1) if wait_p95 is not None else None,
+            }
+
+
+admission_gate = AdmissionGate()
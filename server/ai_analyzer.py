@@ -1,94 +1,91 @@
 """
 AI analyzer using Google Gemini API.
 Mirrored improvements from ai_analyzer_local: grounded prompt, validation.
+
+The static prompt prefix (rules + output template) is stored once as Gemini
+cached content and referenced by name, so each request only sends and
+prefills the per-request data. If the prefix can't be cached (e.g. it is
+below the model's minimum cacheable size) the full prompt is sent; its
+stable prefix still qualifies for Gemini's implicit caching.
 """
 import os
-import json
+import threading
+import time
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
 from utils import extract_json, validate_ai_output
+from prompts import build_prompts, PROMPT_PREFIX
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-
-def _build_minimal_spec(new_spec):
-    """Extract only what the AI needs from the spec."""
-    return {
-        "paths": {
-            path: {
-                method: {
-                    "summary": details.get("summary", ""),
-                    "parameters": [
-                        p.get("name", "") for p in details.get("parameters", [])
-                        if isinstance(p, dict)
-                    ],
-                }
-                for method, details in methods.items()
-                if isinstance(details, dict)
-            }
-            for path, methods in new_spec.get("paths", {}).items()
-        },
-        "schemas": list(new_spec.get("components", {}).get("schemas", {}).keys()),
-    }
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Wall-clock budget for one Gemini request, in seconds
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+_client = None
+_client_lock = threading.Lock()
+_prefix_lock = threading.Lock()
+_prefix_cache = {"name": None, "expires": 0.0, "retry_at": 0.0}
+
+
+def get_client():
+    """The Gemini client, created on first use rather than at import."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client(
+                api_key=os.getenv("GEMINI_API_KEY"),
+                http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT * 1000)),
+            )
+        return _client
+
+
+def _cached_prefix():
+    """Name of the cached-content entry holding PROMPT_PREFIX, or None if unavailable."""
+    now = time.time()
+    with _prefix_lock:
+        # Refresh a minute early so a request never references an expired entry
+        if _prefix_cache["name"] and now < _prefix_cache["expires"] - 60:
+            return _prefix_cache["name"]
+        if now < _prefix_cache["retry_at"]:
+            return None
+        try:
+            cached = get_client().caches.create(
+                model=GEMINI_MODEL,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=PROMPT_PREFIX,
+                    ttl=f"{GEMINI_CACHE_TTL}s",
+                ),
+            )
+        except Exception:
+            # Don't retry on every request; fall back to implicit caching
+            _prefix_cache.update(name=None, retry_at=now + GEMINI_CACHE_TTL)
+            return None
+        _prefix_cache.update(name=cached.name, expires=now + GEMINI_CACHE_TTL)
+        return cached.name
 
 
 def analyze_with_ai(diff_result, new_spec):
-    minimal_spec = _build_minimal_spec(new_spec)
-
-    # Pre-computed facts to ground the AI
-    facts = []
-    if diff_result.get("removed_endpoints"):
-        facts.append(f"REMOVED ENDPOINTS: {diff_result['removed_endpoints']}")
-    if diff_result.get("added_endpoints"):
-        facts.append(f"ADDED ENDPOINTS: {diff_result['added_endpoints']}")
-    if diff_result.get("method_changes"):
-        facts.append(f"METHOD CHANGES: {json.dumps(diff_result['method_changes'])}")
-    if diff_result.get("pii_fields_detected"):
-        facts.append(f"PII FIELDS ALREADY DETECTED: {diff_result['pii_fields_detected']}")
-    if diff_result.get("naming_issues"):
-        facts.append(f"NAMING ISSUES DETECTED: {diff_result['naming_issues']}")
-    if diff_result.get("missing_descriptions"):
-        facts.append(f"MISSING DESCRIPTIONS: {diff_result['missing_descriptions']}")
-
-    facts_str = "\n".join(facts) if facts else "No major changes detected by scanner."
-
-    prompt = f"""You are an API governance analyst. You must base ALL claims on the data below.
-
-RULES:
-1. Return ONLY valid JSON — no explanation, no markdown, no commentary.
-2. Do NOT invent endpoints, fields, or issues not in the data.
-3. risk_level MUST match actual severity from the changes listed below.
-4. pii_fields should ONLY list fields identifiable from the schema/paths.
-5. recommendations must be specific, referencing actual endpoints.
-6. Output must start with {{ and end with }}.
-
-=== AUTOMATED SCAN RESULTS (ground truth) ===
-{facts_str}
-
-=== NEW API SPEC (summary) ===
-{json.dumps(minimal_spec, indent=2)}
-
-=== FULL DIFF DATA ===
-{json.dumps(diff_result, indent=2)}
-
-Return this JSON:
-
-{{
-  "risk_level": "LOW or MEDIUM or HIGH",
-  "pii_fields": [],
-  "breaking_change_explanation": "Explain ONLY actual breaking changes",
-  "documentation_score": 5,
-  "recommendations": ["specific actionable items"],
-  "executive_summary": "2-3 sentence summary"
-}}"""
+    return analyze_prompt(build_prompts(diff_result, new_spec, max_parts=1)[0])
+
 
+def analyze_prompt(prompt):
+    """Run a prebuilt prompt (from prompts.build_prompts) and validate the answer."""
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-        )
+        cache_name = _cached_prefix()
+        if cache_name:
+            response = get_client().models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt[len(PROMPT_PREFIX):],
+                config=types.GenerateContentConfig(cached_content=cache_name),
+            )
+        else:
+            response = get_client().models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+            )
 
         parsed = extract_json(response.text)
         if "error" in parsed:
@@ -98,6 +95,14 @@ Return this JSON:
         if warnings:
             validated["_validation_warnings"] = warnings
 
+        # Prefix tokens served from cache (explicit or implicit) on this request
+        usage = response.usage_metadata
+        validated["_prefix_cache"] = {
+            "cached_tokens": (usage.cached_content_token_count or 0) if usage else 0,
+            "prompt_tokens": (usage.prompt_token_count or 0) if usage else 0,
+            "explicit_cache": bool(cache_name),
+        }
+
         return validated
 
     except Exception as e:
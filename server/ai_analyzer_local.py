@@ -2,35 +2,138 @@
 Local AI analyzer using Ollama.
 Improved with: grounded prompts, output validation, and retry logic.
 """
+import os
+import re
 import requests
 import json
-from utils import extract_json, validate_ai_output
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import extract_json, validate_ai_output, IncrementalJsonParser
+from prompts import build_prompts, merge_analyses, estimate_tokens, PROMPT_PREFIX
+from llm_client import ollama_client
+from metrics import llm_retries, observe_generation
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL_NAME = "gemma3:4b"
+# Bump whenever build_prompt, generation settings or the diff output change so
+# cached analyses are not reused
+PROMPT_VERSION = 8
 
 MAX_RETRIES = 2
 
+# Generation caps: we only need one JSON object, so bound the token count,
+# ask Ollama for JSON mode, and allow deployment-specific stop sequences
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1") == "1"
+LLM_STOP_SEQUENCES = json.loads(os.getenv("LLM_STOP_SEQUENCES", "[]"))
 
-def _build_minimal_spec(new_spec):
-    """Extract only what the AI needs from the spec."""
-    return {
-        "paths": {
-            path: {
-                method: {
-                    "summary": details.get("summary", ""),
-                    "parameters": [
-                        p.get("name", "") for p in details.get("parameters", [])
-                        if isinstance(p, dict)
-                    ],
-                }
-                for method, details in methods.items()
-                if isinstance(details, dict)
+GENERATION_PAYLOAD = {"options": {"num_predict": LLM_MAX_TOKENS}}
+if LLM_STOP_SEQUENCES:
+    GENERATION_PAYLOAD["options"]["stop"] = LLM_STOP_SEQUENCES
+if LLM_JSON_MODE:
+    GENERATION_PAYLOAD["format"] = "json"
+
+# Keep the model, and with it the KV cache of the shared prompt prefix,
+# loaded between requests (Ollama duration: "30m", "1h", seconds, -1 = forever)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+GENERATION_PAYLOAD["keep_alive"] = LLM_KEEP_ALIVE
+# Prime Ollama with the prompt prefix once and send its returned `context`
+# instead of the prefix text (off by default: the prefix then becomes its own
+# chat turn, which changes what the model sees)
+LLM_PREFIX_CONTEXT = os.getenv("LLM_PREFIX_CONTEXT", "0") == "1"
+
+# Parts of a split (map-reduce) analysis generated at once
+LLM_MAP_PARALLELISM = int(os.getenv("LLM_MAP_PARALLELISM", "4"))
+
+
+def _duration_seconds(value):
+    """Seconds in an Ollama keep_alive value; negative means 'forever'."""
+    match = re.fullmatch(r"\s*(-?[\d.]+)\s*([smh]?)\s*", str(value))
+    if not match:
+        return 0.0
+    seconds = float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+class PromptPrefixCache:
+    """
+    Reuse of the static PROMPT_PREFIX prefill across requests.
+
+    Ollama keeps the KV cache of recent prompts while the model stays loaded,
+    so a byte-identical prefix is only prefilled again once the model was
+    unloaded (keep_alive expired). With LLM_PREFIX_CONTEXT the prefix is
+    primed once and its `context` is sent in place of the prefix text.
+
+    Prefill time saved is estimated per request from the time to first token:
+    on a warm prefix that time covers only the per-request tokens, which gives
+    the prefill rate to price the skipped prefix tokens.
+    """
+
+    def __init__(self, keep_alive=LLM_KEEP_ALIVE, use_context=LLM_PREFIX_CONTEXT):
+        self.keep_alive_seconds = _duration_seconds(keep_alive)
+        self.use_context = use_context
+        self.prefix_tokens = estimate_tokens(PROMPT_PREFIX)
+        self._lock = threading.Lock()
+        self._warm_until = 0.0
+        self._context = None
+        self._requests = 0
+        self._warm_requests = 0
+        self._saved_seconds = 0.0
+
+    def prepare(self, prompt):
+        """(prompt to send, extra payload, prefix_warm) for one generation."""
+        shared = prompt.startswith(PROMPT_PREFIX)
+        if shared and self.use_context:
+            with self._lock:
+                context = self._context
+            context = context or self._prime()
+            if context:
+                return prompt[len(PROMPT_PREFIX):], {"context": context}, True
+        with self._lock:
+            return prompt, {}, shared and time.monotonic() < self._warm_until
+
+    def _prime(self):
+        try:
+            result = ollama_client.prime(MODEL_NAME, PROMPT_PREFIX, keep_alive=LLM_KEEP_ALIVE)
+        except requests.exceptions.RequestException:
+            return None
+        # Not held across the request; concurrent primers keep the first context
+        with self._lock:
+            self._context = self._context or result.get("context")
+            return self._context
+
+    def record(self, prompt, prefill_seconds, warm):
+        """Note one generation's time to first token; returns its prefill stats."""
+        total_tokens = estimate_tokens(prompt)
+        saved = 0.0
+        if warm and total_tokens > self.prefix_tokens:
+            saved = prefill_seconds * self.prefix_tokens / (total_tokens - self.prefix_tokens)
+        with self._lock:
+            self._requests += 1
+            self._warm_requests += warm
+            self._saved_seconds += saved
+            if prompt.startswith(PROMPT_PREFIX):
+                self._warm_until = time.monotonic() + self.keep_alive_seconds
+        return {
+            "prefill_ms": round(prefill_seconds * 1000, 1),
+            "prompt_tokens": total_tokens,
+            "prefix_tokens": self.prefix_tokens,
+            "prefix_reused": warm,
+            "prefill_saved_ms": round(saved * 1000, 1),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefix_tokens": self.prefix_tokens,
+                "context_reuse": self.use_context,
+                "requests": self._requests,
+                "prefix_reused": self._warm_requests,
+                "prefill_saved_ms_total": round(self._saved_seconds * 1000, 1),
             }
-            for path, methods in new_spec.get("paths", {}).items()
-        },
-        "schemas": list(new_spec.get("components", {}).get("schemas", {}).keys()),
-    }
+
+
+prefix_cache = PromptPrefixCache()
 
 
 def build_prompt(diff_result, new_spec):
@@ -39,71 +142,114 @@ def build_prompt(diff_result, new_spec):
     1. Gives the AI the exact diff data as ground truth
     2. Tells it what was already detected deterministically
     3. Asks it to ONLY supplement with insights it can justify from the data
+    Large diffs are truncated to the token budget; use prompts.build_prompts
+    to split them across several prompts instead.
+    """
+    return build_prompts(diff_result, new_spec, max_parts=1)[0]
+
+
+def stream_analysis_tokens(prompt, parser=None, publish=None):
+    """
+    Yield (token, done, completed_fields) for `prompt`, where completed_fields
+    are the top-level (key, value) pairs that finished in that token.
+    As soon as the first top-level JSON object closes, the upstream response
+    is closed (which cancels the generation in Ollama) and trailing text is
+    dropped. Pass a parser to inspect `parser.complete` / `parser.fields` after.
+    `publish` receives a {"type": "prefill"} event with the prefix-reuse stats.
     """
-    minimal_spec = _build_minimal_spec(new_spec)
-
-    # Pre-computed facts to ground the AI
-    facts = []
-    if diff_result.get("removed_endpoints"):
-        facts.append(f"REMOVED ENDPOINTS: {diff_result['removed_endpoints']}")
-    if diff_result.get("added_endpoints"):
-        facts.append(f"ADDED ENDPOINTS: {diff_result['added_endpoints']}")
-    if diff_result.get("method_changes"):
-        facts.append(f"METHOD CHANGES: {json.dumps(diff_result['method_changes'])}")
-    if diff_result.get("pii_fields_detected"):
-        facts.append(f"PII FIELDS ALREADY DETECTED BY SCANNER: {diff_result['pii_fields_detected']}")
-    if diff_result.get("naming_issues"):
-        facts.append(f"NAMING ISSUES ALREADY DETECTED: {diff_result['naming_issues']}")
-    if diff_result.get("missing_descriptions"):
-        facts.append(f"MISSING DESCRIPTIONS: {diff_result['missing_descriptions']}")
-
-    facts_str = "\n".join(facts) if facts else "No major changes detected by automated scanner."
-
-    return f"""You are an API governance analyst. You must base ALL claims on the data below.
-
-RULES:
-1. Return ONLY valid JSON — no explanation, no markdown, no commentary.
-2. Do NOT invent endpoints, fields, or issues not present in the data.
-3. Your risk_level MUST match the severity of actual changes listed below.
-4. pii_fields should ONLY contain fields you can identify from the schema/paths below.
-5. recommendations must be specific and actionable, referencing actual endpoints.
-6. Output must start with {{ and end with }}.
-
-=== AUTOMATED SCAN RESULTS (ground truth) ===
-{facts_str}
-
-=== NEW API SPEC (summary) ===
-{json.dumps(minimal_spec, indent=2)}
-
-=== FULL DIFF DATA ===
-{json.dumps(diff_result, indent=2)}
-
-Based ONLY on the above data, return this JSON:
-
-{{
-  "risk_level": "LOW or MEDIUM or HIGH",
-  "pii_fields": [],
-  "breaking_change_explanation": "Explain ONLY actual breaking changes from the diff",
-  "documentation_score": 5,
-  "recommendations": ["specific actionable items referencing real endpoints"],
-  "executive_summary": "2-3 sentence summary of actual findings"
-}}"""
+    parser = parser or IncrementalJsonParser()
+    sent_prompt, extra, warm = prefix_cache.prepare(prompt)
+    started = time.monotonic()
+    chunks = ollama_client.stream(MODEL_NAME, sent_prompt, **GENERATION_PAYLOAD, **extra)
+    first_at = None
+    count = 0
+    try:
+        for chunk in chunks:
+            count += 1
+            if first_at is None:
+                first_at = time.monotonic()
+                stats = prefix_cache.record(prompt, first_at - started, warm)
+                if publish:
+                    publish({"type": "prefill", **stats})
+            token = chunk.get("response", "")
+            completed = parser.feed(token)
+            if parser.complete:
+                yield token[:parser.end_offset], True, completed
+                return
+            done = chunk.get("done", False)
+            yield token, done, completed
+            if done:
+                return
+    finally:
+        chunks.close()
+        if first_at is not None:
+            # Ollama streams one token per chunk
+            observe_generation("ollama", first_at - started, count - 1, time.monotonic() - first_at)
 
 
 def analyze_with_ai(diff_result, new_spec):
     """Analyze with Ollama, with validation and retry on malformed output."""
-    prompt = build_prompt(diff_result, new_spec)
+    return analyze_prompts(build_prompts(diff_result, new_spec))
+
+
+def merged_result(partials, publish=None):
+    """Merge per-part analyses and re-validate; publishes the merged fields."""
+    merged = merge_analyses(partials)
+    if "error" in merged:
+        return merged
+    warnings = merged.pop("_validation_warnings", [])
+    merged, more = validate_ai_output(merged)
+    if warnings or more:
+        merged["_validation_warnings"] = warnings + more
+    if publish:
+        for key, value in merged.items():
+            if not key.startswith("_"):
+                publish({"type": "field", "key": key, "value": value})
+    return merged
 
+
+def analyze_prompts(prompts, publish=None, analyze=None):
+    """
+    Analyze the prompt(s) from prompts.build_prompts. A single prompt streams
+    through analyze_prompt; the parts of a split diff run in parallel (map),
+    publishing {"type": "part"} as each finishes, then are merged (reduce).
+    `analyze` replaces analyze_prompt (e.g. backends.llm_router.analyze_prompt).
+    """
+    analyze = analyze or analyze_prompt
+    if len(prompts) == 1:
+        return analyze(prompts[0], publish)
+
+    partials = [None] * len(prompts)
+    with ThreadPoolExecutor(max_workers=min(len(prompts), LLM_MAP_PARALLELISM)) as pool:
+        futures = {pool.submit(analyze, prompt): i for i, prompt in enumerate(prompts)}
+        for done, future in enumerate(as_completed(futures), 1):
+            partials[futures[future]] = future.result()
+            if publish:
+                publish({"type": "part", "done": done, "total": len(prompts)})
+    return merged_result(partials, publish)
+
+
+def analyze_prompt(prompt, publish=None):
+    """
+    Run a prebuilt prompt with validation and retry (lets callers drop the spec early).
+    If given, `publish` receives the generation as it happens: {"type": "prefill"},
+    {"type": "token"}, {"type": "field"} per completed top-level field, and
+    {"type": "retry"} before each new attempt.
+    """
     for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            llm_retries.inc(backend="ollama")
+            if publish:
+                publish({"type": "retry", "attempt": attempt})
         try:
-            response = requests.post(
-                OLLAMA_URL,
-                json={"model": MODEL_NAME, "prompt": prompt, "stream": False},
-                timeout=120,
-            )
-            response.raise_for_status()
-            raw_text = response.json().get("response", "")
-            parsed = extract_json(raw_text)
+            parts = []
+            for token, done, completed in stream_analysis_tokens(prompt, publish=publish):
+                parts.append(token)
+                if publish:
+                    publish({"type": "token", "token": token, "done": done})
+                    for key, value in completed:
+                        publish({"type": "field", "key": key, "value": value})
+            parsed = extract_json("".join(parts))
 
             if "error" in parsed:
                 if attempt < MAX_RETRIES:
@@ -1,37 +1,115 @@
-from flask import Flask, request, jsonify, Response, stream_with_context
+from flask import Flask, Request, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import yaml
+from werkzeug.exceptions import RequestEntityTooLarge
 import json
-from diff_engine import compare_specs
+import os
+import tempfile
+from loader import load_spec_index_from_file, SpecTooLarge, MAX_SPEC_BYTES
+from metrics import PhaseTimer, render as render_metrics
+
+from admission import admission_gate, AdmissionRejected
+from ai_analyzer_local import prefix_cache
+from backends import llm_router
+from batch import (
+    BATCH_MAX_SERVICES, BATCH_MAX_UPLOAD_BYTES, pairs_from_uploads, read_upload, run_batch, shared_pool,
+)
+from llm_client import ollama_client
+from cache import analysis_cache
+from insights import insight_cache
+from jobs import job_manager, JobQueueFull
+from pipeline import (
+    prepare_analysis, cache_key_for, prompt_key, analysis_flights, analyze_prepared, fall_back,
+    complete_analysis, deadline_seconds, flight_phases, generation_event, result_record, diff_event,
+    done_event, replay_events,
+)
+
+# Uploads larger than this are spooled to a temp file instead of RAM
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+# Whole multipart request limit (both specs plus form overhead)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * MAX_SPEC_BYTES + 1024 * 1024)))
+
+
+class SpooledRequest(Request):
+    """Request whose file uploads spill to disk past UPLOAD_SPOOL_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
 
-# from ai_analyzer import analyze_with_ai
-from ai_analyzer_local import analyze_with_ai, build_prompt, OLLAMA_URL, MODEL_NAME
-from risk_scorer import calculate_risk_score
-from utils import extract_json, validate_ai_output
-import requests as req
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 CORS(app)
 
 
+def _load_upload(name):
+    """Digest, parse and index one uploaded spec straight from its file handle."""
+    return load_spec_index_from_file(request.files[name].stream, MAX_SPEC_BYTES)
+
+
+def _sse(payload):
+    """Format one Server-Sent Event."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _sse_response(events, timer=None):
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    if timer:
+        # Only the phases before the stream starts; the rest arrive as a `timings` event
+        headers["Server-Timing"] = timer.header()
+    return Response(stream_with_context(events), mimetype="text/event-stream", headers=headers)
+
+
+def _too_busy(e):
+    """429 for an analysis the admission gate refused (LLM queue full)."""
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """Original non-streaming endpoint."""
+    timer = PhaseTimer("analyze")
     try:
-        old_spec = yaml.safe_load(request.files["old"].read())
-        new_spec = yaml.safe_load(request.files["new"].read())
+        # Parsed + indexed once per distinct upload; shared by diff and prompt
+        with timer.phase("parse"):
+            old_index = _load_upload("old")
+            new_index = _load_upload("new")
+
+        with timer.phase("cache"):
+            cache_key = cache_key_for(old_index, new_index)
+            cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            timer.finish()
+            return jsonify(cached), 200, {"X-Analysis-Cache": "hit", "Server-Timing": timer.header()}
 
-        diff_result = compare_specs(old_spec, new_spec)
-        ai_analysis = analyze_with_ai(diff_result, new_spec)
-        risk_result = calculate_risk_score(diff_result, ai_analysis)
+        prepared = prepare_analysis(old_index, new_index, timer)
+        del old_index, new_index
+        # Only unseen changes reach the LLM, joining an identical generation
+        # already in flight instead of starting another. Past the deadline
+        # the answer is a deterministic summary; the AI result is cached later.
+        deadline = deadline_seconds(request.args.get("deadline", type=float))
+        ai_analysis = analyze_prepared(prepared, deadline, cache_key, timer=timer)
+        result = result_record(prepared["diff"], ai_analysis)
+        timer.finish()
 
-        return jsonify({
-            "diff": diff_result,
-            "ai_analysis": ai_analysis,
-            "risk_score": risk_result["score"],
-            "risk_breakdown": risk_result["breakdown"],
-        })
+        headers = {"X-Analysis-Cache": "miss", "Server-Timing": timer.header()}
+        if "_fallback" in ai_analysis:
+            headers["X-Analysis-Fallback"] = ai_analysis["_fallback"]["reason"]
+        # Only successful AI analyses are cached; errors should be retried next time
+        elif "error" not in ai_analysis:
+            analysis_cache.put(cache_key, result)
 
+        return jsonify(result), 200, headers
+
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except AdmissionRejected as e:
+        return _too_busy(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -44,73 +122,179 @@ def analyze_stream():
     Phase 2: Streams AI analysis token by token.
     Phase 3: Final validated AI result + updated risk score.
     """
+    timer = PhaseTimer("analyze_stream")
     try:
-        old_spec = yaml.safe_load(request.files["old"].read())
-        new_spec = yaml.safe_load(request.files["new"].read())
+        with timer.phase("parse"):
+            old_index = _load_upload("old")
+            new_index = _load_upload("new")
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
     except Exception as e:
         return jsonify({"error": f"Failed to parse YAML: {e}"}), 400
 
+    try:
+        with timer.phase("cache"):
+            cache_key = cache_key_for(old_index, new_index)
+            cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            timer.finish()
+            return _sse_response((_sse(e) for e in replay_events(cached)), timer)
+
+        # Build everything the stream needs before it starts, so the generator
+        # does not keep both parsed specs alive for the whole LLM generation
+        prepared = prepare_analysis(old_index, new_index, timer)
+    except Exception as e:
+        message = str(e)
+
+        def failed():
+            yield _sse({'type': 'error', 'message': message})
+
+        return _sse_response(failed())
+    del old_index, new_index
+
+    diff_result = prepared["diff"]
+    preliminary = prepared["preliminary"]
+    # Identical analyses already in flight are shared; joining mid-stream
+    # replays the tokens generated so far before following live. No flight
+    # when every change already has cached insights.
+    prompts = prepared["prompts"]
+    try:
+        flight = analysis_flights.join(prompt_key(prompts), prompts) if prompts else None
+    except AdmissionRejected as e:
+        return _too_busy(e)
+    deadline = deadline_seconds(request.args.get("deadline", type=float))
+
     def generate():
         # --- Phase 1: Instant diff + preliminary risk score ---
-        try:
-            diff_result = compare_specs(old_spec, new_spec)
-            preliminary = calculate_risk_score(diff_result, {})
-
-            yield f"data: {json.dumps({'type': 'diff', 'diff': diff_result, 'risk_score': preliminary['score'], 'risk_breakdown': preliminary['breakdown']})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-            return
+        yield _sse(diff_event(diff_result, preliminary))
 
         # --- Phase 2: Stream AI analysis ---
-        try:
-            prompt = build_prompt(diff_result, new_spec)
-
-            response = req.post(
-                OLLAMA_URL,
-                json={"model": MODEL_NAME, "prompt": prompt, "stream": True},
-                stream=True,
-                timeout=120,
-            )
-            response.raise_for_status()
-
-            full_text = ""
-            for line in response.iter_lines():
-                if line:
-                    chunk = json.loads(line.decode("utf-8"))
-                    token = chunk.get("response", "")
-                    full_text += token
-                    done = chunk.get("done", False)
-
-                    yield f"data: {json.dumps({'type': 'ai_token', 'token': token, 'done': done})}\n\n"
-
-                    if done:
-                        break
-
-            # --- Phase 3: Parse, validate, and send final result ---
-            ai_raw = extract_json(full_text)
-            if "error" not in ai_raw:
-                ai_analysis, warnings = validate_ai_output(ai_raw)
-                if warnings:
-                    ai_analysis["_validation_warnings"] = warnings
-            else:
-                ai_analysis = ai_raw
-
-            final = calculate_risk_score(diff_result, ai_analysis)
-            yield f"data: {json.dumps({'type': 'ai_done', 'ai_analysis': ai_analysis, 'risk_score': final['score'], 'risk_breakdown': final['breakdown']})}\n\n"
-
-        except req.exceptions.Timeout:
-            yield f"data: {json.dumps({'type': 'ai_done', 'ai_analysis': {'error': 'LLM timeout'}, 'risk_score': preliminary['score'], 'risk_breakdown': preliminary['breakdown']})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'ai_done', 'ai_analysis': {'error': str(e)}, 'risk_score': preliminary['score'], 'risk_breakdown': preliminary['breakdown']})}\n\n"
-
-    return Response(
-        stream_with_context(generate()),
-        mimetype="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        },
-    )
+        # Tokens, each top-level field once it is complete and valid, and an
+        # ai_retry marker if the generation has to start over
+        if flight is not None:
+            with timer.phase("ai"):
+                for event in flight.follow(deadline):
+                    yield _sse(generation_event(diff_result, event))
+            flight_phases(timer, flight)
+
+        # --- Phase 3: Send final validated result (with reused insights),
+        # or the deterministic summary if the AI missed the deadline ---
+        if flight is not None and not flight.done:
+            ai_analysis = fall_back(prepared, flight, cache_key)
+        else:
+            ai_analysis = complete_analysis(prepared, flight.result if flight else None)
+        record = result_record(diff_result, ai_analysis)
+        if "error" not in ai_analysis and "_fallback" not in ai_analysis:
+            analysis_cache.put(cache_key, record)
+        timer.finish()
+        yield _sse(timer.event())
+        yield _sse(done_event(record))
+
+    return _sse_response(generate(), timer)
+
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """
+    Fleet scan: upload many services' specs as repeated `old` and `new`
+    files, matched by file name (a directory upload works). Streams a
+    `service` event per service as the process pool finishes it, then a
+    fleet `summary`. With ?ai=1 changed services also get the LLM analysis
+    (`service_ai` events), BATCH_AI_CONCURRENCY at a time.
+    """
+    request.max_content_length = BATCH_MAX_UPLOAD_BYTES
+    request.max_form_parts = 2 * BATCH_MAX_SERVICES + 16
+    try:
+        old_files = {f.filename: read_upload(f.stream, f.filename) for f in request.files.getlist("old") if f.filename}
+        new_files = {f.filename: read_upload(f.stream, f.filename) for f in request.files.getlist("new") if f.filename}
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+
+    pairs = pairs_from_uploads(old_files, new_files)
+    if not pairs:
+        return jsonify({"error": "Upload the specs as repeated 'old' and 'new' files"}), 400
+    if len(pairs) > BATCH_MAX_SERVICES:
+        return jsonify({"error": f"{len(pairs)} services exceed the limit of {BATCH_MAX_SERVICES}"}), 413
+
+    events = run_batch(pairs, ai=request.args.get("ai") == "1", pool=shared_pool())
+    return _sse_response(_sse(e) for e in events)
+
+
+@app.route("/analyze/jobs", methods=["POST"])
+def submit_job():
+    """
+    Asynchronous analysis: returns the diff and a job id right away and runs
+    the AI phase on the background worker pool. Poll GET /report/<id> or
+    subscribe to GET /report/<id>/events for the result.
+    """
+    try:
+        old_index = _load_upload("old")
+        new_index = _load_upload("new")
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": f"Failed to parse YAML: {e}"}), 400
+
+    try:
+        cache_key = cache_key_for(old_index, new_index)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            record = job_manager.complete(cached)
+            return jsonify({**record, "report_url": f"/report/{record['id']}"}), 200
+
+        prepared = prepare_analysis(old_index, new_index)
+        del old_index, new_index
+
+        job = job_manager.submit(prepared, cache_key)
+        return jsonify({**job.record, "report_url": f"/report/{job.id}"}), 202
+
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/report/<job_id>", methods=["GET"])
+def get_report(job_id):
+    """Status and (once finished) the full analysis for a job."""
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({"error": f"Unknown report '{job_id}'"}), 404
+    return jsonify(record)
+
+
+@app.route("/report/<job_id>/events", methods=["GET"])
+def report_events(job_id):
+    """SSE progress stream for a job: diff, status changes, then ai_done."""
+    events = job_manager.subscribe(job_id)
+    if events is None:
+        return jsonify({"error": f"Unknown report '{job_id}'"}), 404
+    return _sse_response(_sse(e) if e is not None else ": keep-alive\n\n" for e in events)
+
+
+@app.route("/llm/pool", methods=["GET"])
+def llm_pool():
+    """Connection pool stats for the LLM backend client, plus admission, coalescing, prefix reuse and backend health."""
+    return jsonify({
+        **ollama_client.pool_stats(),
+        "admission": admission_gate.stats(),
+        "flights": analysis_flights.stats(),
+        "prefix_cache": prefix_cache.stats(),
+        "backends": llm_router.stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics: phase latencies, LLM throughput, retries, JSON failures, cache hits."""
+    body = render_metrics({"analysis": analysis_cache, "insight": insight_cache})
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
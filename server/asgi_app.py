@@ -0,0 +1,488 @@
+"""
+Asyncio (ASGI) server with the same analysis routes and SSE event schema as
+app.py. Each open /analyze/stream is a coroutine awaiting the LLM through a
+pooled async HTTP client instead of a thread blocked on a socket, so one
+process can hold hundreds of concurrent analysis streams. Spec parsing and
+diffing still run on worker threads so they never stall the event loop.
+Background jobs (/analyze/jobs, /report/<id>) share jobs.py's thread-backed
+worker pool with the Flask app.
+
+Run with:
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from quart import Quart, Request, request, jsonify, make_response
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from admission import admission_gate, AdmissionRejected
+from ai_analyzer_local import (
+    MODEL_NAME, MAX_RETRIES, GENERATION_PAYLOAD, LLM_MAP_PARALLELISM, merged_result, prefix_cache,
+)
+from async_llm_client import async_ollama_client
+from backends import llm_router
+from batch import (
+    BATCH_MAX_SERVICES, BATCH_MAX_UPLOAD_BYTES, pairs_from_uploads, read_upload, run_batch, shared_pool,
+)
+from cache import analysis_cache
+from insights import insight_cache
+from jobs import job_manager, JobQueueFull
+from llm_client import GenerationTimeout
+from loader import load_spec_index_from_file, SpecTooLarge, MAX_SPEC_BYTES
+from metrics import PhaseTimer, llm_retries, observe_generation, render as render_metrics
+from pipeline import (
+    prepare_analysis, complete_analysis, cache_key_for, prompt_key, generation_event,
+    deadline_seconds, fall_back, finalize_ai_output, flight_phases, result_record, diff_event, done_event,
+    replay_events,
+)
+from singleflight import AsyncSingleFlight
+from utils import IncrementalJsonParser
+
+# Streams held open at once; further requests get 503 instead of queueing
+ASYNC_MAX_STREAMS = int(os.getenv("ASYNC_MAX_STREAMS", "500"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * MAX_SPEC_BYTES + 1024 * 1024)))
+
+LLM_TIMEOUTS = (GenerationTimeout, httpx.TimeoutException)
+
+
+class _Request(Request):
+    """Lets /analyze/batch uploads exceed MAX_UPLOAD_BYTES (Quart fixes the body limit at construction)."""
+
+    def __init__(self, method, scheme, path, *args, max_content_length=None, **kwargs):
+        if path == "/analyze/batch":
+            max_content_length = BATCH_MAX_UPLOAD_BYTES
+        super().__init__(method, scheme, path, *args, max_content_length=max_content_length, **kwargs)
+
+
+app = Quart(__name__)
+app.request_class = _Request
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+_open_streams = 0
+
+
+@app.after_request
+async def _cors(response):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@app.after_serving
+async def _close_client():
+    await async_ollama_client.aclose()
+
+
+def _sse(payload):
+    """Format one Server-Sent Event."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def _sse_response(events, timer=None):
+    headers = {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    if timer:
+        # Only the phases before the stream starts; the rest arrive as a `timings` event
+        headers["Server-Timing"] = timer.header()
+    response = await make_response(events, 200, headers)
+    # Streams last as long as the generation; don't let Quart cut them off
+    response.timeout = None
+    return response
+
+
+async def _load_uploads():
+    files = await request.files
+    old_index = await asyncio.to_thread(load_spec_index_from_file, files["old"].stream, MAX_SPEC_BYTES)
+    new_index = await asyncio.to_thread(load_spec_index_from_file, files["new"].stream, MAX_SPEC_BYTES)
+    return old_index, new_index
+
+
+async def astream_analysis_tokens(prompt, parser, publish=None):
+    """Async twin of ai_analyzer_local.stream_analysis_tokens (same early-stop rule and prefill event)."""
+    # Only blocks the first time, when priming the prefix context is enabled
+    sent_prompt, extra, warm = await asyncio.to_thread(prefix_cache.prepare, prompt)
+    started = time.monotonic()
+    chunks = async_ollama_client.stream(MODEL_NAME, sent_prompt, **GENERATION_PAYLOAD, **extra)
+    first_at = None
+    count = 0
+    try:
+        async for chunk in chunks:
+            count += 1
+            if first_at is None:
+                first_at = time.monotonic()
+                stats = prefix_cache.record(prompt, first_at - started, warm)
+                if publish:
+                    publish({"type": "prefill", **stats})
+            token = chunk.get("response", "")
+            completed = parser.feed(token)
+            if parser.complete:
+                yield token[:parser.end_offset], True, completed
+                return
+            done = chunk.get("done", False)
+            yield token, done, completed
+            if done:
+                return
+    finally:
+        await chunks.aclose()
+        if first_at is not None:
+            observe_generation("ollama", first_at - started, count - 1, time.monotonic() - first_at)
+
+
+async def aanalyze_prompt(prompt, publish=None):
+    """
+    Async twin of backends.llm_router.analyze_prompt. Plain Ollama streams
+    on the event loop; other backends and hedging run the router on a thread.
+    """
+    if not llm_router.native_ollama:
+        loop = asyncio.get_running_loop()
+        threadsafe = (lambda event: loop.call_soon_threadsafe(publish, event)) if publish else None
+        return await asyncio.to_thread(llm_router.analyze_prompt, prompt, threadsafe)
+
+    backend = llm_router.primary
+    if not backend.breaker.allow():
+        return llm_router.unavailable(backend)
+    started = time.monotonic()
+    ai_analysis = await _aanalyze_ollama(prompt, publish)
+    backend.record(ai_analysis, time.monotonic() - started)
+    return ai_analysis
+
+
+async def _aanalyze_ollama(prompt, publish=None):
+    """Async twin of ai_analyzer_local.analyze_prompt (validation, retry, same published events)."""
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            llm_retries.inc(backend="ollama")
+            if publish:
+                publish({"type": "retry", "attempt": attempt})
+        try:
+            parser = IncrementalJsonParser()
+            parts = []
+            async for token, done, completed in astream_analysis_tokens(prompt, parser, publish):
+                parts.append(token)
+                if publish:
+                    publish({"type": "token", "token": token, "done": done})
+                    for key, value in completed:
+                        publish({"type": "field", "key": key, "value": value})
+            ai_analysis = finalize_ai_output(parser, parts)
+            if "error" in ai_analysis and attempt < MAX_RETRIES:
+                continue  # Retry on parse failure
+            return ai_analysis
+
+        except LLM_TIMEOUTS:
+            return {"error": "LLM timeout — model may be too slow for this spec size"}
+
+        except Exception as e:
+            if attempt < MAX_RETRIES:
+                continue
+            return {"error": str(e)}
+
+    return {"error": "Failed after all retries"}
+
+
+async def aanalyze_prompts(prompts, publish=None):
+    """Async twin of ai_analyzer_local.analyze_prompts (parts of a split diff run concurrently)."""
+    if len(prompts) == 1:
+        return await aanalyze_prompt(prompts[0], publish)
+
+    slots = asyncio.Semaphore(LLM_MAP_PARALLELISM)
+    finished = 0
+
+    async def run_part(prompt):
+        nonlocal finished
+        async with slots:
+            result = await aanalyze_prompt(prompt)
+        finished += 1
+        if publish:
+            publish({"type": "part", "done": finished, "total": len(prompts)})
+        return result
+
+    partials = await asyncio.gather(*(run_part(prompt) for prompt in prompts))
+    return merged_result(list(partials), publish)
+
+
+# Identical prompts already being generated share one upstream LLM call;
+# new generations pass the admission gate first
+analysis_flights = AsyncSingleFlight(aanalyze_prompts, admission_gate.admit)
+
+
+def _too_busy(e):
+    """429 for an analysis the admission gate refused (LLM queue full)."""
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+
+@app.route("/analyze", methods=["POST"])
+async def analyze():
+    timer = PhaseTimer("analyze")
+    try:
+        with timer.phase("parse"):
+            old_index, new_index = await _load_uploads()
+
+        with timer.phase("cache"):
+            cache_key = cache_key_for(old_index, new_index)
+            cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            timer.finish()
+            return jsonify(cached), 200, {"X-Analysis-Cache": "hit", "Server-Timing": timer.header()}
+
+        prepared = await asyncio.to_thread(prepare_analysis, old_index, new_index, timer)
+        del old_index, new_index
+        prompts = prepared["prompts"]
+        deadline = deadline_seconds(request.args.get("deadline", type=float))
+        flight = analysis_flights.join(prompt_key(prompts), prompts) if prompts else None
+        if flight is not None:
+            with timer.phase("ai"):
+                await flight.wait(deadline)
+            flight_phases(timer, flight)
+        if flight is not None and not flight.done:
+            ai_analysis = fall_back(prepared, flight, cache_key)
+        else:
+            ai_analysis = complete_analysis(prepared, flight.result if flight else None)
+        result = result_record(prepared["diff"], ai_analysis)
+        timer.finish()
+
+        headers = {"X-Analysis-Cache": "miss", "Server-Timing": timer.header()}
+        if "_fallback" in ai_analysis:
+            headers["X-Analysis-Fallback"] = ai_analysis["_fallback"]["reason"]
+        elif "error" not in ai_analysis:
+            analysis_cache.put(cache_key, result)
+
+        return jsonify(result), 200, headers
+
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except AdmissionRejected as e:
+        return _too_busy(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _release_stream():
+    global _open_streams
+    _open_streams -= 1
+
+
+async def _holding_stream(events):
+    """Yield `events`, then give back the stream slot analyze_stream reserved."""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        _release_stream()
+
+
+@app.route("/analyze/stream", methods=["POST"])
+async def analyze_stream():
+    """Same three SSE phases as app.analyze_stream, served from the event loop."""
+    global _open_streams
+    if _open_streams >= ASYNC_MAX_STREAMS:
+        return jsonify({"error": "Too many concurrent analysis streams"}), 503
+    # Reserve the slot before awaiting the upload so a burst can't all pass the
+    # check; every path below releases it or hands it to _holding_stream
+    _open_streams += 1
+    try:
+        response = await make_response(await _analysis_stream())
+    except BaseException:
+        _release_stream()
+        raise
+    if response.mimetype != "text/event-stream":
+        _release_stream()
+    return response
+
+
+async def _analysis_stream():
+    timer = PhaseTimer("analyze_stream")
+    try:
+        with timer.phase("parse"):
+            old_index, new_index = await _load_uploads()
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": f"Failed to parse YAML: {e}"}), 400
+
+    try:
+        with timer.phase("cache"):
+            cache_key = cache_key_for(old_index, new_index)
+            cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            timer.finish()
+
+            async def replay():
+                for event in replay_events(cached):
+                    yield _sse(event)
+
+            return await _sse_response(_holding_stream(replay()), timer)
+
+        prepared = await asyncio.to_thread(prepare_analysis, old_index, new_index, timer)
+    except Exception as e:
+        message = str(e)
+
+        async def failed():
+            yield _sse({'type': 'error', 'message': message})
+
+        return await _sse_response(_holding_stream(failed()))
+    del old_index, new_index
+
+    diff_result = prepared["diff"]
+    preliminary = prepared["preliminary"]
+    prompts = prepared["prompts"]
+    # No flight when every change already has cached insights
+    try:
+        flight = analysis_flights.join(prompt_key(prompts), prompts) if prompts else None
+    except AdmissionRejected as e:
+        return _too_busy(e)
+    deadline = deadline_seconds(request.args.get("deadline", type=float))
+
+    async def generate():
+        # --- Phase 1: Instant diff + preliminary risk score ---
+        yield _sse(diff_event(diff_result, preliminary))
+
+        # --- Phase 2: Stream AI analysis (replayed from the start if joined mid-flight) ---
+        if flight is not None:
+            with timer.phase("ai"):
+                async for event in flight.follow(deadline):
+                    yield _sse(generation_event(diff_result, event))
+            flight_phases(timer, flight)
+
+        # --- Phase 3: Send final validated result (with reused insights),
+        # or the deterministic summary if the AI missed the deadline ---
+        if flight is not None and not flight.done:
+            ai_analysis = fall_back(prepared, flight, cache_key)
+        else:
+            ai_analysis = complete_analysis(prepared, flight.result if flight else None)
+        record = result_record(diff_result, ai_analysis)
+        if "error" not in ai_analysis and "_fallback" not in ai_analysis:
+            analysis_cache.put(cache_key, record)
+        timer.finish()
+        yield _sse(timer.event())
+        yield _sse(done_event(record))
+
+    return await _sse_response(_holding_stream(generate()), timer)
+
+
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """Same events as app.analyze_batch; the batch runs on the process pool, drained from a thread."""
+    request.max_form_parts = 2 * BATCH_MAX_SERVICES + 16
+    try:
+        files = await request.files
+        old_files = {f.filename: read_upload(f.stream, f.filename) for f in files.getlist("old") if f.filename}
+        new_files = {f.filename: read_upload(f.stream, f.filename) for f in files.getlist("new") if f.filename}
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+
+    pairs = pairs_from_uploads(old_files, new_files)
+    if not pairs:
+        return jsonify({"error": "Upload the specs as repeated 'old' and 'new' files"}), 400
+    if len(pairs) > BATCH_MAX_SERVICES:
+        return jsonify({"error": f"{len(pairs)} services exceed the limit of {BATCH_MAX_SERVICES}"}), 413
+
+    events = run_batch(pairs, ai=request.args.get("ai") == "1", pool=shared_pool())
+
+    async def generate():
+        step = None
+        try:
+            while True:
+                step = asyncio.ensure_future(asyncio.to_thread(next, events, None))
+                # Shielded: on disconnect the thread keeps running next() regardless
+                event = await asyncio.shield(step)
+                if event is None:
+                    break
+                yield _sse(event)
+        finally:
+            # Closing while next() still runs raises "generator already executing"
+            if step is not None and not step.done():
+                await asyncio.wait([step])
+            await asyncio.to_thread(events.close)
+
+    return await _sse_response(generate())
+
+
+@app.route("/analyze/jobs", methods=["POST"])
+async def submit_job():
+    """Same as app.submit_job: the diff now, the AI phase queued on the job workers."""
+    try:
+        old_index, new_index = await _load_uploads()
+    except SpecTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": f"Failed to parse YAML: {e}"}), 400
+
+    try:
+        cache_key = cache_key_for(old_index, new_index)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            record = job_manager.complete(cached)
+            return jsonify({**record, "report_url": f"/report/{record['id']}"}), 200
+
+        prepared = await asyncio.to_thread(prepare_analysis, old_index, new_index)
+        del old_index, new_index
+
+        job = job_manager.submit(prepared, cache_key)
+        return jsonify({**job.record, "report_url": f"/report/{job.id}"}), 202
+
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/report/<job_id>", methods=["GET"])
+async def get_report(job_id):
+    """Status and (once finished) the full analysis for a job."""
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({"error": f"Unknown report '{job_id}'"}), 404
+    return jsonify(record)
+
+
+@app.route("/report/<job_id>/events", methods=["GET"])
+async def report_events(job_id):
+    """SSE progress stream for a job; the blocking subscription is read from a thread."""
+    events = job_manager.subscribe(job_id)
+    if events is None:
+        return jsonify({"error": f"Unknown report '{job_id}'"}), 404
+    end = object()
+
+    async def generate():
+        while (event := await asyncio.to_thread(next, events, end)) is not end:
+            yield _sse(event) if event is not None else ": keep-alive\n\n"
+
+    return await _sse_response(generate())
+
+
+@app.route("/llm/pool", methods=["GET"])
+async def llm_pool():
+    """Connection pool stats for the async LLM client, plus streams, admission, coalescing, prefix reuse and backends."""
+    return jsonify({
+        **async_ollama_client.pool_stats(),
+        "open_streams": _open_streams,
+        "admission": admission_gate.stats(),
+        "flights": analysis_flights.stats(),
+        "prefix_cache": prefix_cache.stats(),
+        "backends": llm_router.stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Prometheus metrics: phase latencies, LLM throughput, retries, JSON failures, cache hits."""
+    body = render_metrics({"analysis": analysis_cache, "insight": insight_cache})
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,97 @@
+"""
+Asyncio client for the Ollama backend, used by the ASGI server.
+A single pooled httpx.AsyncClient is shared by every open stream, so
+concurrent generations cost a coroutine and a pooled connection each
+rather than an OS thread.
+
+Timeouts follow llm_client: connect / between-chunk read / whole generation.
+"""
+import json
+import os
+import time
+
+import httpx
+
+from llm_client import (
+    OLLAMA_URL, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_GENERATION_TIMEOUT, GenerationTimeout,
+)
+
+# Concurrent upstream connections; sized for hundreds of parallel streams
+ASYNC_LLM_POOL_SIZE = int(os.getenv("ASYNC_LLM_POOL_SIZE", "256"))
+
+
+class AsyncOllamaClient:
+    """Pooled async client for Ollama's /api/generate endpoint."""
+
+    def __init__(self, url=OLLAMA_URL, pool_size=ASYNC_LLM_POOL_SIZE,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+                 generation_timeout=LLM_GENERATION_TIMEOUT):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.generation_timeout = generation_timeout
+        self._client = None
+        self._active = 0
+        self._requests_total = 0
+        self._errors_total = 0
+
+    def _http(self):
+        # Created lazily so it binds to the server's running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=None),
+            )
+        return self._client
+
+    async def stream(self, model, prompt, **payload):
+        """
+        Streaming generation; yields Ollama's JSON chunks as dicts.
+        Closing the generator early closes the upstream response.
+        """
+        self._active += 1
+        self._requests_total += 1
+        failed = True
+        deadline = time.monotonic() + self.generation_timeout
+        try:
+            async with self._http().stream(
+                "POST", self.url,
+                json={"model": model, "prompt": prompt, "stream": True, **payload},
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if time.monotonic() > deadline:
+                        raise GenerationTimeout(f"Generation exceeded {self.generation_timeout}s")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    yield chunk
+                    if chunk.get("done", False):
+                        break
+            failed = False
+        except GeneratorExit:
+            # Caller stopped early (e.g. the JSON object was complete)
+            failed = False
+            raise
+        finally:
+            self._active -= 1
+            if failed:
+                self._errors_total += 1
+
+    def pool_stats(self):
+        return {
+            "url": self.url,
+            "pool_size": self.pool_size,
+            "active_requests": self._active,
+            "requests_total": self._requests_total,
+            "errors_total": self._errors_total,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async_ollama_client = AsyncOllamaClient()
@@ -0,0 +1,404 @@
+"""
+Pluggable LLM backends behind one router.
+
+LLM_BACKEND selects the backend that answers analyses:
+- ollama: local Ollama (ai_analyzer_local), streaming tokens and fields
+- gemini: Google Gemini (ai_analyzer), imported only when selected
+- fake:   canned answer after FAKE_LLM_DELAY, for load tests without a model
+
+Each backend has its own timeouts (LLM_*_TIMEOUT for Ollama, GEMINI_TIMEOUT)
+and a circuit breaker: after LLM_BREAKER_FAILURES consecutive errors it
+stops receiving traffic for LLM_BREAKER_RESET seconds, then a single probe
+request decides whether it closes again.
+
+With LLM_HEDGE_BACKEND set, a generation still running past the primary's
+LLM_HEDGE_PERCENTILE latency (over its recent successes) also starts on the
+hedge backend, and whichever returns a validated analysis first wins. The
+hedge also takes over when the primary fails or its breaker is open.
+"""
+import json
+import os
+import queue
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import deque
+
+import ai_analyzer_local
+from metrics import observe_generation
+from utils import extract_json, validate_ai_output, IncrementalJsonParser
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+LLM_HEDGE_BACKEND = os.getenv("LLM_HEDGE_BACKEND", "")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Successful generations needed before the percentile is trusted for hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+FAKE_LLM_DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.5"))
+FAKE_LLM_RESPONSE = os.getenv("FAKE_LLM_RESPONSE", json.dumps({
+    "risk_level": "MEDIUM",
+    "pii_fields": [],
+    "breaking_change_explanation": "Canned analysis from the fake backend.",
+    "documentation_score": 7,
+    "recommendations": ["Review the changes listed in the diff."],
+    "executive_summary": "Fake backend response; no model was queried.",
+}))
+
+
+class Abandoned(BaseException):
+    """
+    Raised from `publish` in a generation that lost a hedged race. It is a
+    BaseException (like GeneratorExit) so retry loops catching Exception
+    don't swallow it; the generation unwinds and closes its upstream stream.
+    """
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open probe after `reset` seconds."""
+
+    def __init__(self, threshold=LLM_BREAKER_FAILURES, reset=LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() >= self._opened_at + self.reset:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Whether a request may go to the backend now (claims the probe when half-open)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() < self._opened_at + self.reset:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a claimed probe without a verdict (the request was abandoned)."""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyWindow:
+    """Latencies (seconds) of a backend's recent successful generations."""
+
+    def __init__(self, size=LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=1):
+        """The `pct` percentile, or None with fewer than `min_samples` samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class Backend(ABC):
+    """
+    One LLM backend. `analyze(prompt, publish)` returns a validated analysis
+    or {"error": ...}; `publish`, if given, receives the generation events
+    documented in ai_analyzer_local.analyze_prompt.
+    """
+    name = ""
+    model = ""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def identity(self):
+        return f"{self.name}:{self.model}"
+
+    @abstractmethod
+    def analyze(self, prompt, publish=None):
+        """Validated analysis of `prompt`, or {"error": ...}."""
+
+    def record(self, result, seconds):
+        ok = "error" not in result
+        self.requests += 1
+        self.errors += not ok
+        self.breaker.record(ok)
+        if ok:
+            self.latency.add(seconds)
+
+    def stats(self):
+        p50 = self.latency.percentile(50)
+        return {
+            "model": self.model,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+        }
+
+
+class OllamaBackend(Backend):
+    name = "ollama"
+    model = ai_analyzer_local.MODEL_NAME
+
+    def analyze(self, prompt, publish=None):
+        return ai_analyzer_local.analyze_prompt(prompt, publish)
+
+
+class GeminiBackend(Backend):
+    name = "gemini"
+
+    def __init__(self):
+        super().__init__()
+        # Imported here so deployments without Gemini credentials never build its client
+        import ai_analyzer
+        self._analyzer = ai_analyzer
+        self.model = ai_analyzer.GEMINI_MODEL
+
+    def analyze(self, prompt, publish=None):
+        started = time.monotonic()
+        result = self._analyzer.analyze_prompt(prompt)
+        # Not streamed: the whole answer arrives with the first token
+        observe_generation(self.name, time.monotonic() - started, 0, 0)
+        if publish and "error" not in result:
+            for key, value in result.items():
+                if not key.startswith("_"):
+                    publish({"type": "field", "key": key, "value": value})
+        return result
+
+
+class FakeBackend(Backend):
+    """Streams FAKE_LLM_RESPONSE over FAKE_LLM_DELAY seconds, like a model would."""
+    name = "fake"
+    model = "canned"
+    chunk_size = 16
+
+    def analyze(self, prompt, publish=None):
+        text = FAKE_LLM_RESPONSE
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        parser = IncrementalJsonParser()
+        started = time.monotonic()
+        first_at = None
+        for i, token in enumerate(chunks):
+            time.sleep(FAKE_LLM_DELAY / len(chunks))
+            first_at = first_at or time.monotonic()
+            completed = parser.feed(token)
+            if publish:
+                publish({"type": "token", "token": token, "done": i == len(chunks) - 1})
+                for key, value in completed:
+                    publish({"type": "field", "key": key, "value": value})
+        if first_at is not None:
+            observe_generation(self.name, first_at - started, len(chunks) - 1, time.monotonic() - first_at)
+        parsed = extract_json(text)
+        if "error" in parsed:
+            return parsed
+        validated, warnings = validate_ai_output(parsed)
+        if warnings:
+            validated["_validation_warnings"] = warnings
+        return validated
+
+
+BACKENDS = {
+    "ollama": OllamaBackend,
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend {name!r} (expected one of {', '.join(BACKENDS)})") from None
+
+
+class _Race:
+    """Shared state of one hedged generation: who leads the stream, who won."""
+
+    def __init__(self, publish):
+        self.publish = publish
+        self.lead = None
+        self.winner = None
+
+    def publisher(self, backend, lead):
+        """`publish` for one racer: the lead's events reach the client until the race is decided."""
+        if lead:
+            self.lead = backend
+
+        def publish(event):
+            winner = self.winner
+            if winner is not None and winner is not backend:
+                raise Abandoned()
+            if lead and self.publish:
+                self.publish(event)
+        return publish
+
+
+class BackendRouter:
+    """Sends each prompt to the primary backend, hedging to a second one if configured."""
+
+    def __init__(self, primary, hedge=None, percentile=LLM_HEDGE_PERCENTILE, min_samples=LLM_HEDGE_MIN_SAMPLES):
+        self.primary = primary
+        self.hedge = hedge
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    @property
+    def identity(self):
+        """Cache identity: results differ by backend and model."""
+        backends = [self.primary] + ([self.hedge] if self.hedge else [])
+        return "+".join(backend.identity for backend in backends)
+
+    @property
+    def native_ollama(self):
+        """True when the asyncio server may stream from Ollama itself (plain Ollama, no hedging)."""
+        return isinstance(self.primary, OllamaBackend) and self.hedge is None
+
+    def hedge_after(self):
+        """Seconds after which a primary generation gets hedged, None until enough samples."""
+        return self.primary.latency.percentile(self.percentile, self.min_samples)
+
+    @staticmethod
+    def unavailable(backend):
+        return {"error": f"LLM backend '{backend.name}' unavailable (circuit open)"}
+
+    def analyze_prompt(self, prompt, publish=None):
+        """Same contract as ai_analyzer_local.analyze_prompt, across the configured backends."""
+        if self.hedge is None:
+            if not self.primary.breaker.allow():
+                return self.unavailable(self.primary)
+            return self._attempt(self.primary, prompt, publish)
+        return self._hedged(prompt, publish)
+
+    def _attempt(self, backend, prompt, publish):
+        started = time.monotonic()
+        try:
+            result = backend.analyze(prompt, publish)
+        except Abandoned:
+            backend.breaker.release()
+            return None
+        except Exception as e:
+            result = {"error": str(e)}
+        backend.record(result, time.monotonic() - started)
+        return result
+
+    def _start(self, backend, prompt, race, results, lead):
+        def run():
+            results.put((backend, self._attempt(backend, prompt, race.publisher(backend, lead))))
+        threading.Thread(target=run, name=f"llm-{backend.name}", daemon=True).start()
+
+    def _hedged(self, prompt, publish):
+        race = _Race(publish)
+        results = queue.Queue()
+        started = time.monotonic()
+        running = 0
+        hedged = False
+
+        if self.primary.breaker.allow():
+            self._start(self.primary, prompt, race, results, lead=True)
+            running += 1
+            threshold = self.hedge_after()
+        else:
+            threshold = 0.0
+
+        last_error = self.unavailable(self.primary)
+        while True:
+            if not hedged and (threshold == 0.0 or not running):
+                running += self._fire_hedge(prompt, race, results, lead=not running)
+                hedged = True
+            if not running:
+                return last_error
+
+            timeout = None
+            if not hedged and threshold is not None:
+                timeout = max(0.0, threshold - (time.monotonic() - started))
+            try:
+                backend, result = results.get(timeout=timeout)
+            except queue.Empty:
+                threshold = 0.0
+                continue
+            running -= 1
+
+            if result is not None and "error" not in result:
+                race.winner = backend
+                if backend is not self.primary:
+                    self.hedges_won += 1
+                if backend is not race.lead:
+                    self._publish_fields(publish, result)
+                return result
+            if result is not None:
+                last_error = result
+
+    def _fire_hedge(self, prompt, race, results, lead):
+        """Start the hedge backend; returns 1 if it was started, 0 if its breaker is open."""
+        if not self.hedge.breaker.allow():
+            return 0
+        self.hedges_fired += 1
+        if race.publish:
+            race.publish({"type": "hedge", "backend": self.hedge.name})
+        self._start(self.hedge, prompt, race, results, lead)
+        return 1
+
+    @staticmethod
+    def _publish_fields(publish, result):
+        """The hedge's fields replace whatever the primary had streamed so far."""
+        if publish:
+            for key, value in result.items():
+                if not key.startswith("_"):
+                    publish({"type": "field", "key": key, "value": value})
+
+    def stats(self):
+        threshold = self.hedge_after() if self.hedge else None
+        backends = {"primary": {"name": self.primary.name, **self.primary.stats()}}
+        if self.hedge:
+            backends["hedge"] = {"name": self.hedge.name, **self.hedge.stats()}
+        return {
+            **backends,
+            "hedge_after_ms": round(threshold * 1000, 1) if threshold is not None else None,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+        }
+
+
+llm_router = BackendRouter(
+    get_backend(LLM_BACKEND),
+    get_backend(LLM_HEDGE_BACKEND) if LLM_HEDGE_BACKEND else None,
+)
+
+
+def analyze_prompts(prompts, publish=None):
+    """ai_analyzer_local.analyze_prompts (including map-reduce) through the configured backends."""
+    return ai_analyzer_local.analyze_prompts(prompts, publish, llm_router.analyze_prompt)
@@ -0,0 +1,266 @@
+"""
+Fleet scan: diff and score many services' specs in one run.
+
+Service pairs come from two directory trees (matched by relative path), a
+manifest file, or a multipart upload (matched by file name). The
+deterministic diff runs on a process pool, BATCH_CHUNK_SIZE services per
+task so small specs don't pay a round trip each. With `ai`, changed
+services are also queued for the LLM analysis, at most
+BATCH_AI_CONCURRENCY at a time.
+
+run_batch yields events as work completes, in whatever order it finishes:
+- {"type": "service"}: status, risk score, change counts, breaking lines
+  and PII fields of one service
+- {"type": "service_ai"}: its AI analysis and AI-adjusted risk score
+- {"type": "summary"} last: totals, top risks and PII exposure across the fleet
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from diff_engine import compare_specs
+from loader import load_spec_index, parse_spec, MAX_SPEC_BYTES, SpecTooLarge
+from prompts import FACT_SECTIONS, collect_facts
+from risk_scorer import calculate_risk_score
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "8"))
+BATCH_AI_CONCURRENCY = int(os.getenv("BATCH_AI_CONCURRENCY", "2"))
+# Services accepted by one /analyze/batch request, and its whole upload size
+BATCH_MAX_SERVICES = int(os.getenv("BATCH_MAX_SERVICES", "1000"))
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+
+SPEC_SUFFIXES = (".yaml", ".yml", ".json")
+# Entries in the summary's top lists, and breaking lines kept per service
+TOP_SERVICES = 10
+MAX_BREAKING_LINES = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """Process pool shared by the web endpoints (spawned workers: the servers are threaded)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if multiprocessing.current_process().daemon:
+                # Hypercorn's workers are daemonic and may not start processes
+                _pool = ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix="batch")
+            else:
+                _pool = ProcessPoolExecutor(BATCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def service_name(relative_path):
+    """Service name for a spec file: its relative path without the suffix, with / separators."""
+    name = relative_path.replace(os.sep, "/").strip("/")
+    root, suffix = os.path.splitext(name)
+    return root if suffix.lower() in SPEC_SUFFIXES else name
+
+
+def _spec_files(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(SPEC_SUFFIXES):
+                path = os.path.join(root, name)
+                files[service_name(os.path.relpath(path, directory))] = path
+    return files
+
+
+def pairs_from_dirs(old_dir, new_dir):
+    """(service, old path, new path) for every spec in either tree; a side is None when missing."""
+    old, new = _spec_files(old_dir), _spec_files(new_dir)
+    return [(name, old.get(name), new.get(name)) for name in sorted(old.keys() | new.keys())]
+
+
+def pairs_from_manifest(path):
+    """
+    Pairs from a YAML/JSON manifest, either a list or {"services": [...]} of
+    {"name", "old", "new"} entries; relative paths are relative to the manifest.
+    """
+    with open(path, "rb") as f:
+        manifest = parse_spec(f.read())
+    entries = manifest.get("services", []) if isinstance(manifest, dict) else manifest
+    if not isinstance(entries, list):
+        raise ValueError("Manifest must be a list of services or have a 'services' list")
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError(f"Manifest entry needs a name: {entry!r}")
+        old, new = (os.path.join(base, entry[side]) if entry.get(side) else None for side in ("old", "new"))
+        pairs.append((str(entry["name"]), old, new))
+    return pairs
+
+
+def _strip_common_root(files):
+    """Drop a top-level folder every uploaded name shares (directory uploads prefix it)."""
+    parts = {name: name.replace("\\", "/").strip("/").split("/") for name in files}
+    roots = {p[0] for p in parts.values() if len(p) > 1}
+    if len(roots) == 1 and all(len(p) > 1 for p in parts.values()):
+        return {"/".join(parts[name][1:]): data for name, data in files.items()}
+    return files
+
+
+def pairs_from_uploads(old_files, new_files):
+    """Pairs from uploaded {file name: bytes} of both sides, matched by name."""
+    old = {service_name(name): data for name, data in _strip_common_root(old_files).items()}
+    new = {service_name(name): data for name, data in _strip_common_root(new_files).items()}
+    return [(name, old.get(name), new.get(name)) for name in sorted(old.keys() | new.keys())]
+
+
+def read_upload(stream, name, max_bytes=MAX_SPEC_BYTES):
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise SpecTooLarge(f"{name} exceeds the {max_bytes} byte limit")
+    return data
+
+
+def _load(source):
+    """Index of a spec given as a path or as bytes."""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            source = f.read()
+    return load_spec_index(source)
+
+
+def diff_service(service, old, new):
+    """The `service` event for one pair (paths or bytes; None = spec missing on that side)."""
+    event = {"type": "service", "service": service}
+    if old is None or new is None:
+        return {**event, "status": "added" if old is None else "removed"}
+    try:
+        diff_result = compare_specs(_load(old), _load(new))
+        risk = calculate_risk_score(diff_result, {})
+        facts = collect_facts(diff_result)
+    except Exception as e:
+        # Unreadable or malformed (e.g. `paths: 5`): report it, don't end the fleet run
+        return {**event, "status": "error", "error": str(e) or type(e).__name__}
+    breaking = [line for line, _ in facts["breaking"]]
+    return {
+        **event,
+        "status": "ok",
+        "risk_score": risk["score"],
+        "risk_breakdown": risk["breakdown"],
+        "changes": {section: len(facts[section]) for section, _ in FACT_SECTIONS},
+        "breaking": breaking[:MAX_BREAKING_LINES],
+        "pii_fields": diff_result.get("pii_fields_detected", []),
+    }
+
+
+def diff_chunk(pairs):
+    return [diff_service(*pair) for pair in pairs]
+
+
+def analyze_service(service, old, new):
+    """The `service_ai` event: the full pipeline with the LLM for one pair (imported only here)."""
+    from pipeline import prepare_analysis, analyze_prepared, result_record
+    try:
+        prepared = prepare_analysis(_load(old), _load(new))
+        record = result_record(prepared["diff"], analyze_prepared(prepared, bounded=False))
+    except Exception as e:
+        return {"type": "service_ai", "service": service, "ai_analysis": {"error": str(e)}}
+    return {
+        "type": "service_ai",
+        "service": service,
+        "ai_analysis": record["ai_analysis"],
+        "risk_score": record["risk_score"],
+        "risk_breakdown": record["risk_breakdown"],
+    }
+
+
+class FleetSummary:
+    """Running totals over service events; result() is the summary event."""
+
+    def __init__(self):
+        self.statuses = {}
+        self.scores = {}
+        self.breaking = {}
+        self.pii = {}
+        self.ai_errors = 0
+
+    def add(self, event):
+        if event["type"] == "service_ai":
+            if "error" in event["ai_analysis"]:
+                self.ai_errors += 1
+            if "risk_score" in event:
+                self.scores[event["service"]] = event["risk_score"]
+            return
+        self.statuses[event["status"]] = self.statuses.get(event["status"], 0) + 1
+        if event["status"] == "ok":
+            self.scores[event["service"]] = event["risk_score"]
+            self.breaking[event["service"]] = event["changes"]["breaking"]
+            self.pii[event["service"]] = len(event["pii_fields"])
+
+    def result(self):
+        top_risks = sorted(self.scores, key=lambda s: (-self.scores[s], -self.breaking.get(s, 0), s))
+        top_pii = sorted((s for s in self.pii if self.pii[s]), key=lambda s: (-self.pii[s], s))
+        scores = list(self.scores.values())
+        return {
+            "type": "summary",
+            "services": sum(self.statuses.values()),
+            "statuses": self.statuses,
+            "ai_errors": self.ai_errors,
+            "mean_risk_score": round(sum(scores) / len(scores), 2) if scores else None,
+            "breaking_changes": sum(self.breaking.values()),
+            "services_with_breaking_changes": sum(1 for count in self.breaking.values() if count),
+            "top_risks": [
+                {"service": s, "risk_score": self.scores[s], "breaking_changes": self.breaking.get(s, 0)}
+                for s in top_risks[:TOP_SERVICES]
+            ],
+            "pii_exposure": {
+                "fields": sum(self.pii.values()),
+                "services": len(top_pii),
+                "top": [{"service": s, "fields": self.pii[s]} for s in top_pii[:TOP_SERVICES]],
+            },
+        }
+
+
+def _needs_ai(event):
+    return event["status"] == "ok" and (event["risk_score"] or any(event["changes"].values()))
+
+
+def run_batch(pairs, workers=BATCH_WORKERS, chunk_size=BATCH_CHUNK_SIZE, ai=False,
+              ai_concurrency=BATCH_AI_CONCURRENCY, pool=None):
+    """
+    Yield service / service_ai events as they complete, then the summary.
+    `pool` (e.g. shared_pool()) is used instead of starting `workers`
+    processes; workers <= 1 diffs on a single background thread.
+    """
+    summary = FleetSummary()
+    sources = {service: (old, new) for service, old, new in pairs}
+    own_pool = None
+    if pool is None:
+        own_pool = pool = ProcessPoolExecutor(workers) if workers > 1 else ThreadPoolExecutor(1)
+    ai_pool = ThreadPoolExecutor(ai_concurrency, thread_name_prefix="batch-ai") if ai else None
+    ai_futures = set()
+    finished = False
+    diff_futures = [pool.submit(diff_chunk, pairs[i:i + chunk_size]) for i in range(0, len(pairs), chunk_size)]
+    pending = set(diff_futures)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                events = [future.result()] if future in ai_futures else future.result()
+                for event in events:
+                    summary.add(event)
+                    yield event
+                    if ai_pool and event["type"] == "service" and _needs_ai(event):
+                        ai_future = ai_pool.submit(analyze_service, event["service"], *sources[event["service"]])
+                        ai_futures.add(ai_future)
+                        pending.add(ai_future)
+        yield summary.result()
+        finished = True
+    finally:
+        # If the consumer stopped early (client gone), don't block it on unfinished
+        # work, and drop queued chunks from a shared pool too
+        if not finished:
+            for future in diff_futures:
+                future.cancel()
+        if own_pool is not None:
+            own_pool.shutdown(wait=finished, cancel_futures=True)
+        if ai_pool is not None:
+            ai_pool.shutdown(wait=finished, cancel_futures=True)
@@ -0,0 +1,174 @@
+"""
+Benchmark of the deterministic pipeline on synthetic specs.
+
+For each size (operations per spec) a seeded spec pair from spec_generator
+is timed through every stage: parsing, SpecIndex construction,
+compare_specs, _detect_pii_in_spec, extract_json and validate_ai_output on
+an LLM-style answer about the diff, and calculate_risk_score. Each stage is
+timed over --repeat runs (best run reported, as ops/s) and run once more
+under tracemalloc for its peak memory. YAML parsing dominates at large
+sizes (a 1000-operation spec is ~3 MB), so the default is JSON, the fast
+path; --format yaml measures YAML, best with small --sizes.
+
+Results are saved as JSON so runs can be compared over time:
+    python benchmark.py --sizes 10 100 1000 10000 50000
+    python benchmark.py --format yaml --sizes 10 100 1000
+    python benchmark.py --compare benchmarks/benchmark-20260101-120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+from diff_engine import compare_specs, _detect_pii_in_spec
+from loader import parse_spec
+from parser import SpecIndex
+from prompts import collect_facts
+from risk_scorer import calculate_risk_score
+from spec_generator import generate_spec, mutate_spec, dump_spec
+from utils import extract_json, validate_ai_output
+
+# Larger sizes are opt-in (--sizes): 10000 operations already takes ~30 s per stage
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_OUTPUT_DIR = "benchmarks"
+
+
+def llm_answer(diff):
+    """An LLM-style answer about `diff`: prose around a fenced JSON object that grows with the diff."""
+    facts = collect_facts(diff)
+    analysis = {
+        "risk_level": "HIGH" if facts["breaking"] else "LOW",
+        "pii_fields": list(diff.get("pii_fields_detected", [])),
+        "breaking_change_explanation": " ".join(f"{line}." for line, _ in facts["breaking"]),
+        "documentation_score": 6,
+        "recommendations": [f"Keep {line} until clients migrate" for line, _ in facts["breaking"]],
+        "executive_summary": f"{len(facts['breaking'])} breaking changes.",
+    }
+    return f"Here is my analysis:\n```json\n{json.dumps(analysis, indent=2)}\n```\nLet me know if you need more."
+
+
+def stages(old_text, new_text):
+    """(name, setup, run) per stage; setup builds fresh inputs outside the timed call."""
+    old_spec, new_spec = parse_spec(old_text), parse_spec(new_text)
+    diff = compare_specs(SpecIndex(old_spec), SpecIndex(new_spec))
+    answer = llm_answer(diff)
+    parsed = extract_json(answer)
+    ai_analysis, _ = validate_ai_output(parsed)
+
+    def fresh_indexes():
+        # SpecIndex memoizes hashes and $ref resolution; don't time a warm one
+        return SpecIndex(old_spec), SpecIndex(new_spec)
+
+    return [
+        ("parse", lambda: None, lambda _: (parse_spec(old_text), parse_spec(new_text))),
+        ("index", lambda: None, lambda _: fresh_indexes()),
+        ("compare_specs", fresh_indexes, lambda indexes: compare_specs(*indexes)),
+        ("detect_pii", lambda: SpecIndex(new_spec), _detect_pii_in_spec),
+        ("extract_json", lambda: answer, extract_json),
+        ("validate_ai_output", lambda: parsed, validate_ai_output),
+        ("risk_score", lambda: None, lambda _: calculate_risk_score(diff, ai_analysis)),
+    ]
+
+
+def measure(setup, run, repeat):
+    """Best wall time over `repeat` runs, and the peak traced memory of one more run."""
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup()
+        started = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - started)
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def bench_size(operations, seed, change_rate, repeat, fmt="yaml"):
+    old = generate_spec(operations, seed)
+    new = mutate_spec(old, change_rate, seed)
+    old_text, new_text = dump_spec(old, fmt).encode("utf-8"), dump_spec(new, fmt).encode("utf-8")
+    results = []
+    for name, setup, run in stages(old_text, new_text):
+        seconds, peak = measure(setup, run, repeat)
+        results.append({
+            "operations": operations,
+            "spec_bytes": len(old_text) + len(new_text),
+            "stage": name,
+            "seconds": round(seconds, 6),
+            "ops_per_sec": round(operations / seconds, 1) if seconds else None,
+            "peak_kb": round(peak / 1024, 1),
+        })
+        print(f"{operations:>8} {name:<20} {seconds * 1000:>10.2f} ms {results[-1]['ops_per_sec'] or 0:>12.0f} ops/s "
+              f"{results[-1]['peak_kb']:>10.0f} KiB", flush=True)
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, settings):
+    """Print each stage's speed relative to a saved run (>1 = faster now)."""
+    with open(baseline_path) as f:
+        saved = json.load(f)
+    baseline = {(r["operations"], r["stage"]): r for r in saved["results"]}
+    print(f"\nCompared with {baseline_path} ({saved.get('git_revision')}):")
+    for name, value in settings.items():
+        if saved.get(name) != value:
+            print(f"  note: {name} was {saved.get(name)!r}, now {value!r}")
+    for r in results:
+        before = baseline.get((r["operations"], r["stage"]))
+        if before is None or not r["seconds"]:
+            continue
+        print(f"{r['operations']:>8} {r['stage']:<20} {before['seconds'] / r['seconds']:>6.2f}x speedup "
+              f"{r['peak_kb'] - before['peak_kb']:>+10.0f} KiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the deterministic analysis pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="operations per spec")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--format", choices=("yaml", "json"), default="json",
+                        help="spec serialization fed to the parse stage")
+    parser.add_argument("--output", help=f"results file (default {DEFAULT_OUTPUT_DIR}/benchmark-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for operations in args.sizes:
+        results += bench_size(operations, args.seed, args.change_rate, args.repeat, args.format)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, time.strftime("benchmark-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    settings = {"seed": args.seed, "change_rate": args.change_rate, "repeat": args.repeat, "format": args.format}
+    with open(output, "w") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            **settings,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(results, args.compare, settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for analysis results.
+Keys are a digest of the normalized old/new specs plus the model and prompt
+version, so re-uploading the same spec pair replays the stored diff, AI
+analysis and risk score instead of running a new LLM generation.
+
+Two tiers:
+- In-memory LRU (always on)
+- On-disk JSON files (optional, enabled by ANALYSIS_CACHE_DIR) with
+  TTL and total-size eviction
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "256"))
+CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "")
+CACHE_DISK_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def _str_keys(node):
+    # YAML mappings can mix int and str keys (`200:` next to `default:` under
+    # responses), which sort_keys can't order
+    if isinstance(node, dict):
+        return {str(k): _str_keys(v) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_str_keys(v) for v in node]
+    return node
+
+
+def normalize_spec(spec):
+    """Canonical JSON encoding of a parsed spec (key order and whitespace independent)."""
+    return json.dumps(_str_keys(spec), sort_keys=True, separators=(",", ":"), default=str)
+
+
+def spec_digest(spec):
+    """Digest of the normalized spec."""
+    return hashlib.sha256(normalize_spec(spec).encode("utf-8")).hexdigest()
+
+
+def _digest_of(spec):
+    # SpecIndex objects carry a memoized digest; raw dicts are hashed here
+    digest = getattr(spec, "digest", None)
+    return digest if digest is not None else spec_digest(spec)
+
+
+def analysis_key(old_spec, new_spec, model_name, prompt_version):
+    """
+    Digest identifying one analysis: both specs, the model and the prompt version.
+    Specs may be raw dicts or SpecIndex objects.
+    """
+    h = hashlib.sha256()
+    for part in (_digest_of(old_spec), _digest_of(new_spec), model_name, str(prompt_version)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU keyed by digest."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    One JSON file per key. Entries older than the TTL are treated as misses
+    and deleted; when the directory grows past max_bytes the least recently
+    used files (by mtime, refreshed on read) are evicted.
+    """
+
+    def __init__(self, directory, max_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.ttl_seconds and age > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            now = time.time()
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if self.ttl_seconds and now - st.st_mtime > self.ttl_seconds:
+                    self._remove(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class AnalysisCache:
+    """Memory tier in front of an optional disk tier."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, directory=CACHE_DIR,
+                 disk_max_bytes=CACHE_DISK_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.memory = LRUCache(max_entries)
+        self.disk = DiskCache(directory, disk_max_bytes, ttl_seconds) if directory else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+
+analysis_cache = AnalysisCache()
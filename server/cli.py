@@ -0,0 +1,245 @@
+"""
+Headless command line for CI: the deterministic diff and risk score.
+
+    python cli.py diff old.yaml new.yaml                 # text summary
+    python cli.py diff old.yaml new.yaml --format sarif  # code-scanning upload
+    python cli.py diff old.yaml new.yaml --fail-at 5     # exit 1 when score >= 5
+    python cli.py diff old.yaml new.yaml --ai            # add the LLM analysis
+    python cli.py history openapi.yaml --repo .          # score every git revision
+    python cli.py batch old_specs/ new_specs/            # every service in two trees
+
+Exit status of `diff`: 0 when the risk score is below --fail-at, 1 when it
+reaches it, 2 when a spec can't be read or compared.
+
+The deterministic path imports only the loader, diff engine and risk scorer
+(no Flask, requests or LLM SDKs), so a CI invocation starts in tens of
+milliseconds. The AI pipeline, and with it the configured backend, is
+imported only for --ai.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from diff_engine import compare_specs
+from loader import load_spec_index_from_file
+from prompts import FACT_SECTIONS, collect_facts
+from risk_scorer import calculate_risk_score
+
+# Risk score at or above which `diff` exits with status 1
+CLI_FAIL_AT = int(os.getenv("CLI_FAIL_AT", "7"))
+
+SARIF_LEVELS = {"breaking": "error", "pii": "warning", "changes": "note", "governance": "note"}
+SARIF_RULES = {
+    "breaking": "Breaking change",
+    "pii": "PII field in the new spec",
+    "changes": "Non-breaking change",
+    "governance": "Governance issue",
+}
+
+
+def _load(path):
+    with open(path, "rb") as f:
+        return load_spec_index_from_file(f)
+
+
+def analyze(old_path, new_path, ai=False, deadline=None):
+    """The result record for two spec files; `ai` adds the LLM analysis (imported only then)."""
+    old_index, new_index = _load(old_path), _load(new_path)
+    if not ai:
+        diff_result = compare_specs(old_index, new_index)
+        risk = calculate_risk_score(diff_result, {})
+        return {"diff": diff_result, "risk_score": risk["score"], "risk_breakdown": risk["breakdown"]}
+
+    from pipeline import prepare_analysis, analyze_prepared, deadline_seconds, result_record
+    prepared = prepare_analysis(old_index, new_index)
+    del old_index, new_index
+    ai_analysis = analyze_prepared(prepared, deadline_seconds(deadline), bounded=False)
+    return result_record(prepared["diff"], ai_analysis)
+
+
+def format_text(record, old_path, new_path):
+    facts = collect_facts(record["diff"])
+    lines = [f"{old_path} -> {new_path}", f"Risk score: {record['risk_score']}/10"]
+    lines += [f"  {name}: {points}" for name, points in record["risk_breakdown"].items() if points]
+    for section, heading in FACT_SECTIONS:
+        if facts[section]:
+            lines.append(f"\n{heading} ({len(facts[section])})")
+            lines += [f"  - {line}" for line, _ in facts[section]]
+    ai_analysis = record.get("ai_analysis")
+    if ai_analysis:
+        if "error" in ai_analysis:
+            lines.append(f"\nAI analysis failed: {ai_analysis['error']}")
+        else:
+            lines.append(f"\nAI ({ai_analysis.get('risk_level')}): {ai_analysis.get('executive_summary', '')}")
+            lines += [f"  - {item}" for item in ai_analysis.get("recommendations", [])]
+    return "\n".join(lines)
+
+
+def format_sarif(record, new_path):
+    """SARIF 2.1.0 log: one result per fact line, located in the new spec."""
+    facts = collect_facts(record["diff"])
+    results = []
+    for section, _ in FACT_SECTIONS:
+        for line, path in facts[section]:
+            location = {"physicalLocation": {"artifactLocation": {"uri": new_path}}}
+            if path:
+                location["logicalLocations"] = [{"fullyQualifiedName": path, "kind": "resource"}]
+            results.append({
+                "ruleId": section,
+                "level": SARIF_LEVELS[section],
+                "message": {"text": line},
+                "locations": [location],
+            })
+    return {
+        "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {
+                "name": "api-guardian",
+                "rules": [{"id": rule, "shortDescription": {"text": text},
+                           "defaultConfiguration": {"level": SARIF_LEVELS[rule]}}
+                          for rule, text in SARIF_RULES.items()],
+            }},
+            "results": results,
+            "properties": {"riskScore": record["risk_score"], "riskBreakdown": record["risk_breakdown"]},
+        }],
+    }
+
+
+def diff_command(args):
+    if args.backend:
+        # Read by backends at import, which only happens below for --ai
+        os.environ["LLM_BACKEND"] = args.backend
+    try:
+        record = analyze(args.old, args.new, args.ai, args.deadline)
+    except Exception as e:
+        # Unreadable, too large, malformed or wrong-shaped specs (and any crash)
+        # must not exit 1, which CI reads as "risk score reached --fail-at"
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    if args.format == "json":
+        output = json.dumps(record, indent=2)
+    elif args.format == "sarif":
+        output = json.dumps(format_sarif(record, args.new), indent=2)
+    else:
+        output = format_text(record, args.old, args.new)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if record["risk_score"] >= args.fail_at else 0
+
+
+def history_command(args):
+    from history import analyze_history, GitError
+
+    try:
+        records = analyze_history(args.repo, args.path, args.rev, args.workers, args.max_count)
+        for record in records:
+            if args.format == "jsonl":
+                print(json.dumps(record), flush=True)
+                continue
+            date = time.strftime("%Y-%m-%d", time.localtime(record["timestamp"]))
+            if "error" in record:
+                result = "error: " + " ".join(record["error"].split())
+            else:
+                result = f"risk {record['risk_score']:>2}  breaking {record['changes']['breaking']:>3}"
+            print(f"{record['commit'][:10]}  {date}  {result}  {record['subject']}", flush=True)
+    except GitError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def _format_batch_event(event):
+    if event["type"] == "summary":
+        lines = [f"\n{event['services']} services: " + ", ".join(f"{n} {s}" for s, n in event["statuses"].items()),
+                 f"Breaking changes: {event['breaking_changes']} in {event['services_with_breaking_changes']} services",
+                 f"PII fields: {event['pii_exposure']['fields']} in {event['pii_exposure']['services']} services",
+                 "Top risks:"]
+        lines += [f"  {r['risk_score']:>2}  {r['service']} ({r['breaking_changes']} breaking)" for r in event["top_risks"]]
+        return "\n".join(lines)
+    if event["type"] == "service_ai":
+        ai_analysis = event["ai_analysis"]
+        if "error" in ai_analysis:
+            return f"{event['service']}: AI analysis failed: {ai_analysis['error']}"
+        return f"{event['service']}: AI risk {event['risk_score']} - {ai_analysis.get('executive_summary', '')}"
+    if event["status"] != "ok":
+        return f"{event['service']}: {event['status']}" + (f" ({event['error']})" if "error" in event else "")
+    return (f"{event['service']}: risk {event['risk_score']}, {event['changes']['breaking']} breaking, "
+            f"{len(event['pii_fields'])} PII fields")
+
+
+def batch_command(args):
+    from batch import pairs_from_dirs, pairs_from_manifest, run_batch
+
+    if args.backend:
+        os.environ["LLM_BACKEND"] = args.backend
+    if bool(args.manifest) == bool(args.old_dir and args.new_dir):
+        print("error: give either OLD_DIR NEW_DIR or --manifest", file=sys.stderr)
+        return 2
+    try:
+        pairs = pairs_from_manifest(args.manifest) if args.manifest else pairs_from_dirs(args.old_dir, args.new_dir)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    worst = 0
+    for event in run_batch(pairs, args.workers, args.chunk_size, args.ai, args.ai_concurrency):
+        worst = max(worst, event.get("risk_score") or 0)
+        print(json.dumps(event) if args.format == "jsonl" else _format_batch_event(event), flush=True)
+    return 1 if worst >= args.fail_at else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="api-guardian", description="Compare OpenAPI specs from the command line.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff = commands.add_parser("diff", help="diff two specs and score the risk")
+    diff.add_argument("old", help="old spec (YAML or JSON)")
+    diff.add_argument("new", help="new spec (YAML or JSON)")
+    diff.add_argument("--format", choices=("text", "json", "sarif"), default="text")
+    diff.add_argument("--output", "-o", help="write the report here instead of stdout")
+    diff.add_argument("--fail-at", type=int, default=CLI_FAIL_AT,
+                      help=f"exit 1 when the risk score is at least this (0-10, default {CLI_FAIL_AT}; 11 never fails)")
+    diff.add_argument("--ai", action="store_true", help="add the LLM analysis (adjusts the score by up to 2)")
+    diff.add_argument("--backend", help="LLM backend for --ai (default LLM_BACKEND)")
+    diff.add_argument("--deadline", type=float, default=None,
+                      help="seconds to wait for the AI before using the deterministic summary (0 = no limit)")
+    diff.set_defaults(handler=diff_command)
+
+    history = commands.add_parser("history", help="score each git revision of a spec against the previous one")
+    history.add_argument("path", help="spec path inside the repository")
+    history.add_argument("--repo", default=".", help="git repository (default: current directory)")
+    history.add_argument("--rev", default="HEAD", help="history to walk back from")
+    history.add_argument("--max-count", type=int, default=None, help="only the latest N revisions")
+    history.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    history.add_argument("--format", choices=("text", "jsonl"), default="text")
+    history.set_defaults(handler=history_command)
+
+    batch = commands.add_parser("batch", help="diff every service in two directory trees or a manifest")
+    batch.add_argument("old_dir", nargs="?", help="tree of old specs (matched to NEW_DIR by relative path)")
+    batch.add_argument("new_dir", nargs="?", help="tree of new specs")
+    batch.add_argument("--manifest", help="YAML/JSON list of {name, old, new} instead of two trees")
+    batch.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="diff processes")
+    batch.add_argument("--chunk-size", type=int, default=8, help="services per worker task")
+    batch.add_argument("--ai", action="store_true", help="also queue the LLM analysis of changed services")
+    batch.add_argument("--ai-concurrency", type=int, default=2, help="LLM analyses at once")
+    batch.add_argument("--backend", help="LLM backend for --ai (default LLM_BACKEND)")
+    batch.add_argument("--format", choices=("text", "jsonl"), default="text")
+    batch.add_argument("--fail-at", type=int, default=CLI_FAIL_AT,
+                       help="exit 1 when any service's risk score is at least this")
+    batch.set_defaults(handler=batch_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Stand-in for Ollama's /api/generate, for load tests without a GPU.
+
+Speaks the streaming (NDJSON chunks, one token each) and non-streaming
+protocol, honours options.num_predict (so prefix priming works) and returns
+a `context` with the final chunk. Generation speed and failures are
+configurable:
+
+- time to first token: a fixed --ttft plus prompt prefill at --prefill-tps
+- decode speed: --tokens-per-sec
+- --malformed-rate: share of answers that are not valid JSON
+- --error-rate: share of requests answered with HTTP 500
+- --drop-rate: share of streams cut off mid-generation
+- --parallel: generations served at once; the rest wait, as with
+  OLLAMA_NUM_PARALLEL
+
+Point the server at it with OLLAMA_URL:
+    python fake_ollama.py --port 11435 --ttft 0.3 --tokens-per-sec 40
+    OLLAMA_URL=http://127.0.0.1:11435/api/generate python app.py
+
+Unlike LLM_BACKEND=fake, this exercises the real Ollama client path:
+connection pooling, timeouts, retries, incremental parsing and cancellation.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_OLLAMA_TTFT = float(os.getenv("FAKE_OLLAMA_TTFT", "0.2"))
+FAKE_OLLAMA_PREFILL_TPS = float(os.getenv("FAKE_OLLAMA_PREFILL_TPS", "2000"))
+FAKE_OLLAMA_TOKENS_PER_SEC = float(os.getenv("FAKE_OLLAMA_TOKENS_PER_SEC", "30"))
+FAKE_OLLAMA_MALFORMED_RATE = float(os.getenv("FAKE_OLLAMA_MALFORMED_RATE", "0"))
+FAKE_OLLAMA_ERROR_RATE = float(os.getenv("FAKE_OLLAMA_ERROR_RATE", "0"))
+FAKE_OLLAMA_DROP_RATE = float(os.getenv("FAKE_OLLAMA_DROP_RATE", "0"))
+FAKE_OLLAMA_PARALLEL = int(os.getenv("FAKE_OLLAMA_PARALLEL", "4"))
+
+ANSWER = {
+    "risk_level": "HIGH",
+    "pii_fields": ["email"],
+    "breaking_change_explanation": "Removed endpoints and newly required parameters break existing clients.",
+    "documentation_score": 6,
+    "recommendations": [
+        "Deprecate removed endpoints for one release before deleting them",
+        "Give new required parameters a default",
+    ],
+    "executive_summary": "Breaking changes need a coordinated client rollout.",
+}
+# Trailing chatter real models add after the object; the analyzer stops reading before it
+TRAILER = "\n\nLet me know if you would like more detail on any of these changes."
+
+
+def _tokens(text):
+    """Split like a tokenizer roughly would: short word pieces and punctuation."""
+    return re.findall(r"\s*[A-Za-z]{1,5}|\s*\d{1,3}|\s*\S|\s+", text)
+
+
+class FakeModel:
+    """Answers generations with the configured timing and failure rates."""
+
+    def __init__(self, ttft=FAKE_OLLAMA_TTFT, prefill_tps=FAKE_OLLAMA_PREFILL_TPS,
+                 tokens_per_sec=FAKE_OLLAMA_TOKENS_PER_SEC, malformed_rate=FAKE_OLLAMA_MALFORMED_RATE,
+                 error_rate=FAKE_OLLAMA_ERROR_RATE, drop_rate=FAKE_OLLAMA_DROP_RATE,
+                 parallel=FAKE_OLLAMA_PARALLEL, seed=None):
+        self.ttft = ttft
+        self.prefill_tps = prefill_tps
+        self.tokens_per_sec = tokens_per_sec
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.parallel = parallel
+        self.slots = threading.BoundedSemaphore(parallel)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "active": 0, "waiting": 0, "errors": 0, "malformed": 0,
+                       "dropped": 0, "cancelled": 0, "completed": 0}
+
+    def roll(self, rate):
+        with self._lock:
+            return self._rng.random() < rate
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def answer(self):
+        """The token list of one answer: the analysis JSON, or a malformed one."""
+        text = json.dumps(ANSWER, indent=2)
+        if self.roll(self.malformed_rate):
+            self.count("malformed")
+            # Cut off mid-object, as a model hitting its token cap would
+            text = text[:len(text) // 2]
+        return _tokens(text + TRAILER)
+
+    def drop_point(self, length):
+        """Token index at which to cut this stream off, or None."""
+        if not length or not self.roll(self.drop_rate):
+            return None
+        with self._lock:
+            return self._rng.randrange(length)
+
+    def prefill_seconds(self, prompt):
+        return self.ttft + len(prompt) / 4 / self.prefill_tps
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "parallel": self.parallel}
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    model = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, payload):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._json(200, {"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._json(200, {"models": [{"name": "fake"}]})
+        elif self.path == "/fake/stats":
+            self._json(200, self.model.stats())
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._json(404, {"error": "not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = self.model
+        model.count("requests")
+        if model.roll(model.error_rate):
+            model.count("errors")
+            self._json(500, {"error": "injected failure"})
+            return
+
+        model.count("waiting")
+        with model.slots:
+            model.count("waiting", -1)
+            model.count("active")
+            try:
+                self._generate(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The analyzer closes the stream once the JSON object is complete
+                model.count("cancelled")
+            finally:
+                model.count("active", -1)
+
+    def _generate(self, body):
+        model = self.model
+        tokens = model.answer()
+        limit = body.get("options", {}).get("num_predict")
+        if limit is not None and limit >= 0:
+            tokens = tokens[:limit]
+        final = {"response": "", "done": True, "done_reason": "stop", "context": [1, 2, 3],
+                 "eval_count": len(tokens)}
+        time.sleep(model.prefill_seconds(body.get("prompt", "")))
+
+        if not body.get("stream", True):
+            time.sleep(len(tokens) / model.tokens_per_sec)
+            self._json(200, {**final, "response": "".join(tokens)})
+            model.count("completed")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        drop_at = model.drop_point(len(tokens))
+        for i, token in enumerate(tokens):
+            if i == drop_at:
+                model.count("dropped")
+                self.close_connection = True
+                return
+            self._chunk({"response": token, "done": False})
+            time.sleep(1 / model.tokens_per_sec)
+        self._chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+        model.count("completed")
+
+
+def serve(host, port, model):
+    handler = type("Handler", (FakeOllamaHandler,), {"model": model})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/generate server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=FAKE_OLLAMA_TTFT, help="seconds before the first token")
+    parser.add_argument("--prefill-tps", type=float, default=FAKE_OLLAMA_PREFILL_TPS,
+                        help="prompt tokens evaluated per second, added to --ttft")
+    parser.add_argument("--tokens-per-sec", type=float, default=FAKE_OLLAMA_TOKENS_PER_SEC)
+    parser.add_argument("--malformed-rate", type=float, default=FAKE_OLLAMA_MALFORMED_RATE)
+    parser.add_argument("--error-rate", type=float, default=FAKE_OLLAMA_ERROR_RATE)
+    parser.add_argument("--drop-rate", type=float, default=FAKE_OLLAMA_DROP_RATE)
+    parser.add_argument("--parallel", type=int, default=FAKE_OLLAMA_PARALLEL)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    model = FakeModel(args.ttft, args.prefill_tps, args.tokens_per_sec, args.malformed_rate,
+                      args.error_rate, args.drop_rate, args.parallel, args.seed)
+    server = serve(args.host, args.port, model)
+    print(f"Fake Ollama on http://{args.host}:{args.port}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
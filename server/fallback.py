@@ -0,0 +1,70 @@
+"""
+Deterministic analysis used when the AI backend misses its deadline.
+Builds the same fields validate_ai_output produces, purely from the diff:
+breaking changes explained from the diff facts, the scanner's PII list, and
+recommendations from breaking changes, naming issues and missing descriptions.
+"""
+from prompts import collect_facts
+from risk_scorer import calculate_risk_score
+from utils import validate_ai_output
+
+# Items listed per field before summarizing the rest as a count
+MAX_LISTED = 10
+
+
+def _listed(items, limit=MAX_LISTED, prefix=""):
+    # The prefix goes on the items only, not on the "... and N more" line
+    shown = [f"{prefix}{item}" for item in items[:limit]]
+    if len(items) > limit:
+        shown.append(f"... and {len(items) - limit} more")
+    return shown
+
+
+def _risk_level(score):
+    if score >= 7:
+        return "HIGH"
+    if score >= 4:
+        return "MEDIUM"
+    return "LOW"
+
+
+def deterministic_analysis(diff_result, reason="deadline"):
+    """A validated, AI-free analysis of `diff_result`, marked with `_fallback`."""
+    facts = collect_facts(diff_result)
+    breaking = [line for line, _ in facts["breaking"]]
+    naming = diff_result.get("naming_issues", [])
+    undocumented = diff_result.get("missing_descriptions", [])
+    pii = diff_result.get("pii_fields_detected", [])
+    score = calculate_risk_score(diff_result, {})["score"]
+
+    if breaking:
+        explanation = (f"{len(breaking)} breaking change(s) detected: "
+                       + "; ".join(_listed(breaking)) + ".")
+    else:
+        explanation = "No breaking changes detected by the automated diff."
+
+    recommendations = []
+    if breaking:
+        recommendations.append("Version the API or keep the removed/changed elements until clients migrate: "
+                               + "; ".join(_listed(breaking, 5)))
+    recommendations += _listed(naming, 5, "Fix naming issue: ")
+    recommendations += _listed(undocumented, 5, "Add a description: ")
+    if pii:
+        recommendations.append("Review handling of PII fields: " + ", ".join(_listed(pii, 5)))
+
+    summary = (f"Automated summary (AI analysis unavailable: {reason}). "
+               f"{len(breaking)} breaking change(s), {len(pii)} PII field(s), "
+               f"{len(naming)} naming issue(s) and {len(undocumented)} missing description(s); "
+               f"deterministic risk score {score}/10.")
+
+    analysis, _ = validate_ai_output({
+        "risk_level": _risk_level(score),
+        "pii_fields": pii,
+        "breaking_change_explanation": explanation,
+        # Docs quality from what the diff can see: one point per missing description
+        "documentation_score": 10 - len(undocumented),
+        "recommendations": recommendations,
+        "executive_summary": summary,
+    })
+    analysis["_fallback"] = {"reason": reason}
+    return analysis
@@ -0,0 +1,262 @@
+"""
+Risk history of one spec file across its git revisions.
+
+The revisions that changed the file (following renames, first-parent
+history) are listed with their blob ids, and every consecutive pair is
+diffed and scored with the deterministic engine. Pairs are cut into
+chunks of consecutive revisions for a process pool; a worker parses each
+revision once and uses it for both of its neighbouring comparisons (only a
+chunk's first revision is also parsed by the previous chunk).
+
+Results are cached under the two blob ids, so re-running after new commits
+only analyses the new pairs, and without reading the old blobs at all.
+Records are yielded oldest first as soon as they (and all before them) are
+done, with a bounded number of chunks in flight.
+"""
+import hashlib
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import AnalysisCache
+from diff_engine import compare_specs
+from loader import load_spec_index
+from prompts import FACT_SECTIONS, collect_facts
+from risk_scorer import calculate_risk_score
+
+# Bump whenever compare_specs, calculate_risk_score or the record change so
+# cached history results are not reused
+HISTORY_VERSION = 1
+# "" keeps the cache in memory only
+HISTORY_CACHE_DIR = os.path.expanduser(os.getenv("HISTORY_CACHE_DIR", "~/.cache/api-guardian/history"))
+HISTORY_CACHE_DISK_MAX_BYTES = int(os.getenv("HISTORY_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", str(90 * 24 * 3600)))
+# Consecutive pairs handed to one worker at a time
+HISTORY_CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", "8"))
+
+# Breaking-change lines kept per record
+MAX_BREAKING_LINES = 20
+
+_RECORD_SEPARATOR = "\x1e"
+_FIELD_SEPARATOR = "\x1f"
+
+
+class GitError(RuntimeError):
+    """A git command failed (not a repository, unknown revision...)."""
+
+
+def _git(repo, *args):
+    try:
+        result = subprocess.run(["git", "-C", repo, *args], capture_output=True, check=True)
+    except FileNotFoundError:
+        raise GitError("git is not installed") from None
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} failed") from None
+    return result.stdout.decode("utf-8", "replace")
+
+
+def list_revisions(repo, path, rev="HEAD", max_count=None):
+    """
+    Revisions of `path` oldest first: dicts with commit, blob, path (at that
+    commit), timestamp, author and subject. Commits deleting the file are skipped.
+    """
+    args = ["log", "--first-parent", "--follow", "--raw", "--no-abbrev",
+            f"--format={_RECORD_SEPARATOR}%H{_FIELD_SEPARATOR}%ct{_FIELD_SEPARATOR}%an{_FIELD_SEPARATOR}%s"]
+    if max_count:
+        args.append(f"--max-count={max_count}")
+    output = _git(repo, *args, rev, "--", path)
+
+    revisions = []
+    for record in output.split(_RECORD_SEPARATOR)[1:]:
+        header, _, raw = record.partition("\n")
+        commit, timestamp, author, subject = header.split(_FIELD_SEPARATOR, 3)
+        for line in raw.splitlines():
+            # :old_mode new_mode old_blob new_blob status\tpath[\tnew_path]
+            if not line.startswith(":"):
+                continue
+            meta, *paths = line.split("\t")
+            fields = meta.split()
+            if fields[4].startswith("D"):
+                continue
+            revisions.append({
+                "commit": commit,
+                "blob": fields[3],
+                "path": paths[-1],
+                "timestamp": int(timestamp),
+                "author": author,
+                "subject": subject,
+            })
+            break
+    revisions.reverse()
+    return revisions
+
+
+class BlobReader:
+    """Reads blobs by id through one long-running `git cat-file --batch`."""
+
+    def __init__(self, repo):
+        self._process = subprocess.Popen(["git", "-C", repo, "cat-file", "--batch"],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, blob):
+        self._process.stdin.write(f"{blob}\n".encode("ascii"))
+        self._process.stdin.flush()
+        header = self._process.stdout.readline().split()
+        if len(header) != 3:
+            raise GitError(f"blob {blob} not found")
+        data = self._process.stdout.read(int(header[2]))
+        self._process.stdout.read(1)  # trailing newline
+        return data
+
+    def close(self):
+        # Forked pool workers inherit the stdin pipe, so git may never see
+        # EOF; stop it instead of waiting for it to exit
+        self._process.stdin.close()
+        self._process.terminate()
+        self._process.wait()
+
+
+def _history_key(old_blob, new_blob):
+    h = hashlib.sha256()
+    for part in (old_blob, new_blob, str(HISTORY_VERSION)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _parse(data):
+    try:
+        index = load_spec_index(data)
+    except Exception as e:
+        # Not YAML/JSON, or a document the indexer can't walk (e.g. `paths: 5`)
+        return None, f"could not parse spec: {e}"
+    return index, None
+
+
+def score_pair(old, new):
+    """Summary of one consecutive pair of (index, error) revisions."""
+    (old_index, old_error), (new_index, new_error) = old, new
+    if old_error or new_error:
+        return {"error": new_error or old_error}
+    try:
+        diff_result = compare_specs(old_index, new_index)
+        risk = calculate_risk_score(diff_result, {})
+        facts = collect_facts(diff_result)
+    except Exception as e:
+        # Parses but has the wrong shape (e.g. `paths: 5`)
+        return {"error": f"could not compare specs: {e}"}
+    breaking = [line for line, _ in facts["breaking"]]
+    return {
+        "risk_score": risk["score"],
+        "risk_breakdown": risk["breakdown"],
+        "changes": {section: len(facts[section]) for section, _ in FACT_SECTIONS},
+        "breaking": breaking[:MAX_BREAKING_LINES],
+    }
+
+
+def score_chunk(blobs):
+    """Scores for consecutive revisions (list of blob bytes), each parsed once: len(blobs) - 1 summaries."""
+    results = []
+    previous = None
+    for data in blobs:
+        current = _parse(data)
+        if previous is not None:
+            results.append(score_pair(previous, current))
+        previous = current
+    return results
+
+
+def _chunks(pairs, cache, chunk_size):
+    """Split pair positions into jobs: ("cached", i, summary) or ("run", [i, ...]) of consecutive uncached pairs."""
+    run = []
+    for i, (old, new) in enumerate(pairs):
+        summary = cache.get(_history_key(old["blob"], new["blob"]))
+        if summary is not None:
+            if run:
+                yield ("run", run)
+                run = []
+            yield ("cached", i, summary)
+            continue
+        run.append(i)
+        if len(run) == chunk_size:
+            yield ("run", run)
+            run = []
+    if run:
+        yield ("run", run)
+
+
+def _record(old, new, summary, cached):
+    return {
+        "commit": new["commit"],
+        "previous_commit": old["commit"],
+        "path": new["path"],
+        "timestamp": new["timestamp"],
+        "author": new["author"],
+        "subject": new["subject"],
+        **summary,
+        "cached": cached,
+    }
+
+
+def analyze_history(repo, path, rev="HEAD", workers=None, max_count=None, cache=None,
+                    chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Yield one record per revision of `path` after the first (oldest first):
+    its commit, risk score, breakdown and change counts against the previous
+    revision. `workers` processes score uncached pairs (1 = in this process).
+    """
+    if cache is None:
+        cache = AnalysisCache(4096, HISTORY_CACHE_DIR, HISTORY_CACHE_DISK_MAX_BYTES, HISTORY_CACHE_TTL)
+    revisions = list_revisions(repo, path, rev, max_count)
+    pairs = list(zip(revisions, revisions[1:]))
+    if not pairs:
+        return
+    workers = workers or os.cpu_count() or 1
+    reader = BlobReader(repo)
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    # Chunks being scored, in order; bounded so blobs aren't all read up front
+    pending = deque()
+    jobs = _chunks(pairs, cache, chunk_size)
+
+    def submit(job):
+        if job[0] == "cached":
+            pending.append(job)
+            return
+        positions = job[1]
+        blobs = [reader.read(pairs[i][0]["blob"]) for i in positions[:1]]
+        blobs += [reader.read(pairs[i][1]["blob"]) for i in positions]
+        if pool is None:
+            pending.append(("done", positions, score_chunk(blobs)))
+        else:
+            pending.append(("future", positions, pool.submit(score_chunk, blobs)))
+
+    try:
+        for job in jobs:
+            submit(job)
+            while pending and (len(pending) > workers * 2 or _ready(pending[0])):
+                yield from _finish(pending.popleft(), pairs, cache)
+        while pending:
+            yield from _finish(pending.popleft(), pairs, cache)
+    finally:
+        reader.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _ready(job):
+    return job[0] != "future" or job[2].done()
+
+
+def _finish(job, pairs, cache):
+    if job[0] == "cached":
+        _, i, summary = job
+        yield _record(*pairs[i], summary, True)
+        return
+    kind, positions, result = job
+    summaries = result.result() if kind == "future" else result
+    for i, summary in zip(positions, summaries):
+        old, new = pairs[i]
+        if "error" not in summary:
+            cache.put(_history_key(old["blob"], new["blob"]), summary)
+        yield _record(old, new, summary, False)
@@ -0,0 +1,140 @@
+"""
+Per-change insight cache for delta analysis.
+
+Consecutive versions of a spec mostly repeat the changes of the previous
+comparison. Every fact line from prompts.collect_facts is one change record
+(a removed endpoint, a parameter, a schema field...), fingerprinted by its
+API title, text and the backend, model and prompt that analyzed it. Only
+unseen changes go to the LLM; the explanation sentences, recommendations and
+PII fields cached for the rest are merged into its answer.
+
+The model answers for a whole batch of changes, so insights are attributed
+to individual changes by the identifiers they mention (paths, quoted names,
+Schema.field, pointers). Text that names no specific change is only kept
+for the batch's breaking changes.
+"""
+import hashlib
+import os
+import re
+import statistics
+
+from ai_analyzer_local import PROMPT_VERSION
+from backends import llm_router
+from cache import AnalysisCache
+from prompts import FACT_SECTIONS, RISK_ORDER
+from utils import validate_ai_output
+
+INSIGHT_CACHE_ENTRIES = int(os.getenv("INSIGHT_CACHE_ENTRIES", "50000"))
+INSIGHT_CACHE_DIR = os.getenv("INSIGHT_CACHE_DIR", "")
+INSIGHT_CACHE_DISK_MAX_BYTES = int(os.getenv("INSIGHT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+INSIGHT_CACHE_TTL = int(os.getenv("INSIGHT_CACHE_TTL", str(30 * 24 * 3600)))
+
+insight_cache = AnalysisCache(INSIGHT_CACHE_ENTRIES, INSIGHT_CACHE_DIR, INSIGHT_CACHE_DISK_MAX_BYTES, INSIGHT_CACHE_TTL)
+
+# 'quoted names', /paths or pointers, dotted Schema.field names
+_TERM_RE = re.compile(r"'([^']+)'|(/[^\s:,'\]]+)|\b([A-Za-z_]\w*\.\w[\w.]*)")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Shorter terms match too much unrelated text
+MIN_TERM_LENGTH = 3
+
+
+def fingerprint(scope, section, line):
+    h = hashlib.sha256()
+    h.update(f"{llm_router.identity}\0{PROMPT_VERSION}\0{scope}\0{section}\0{line}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def spec_scope(index):
+    """Changes are only shared between versions of the same API (by info.title)."""
+    info = index.spec.get("info")
+    return str(info.get("title", "")) if isinstance(info, dict) else ""
+
+
+def fact_terms(line):
+    """Identifiers a change line mentions, lower-cased."""
+    terms = set()
+    for match in _TERM_RE.finditer(line):
+        term = next(group for group in match.groups() if group)
+        if len(term) >= MIN_TERM_LENGTH:
+            terms.add(term.lower())
+    return terms
+
+
+def split_known(facts, scope):
+    """
+    Partition collect_facts output into cached insights ({fingerprint: insight})
+    and the facts still needing the LLM (same shape as `facts`).
+    """
+    known = {}
+    unseen = {section: [] for section, _ in FACT_SECTIONS}
+    for section, items in facts.items():
+        for line, path in items:
+            fp = fingerprint(scope, section, line)
+            insight = insight_cache.get(fp)
+            if insight is None:
+                unseen[section].append((line, path))
+            else:
+                known[fp] = insight
+    return known, unseen
+
+
+def remember(changes, scope, ai_analysis):
+    """Attribute a validated analysis of `changes` ((section, line) pairs) to each one and cache it."""
+    sentences = [s for s in _SENTENCE_RE.split(ai_analysis.get("breaking_change_explanation", "")) if s]
+    recommendations = ai_analysis.get("recommendations", [])
+    pii_fields = ai_analysis.get("pii_fields", [])
+
+    for section, line in changes:
+        terms = fact_terms(line)
+        explanation = [s for s in sentences if any(term in s.lower() for term in terms)]
+        if not explanation and section == "breaking":
+            # A breaking change keeps its batch's explanation when none names it
+            explanation = sentences
+        recs = [r for r in recommendations if any(term in r.lower() for term in terms)]
+        lowered = line.lower()
+        pii = [f for f in pii_fields if f.lower() in lowered]
+        insight_cache.put(fingerprint(scope, section, line), {
+            # Breaking changes, and ones the model talked about, carry its risk level
+            "risk_level": ai_analysis.get("risk_level") if explanation or recs or section == "breaking" else None,
+            "explanation": explanation,
+            "recommendations": recs,
+            "pii_fields": pii,
+            "documentation_score": ai_analysis.get("documentation_score"),
+        })
+
+
+def combine(ai_analysis, known, new_changes):
+    """
+    Merge the LLM's analysis of the new changes (None if there were none)
+    with the cached insights of the changes seen before.
+    """
+    if not known:
+        return ai_analysis
+    if ai_analysis is not None and "error" in ai_analysis:
+        return ai_analysis
+
+    insights = list(known.values())
+    fresh = ai_analysis or {}
+    risks = [fresh.get("risk_level")] + [i["risk_level"] for i in insights]
+    risks = [r for r in risks if r]
+    sentences = [fresh.get("breaking_change_explanation", "")] + [s for i in insights for s in i["explanation"]]
+    scores = [i["documentation_score"] for i in insights if i["documentation_score"] is not None]
+
+    if ai_analysis is not None:
+        summary = f"{fresh.get('executive_summary', '')} Insights for {len(known)} previously analyzed changes were reused."
+    else:
+        summary = f"No changes need a new review; insights for all {len(known)} changes were reused from earlier analyses."
+
+    merged, warnings = validate_ai_output({
+        "risk_level": max(risks, key=lambda r: RISK_ORDER.get(r, 1)) if risks else "LOW",
+        "pii_fields": list(dict.fromkeys(fresh.get("pii_fields", []) + [f for i in insights for f in i["pii_fields"]])),
+        "breaking_change_explanation": " ".join(dict.fromkeys(s for s in sentences if s)),
+        "documentation_score": fresh.get("documentation_score") or (round(statistics.median(scores)) if scores else 5),
+        "recommendations": list(dict.fromkeys(fresh.get("recommendations", []) + [r for i in insights for r in i["recommendations"]])),
+        "executive_summary": summary.strip(),
+    })
+    warnings = fresh.get("_validation_warnings", []) + warnings
+    if warnings:
+        merged["_validation_warnings"] = warnings
+    merged["_delta"] = {"new_changes": new_changes, "reused_changes": len(known)}
+    return merged
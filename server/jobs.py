@@ -0,0 +1,185 @@
+"""
+Background analysis jobs.
+POST /analyze/jobs runs the deterministic diff inline, then queues the AI
+analysis on a bounded worker pool and returns a job id immediately, so
+request threads are not held for the whole LLM call. Progress and results
+are served from GET /report/<id> and GET /report/<id>/events.
+
+Finished reports live in a local result store: an in-memory LRU plus an
+optional directory (JOB_RESULT_DIR) with TTL / size eviction.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import AnalysisCache, analysis_cache
+from pipeline import result_record, diff_event, done_event, analyze_prepared
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Queued + running jobs accepted before submissions are refused
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_RESULT_ENTRIES = int(os.getenv("JOB_RESULT_ENTRIES", "1024"))
+JOB_RESULT_DIR = os.getenv("JOB_RESULT_DIR", "")
+JOB_RESULT_MAX_BYTES = int(os.getenv("JOB_RESULT_MAX_BYTES", str(256 * 1024 * 1024)))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))
+# Seconds between keep-alives on an idle /report/<id>/events stream
+JOB_EVENT_HEARTBEAT = 15
+
+TERMINAL_STATUSES = ("done", "error")
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_PENDING jobs are already queued or running."""
+
+
+def report_events(record):
+    """The diff / ai_done events describing a finished report (same schema as /analyze/stream)."""
+    events = [diff_event(record["diff"], {
+        "score": record["preliminary_score"],
+        "breakdown": record["preliminary_breakdown"],
+    })]
+    if record["status"] in TERMINAL_STATUSES:
+        events.append(done_event(record))
+    return events
+
+
+class Job:
+    """An in-flight job: its report record plus the progress events published so far."""
+
+    def __init__(self, job_id, diff_result, preliminary):
+        self.id = job_id
+        self.record = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "finished_at": None,
+            "diff": diff_result,
+            "preliminary_score": preliminary["score"],
+            "preliminary_breakdown": preliminary["breakdown"],
+            "ai_analysis": None,
+            "risk_score": preliminary["score"],
+            "risk_breakdown": preliminary["breakdown"],
+        }
+        self.events = report_events(self.record) + [{"type": "status", "status": "queued"}]
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.record["status"] in TERMINAL_STATUSES
+
+    def publish(self, event, **updates):
+        with self._cond:
+            self.record.update(updates)
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def events_since(self, index, timeout):
+        """Events after `index`, waiting up to `timeout` seconds for new ones."""
+        with self._cond:
+            if index >= len(self.events) and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[index:]
+
+
+class JobManager:
+    """Bounded worker pool plus the active-job table and result store."""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, store=None):
+        self.max_pending = max_pending
+        self.store = store or AnalysisCache(JOB_RESULT_ENTRIES, JOB_RESULT_DIR, JOB_RESULT_MAX_BYTES, JOB_RESULT_TTL)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-job")
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, prepared, cache_key):
+        """Queue the AI phase for an already-diffed spec pair (see pipeline.prepare_analysis); returns the Job."""
+        with self._lock:
+            if len(self._active) >= self.max_pending:
+                raise JobQueueFull(f"{len(self._active)} analysis jobs already pending")
+            job = Job(uuid.uuid4().hex, prepared["diff"], prepared["preliminary"])
+            self._active[job.id] = job
+        self._executor.submit(self._run, job, prepared, cache_key)
+        return job
+
+    def complete(self, cached):
+        """Record a job whose result came straight from the analysis cache."""
+        record = {
+            "id": uuid.uuid4().hex,
+            "status": "done",
+            "created_at": time.time(),
+            "finished_at": time.time(),
+            "diff": cached["diff"],
+            "preliminary_score": cached["risk_score"],
+            "preliminary_breakdown": cached["risk_breakdown"],
+            "ai_analysis": cached["ai_analysis"],
+            "risk_score": cached["risk_score"],
+            "risk_breakdown": cached["risk_breakdown"],
+            "cached": True,
+        }
+        self.store.put(record["id"], record)
+        return record
+
+    def _run(self, job, prepared, cache_key):
+        job.publish({"type": "status", "status": "running"}, status="running")
+        try:
+            # Jobs are already bounded by JOB_MAX_PENDING, so they wait for
+            # an LLM slot instead of being refused
+            ai_analysis = analyze_prepared(prepared, bounded=False)
+        except Exception as e:
+            ai_analysis = {"error": str(e)}
+
+        result = result_record(job.record["diff"], ai_analysis)
+        status = "error" if "error" in ai_analysis else "done"
+        job.publish(
+            done_event(result),
+            status=status,
+            finished_at=time.time(),
+            ai_analysis=ai_analysis,
+            risk_score=result["risk_score"],
+            risk_breakdown=result["risk_breakdown"],
+        )
+
+        if status == "done":
+            analysis_cache.put(cache_key, result)
+        self.store.put(job.id, job.record)
+        with self._lock:
+            self._active.pop(job.id, None)
+
+    def get(self, job_id):
+        """Current report record for a job, or None if unknown/expired."""
+        job = self._active.get(job_id)
+        if job is not None:
+            return job.record
+        return self.store.get(job_id)
+
+    def subscribe(self, job_id):
+        """
+        Generator of progress events for a job (None entries are heartbeats),
+        ending once the job finishes. Returns None for unknown jobs.
+        """
+        job = self._active.get(job_id)
+        if job is None:
+            record = self.store.get(job_id)
+            return None if record is None else iter(report_events(record))
+        return self._follow(job)
+
+    @staticmethod
+    def _follow(job):
+        index = 0
+        while True:
+            events = job.events_since(index, JOB_EVENT_HEARTBEAT)
+            if not events:
+                if job.finished:
+                    return
+                yield None
+                continue
+            index += len(events)
+            for event in events:
+                yield event
+            if job.finished and index >= len(job.events):
+                return
+
+
+job_manager = JobManager()
@@ -0,0 +1,160 @@
+"""
+Shared HTTP client for the Ollama backend.
+Both the blocking analyzer and the streaming endpoint go through one pooled,
+keep-alive requests.Session instead of opening a new TCP connection for
+every request and retry.
+
+Timeouts are split:
+- LLM_CONNECT_TIMEOUT:     establishing the TCP connection
+- LLM_READ_TIMEOUT:        longest silence allowed between streamed chunks
+- LLM_GENERATION_TIMEOUT:  wall-clock budget for a whole generation
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_GENERATION_TIMEOUT = float(os.getenv("LLM_GENERATION_TIMEOUT", "120"))
+
+
+class GenerationTimeout(requests.exceptions.Timeout):
+    """The generation ran past LLM_GENERATION_TIMEOUT."""
+
+
+class OllamaClient:
+    """Pooled client for Ollama's /api/generate endpoint."""
+
+    def __init__(self, url=OLLAMA_URL, pool_size=LLM_POOL_SIZE,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+                 generation_timeout=LLM_GENERATION_TIMEOUT):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.generation_timeout = generation_timeout
+
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._requests_total = 0
+        self._errors_total = 0
+
+    def _begin(self):
+        with self._lock:
+            self._active += 1
+            self._requests_total += 1
+
+    def _end(self, failed):
+        with self._lock:
+            self._active -= 1
+            if failed:
+                self._errors_total += 1
+
+    def generate(self, model, prompt, **payload):
+        """Blocking generation; returns the full response text."""
+        self._begin()
+        failed = True
+        try:
+            response = self.session.post(
+                self.url,
+                json={"model": model, "prompt": prompt, "stream": False, **payload},
+                # Nothing is sent until generation finishes, so the read
+                # timeout has to cover the whole generation
+                timeout=(self.connect_timeout, self.generation_timeout),
+            )
+            response.raise_for_status()
+            text = response.json().get("response", "")
+            failed = False
+            return text
+        finally:
+            self._end(failed)
+
+    def prime(self, model, prompt, **payload):
+        """
+        Evaluate `prompt` once (generating a single token) and return Ollama's
+        final response; its `context` lets later requests skip re-sending it.
+        """
+        options = {**payload.pop("options", {}), "num_predict": 1}
+        self._begin()
+        failed = True
+        try:
+            response = self.session.post(
+                self.url,
+                json={"model": model, "prompt": prompt, "stream": False, "options": options, **payload},
+                timeout=(self.connect_timeout, self.generation_timeout),
+            )
+            response.raise_for_status()
+            result = response.json()
+            failed = False
+            return result
+        finally:
+            self._end(failed)
+
+    def stream(self, model, prompt, **payload):
+        """
+        Streaming generation; yields Ollama's JSON chunks as dicts.
+        Closing the generator early closes the upstream response.
+        """
+        self._begin()
+        failed = True
+        deadline = time.monotonic() + self.generation_timeout
+        response = None
+        try:
+            response = self.session.post(
+                self.url,
+                json={"model": model, "prompt": prompt, "stream": True, **payload},
+                stream=True,
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+            response.raise_for_status()
+
+            for line in response.iter_lines():
+                if time.monotonic() > deadline:
+                    raise GenerationTimeout(f"Generation exceeded {self.generation_timeout}s")
+                if not line:
+                    continue
+                chunk = json.loads(line.decode("utf-8"))
+                yield chunk
+                if chunk.get("done", False):
+                    break
+            failed = False
+        except GeneratorExit:
+            # Caller stopped early (e.g. the JSON object was complete)
+            failed = False
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            self._end(failed)
+
+    def pool_stats(self):
+        """Counters for monitoring connection reuse and load."""
+        connections_opened = 0
+        idle_connections = 0
+        for pool in list(self._adapter.poolmanager.pools._container.values()):
+            connections_opened += pool.num_connections
+            idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        with self._lock:
+            return {
+                "url": self.url,
+                "pool_size": self.pool_size,
+                "active_requests": self._active,
+                "requests_total": self._requests_total,
+                "errors_total": self._errors_total,
+                "connections_opened": connections_opened,
+                "idle_connections": idle_connections,
+            }
+
+
+ollama_client = OllamaClient()
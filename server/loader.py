@@ -0,0 +1,122 @@
+"""
+Fast spec loading.
+- JSON-encoded specs are parsed with the json module (much faster than YAML)
+- YAML uses libyaml's CSafeLoader when PyYAML was built with it
+- Parsed, indexed specs are cached by content digest, so a baseline spec that
+  is uploaded on every run is parsed and indexed once per process
+
+Uploads can be loaded straight from a (spooled) file handle: the digest is
+computed in chunks with a size limit, and the document is only parsed from
+the handle on a cache miss.
+
+Cached documents are shared between requests and must be treated as read-only.
+"""
+import hashlib
+import json
+import os
+
+import yaml
+
+from cache import LRUCache
+from parser import SpecIndex
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+SPEC_CACHE_ENTRIES = int(os.getenv("SPEC_CACHE_ENTRIES", "16"))
+# Largest single spec accepted (bytes)
+MAX_SPEC_BYTES = int(os.getenv("MAX_SPEC_BYTES", str(50 * 1024 * 1024)))
+READ_CHUNK_BYTES = 1024 * 1024
+
+_index_cache = LRUCache(SPEC_CACHE_ENTRIES)
+
+
+class SpecTooLarge(ValueError):
+    """Raised when an uploaded spec exceeds MAX_SPEC_BYTES."""
+
+
+def content_digest(data):
+    """SHA-256 of the raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _looks_like_json(data):
+    head = data[:64].lstrip(b"\xef\xbb\xbf \t\r\n")
+    return head[:1] in (b"{", b"[")
+
+
+def parse_spec(data):
+    """Parse spec bytes, using the JSON fast path when the document is JSON."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if _looks_like_json(data):
+        try:
+            return json.loads(data)
+        except ValueError:
+            pass  # Flow-style YAML also starts with "{"; fall back to YAML
+    return yaml.load(data, Loader=SafeLoader)
+
+
+def _index_parsed(digest, spec):
+    if spec is not None and not isinstance(spec, dict):
+        raise ValueError("Spec must be a YAML/JSON mapping at the top level")
+    index = SpecIndex(spec)
+    _index_cache.put(digest, index)
+    return index
+
+
+def load_spec_index(data):
+    """Parse and index spec bytes, reusing the cached SpecIndex for identical content."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    digest = content_digest(data)
+    index = _index_cache.get(digest)
+    if index is None:
+        index = _index_parsed(digest, parse_spec(data))
+    return index
+
+
+def load_spec_index_from_file(stream, max_bytes=MAX_SPEC_BYTES):
+    """
+    Like load_spec_index, but reads from a seekable binary file handle.
+    The upload is never held in memory as one bytes object: it is hashed in
+    chunks and, on a cache miss, parsed directly from the handle.
+    """
+    h = hashlib.sha256()
+    size = 0
+    head = b""
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        if not head:
+            head = chunk[:64]
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise SpecTooLarge(f"Spec exceeds the {max_bytes} byte limit")
+        h.update(chunk)
+
+    digest = h.hexdigest()
+    index = _index_cache.get(digest)
+    if index is not None:
+        return index
+
+    stream.seek(0)
+    spec = None
+    parsed = False
+    if _looks_like_json(head):
+        try:
+            spec = json.load(stream)
+            parsed = True
+        except ValueError:
+            stream.seek(0)
+    if not parsed:
+        spec = yaml.load(stream, Loader=SafeLoader)
+    return _index_parsed(digest, spec)
+
+
+def load_spec(data):
+    """Parse spec bytes into a (cached, read-only) document."""
+    return load_spec_index(data).spec
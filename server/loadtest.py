@@ -0,0 +1,179 @@
+"""
+SSE load test for /analyze/stream.
+
+Opens --concurrency streams at a time until --requests analyses have run,
+each uploading a synthetic spec pair from spec_generator. Every pair is
+distinct by default (a different seed), so the analysis cache, insight
+cache and request coalescing don't hide the LLM cost; --same sends one pair
+to all of them instead.
+
+Reports p50/p95/p99 of the time to the `diff` event and to `ai_done`,
+statuses (429s from admission control, fallbacks, AI errors), and the
+server's resident memory, sampled from its /metrics during the run.
+
+With fake_ollama.py standing in for the model:
+    python fake_ollama.py --port 11435 --tokens-per-sec 40 &
+    OLLAMA_URL=http://127.0.0.1:11435/api/generate python app.py &
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 16 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+
+import httpx
+
+from spec_generator import generate_spec, mutate_spec, dump_spec
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+
+def spec_pairs(count, operations, seed, change_rate, same):
+    """`count` (old, new) YAML byte pairs; `same` repeats the first one."""
+    pairs = []
+    for i in range(1 if same else count):
+        old = generate_spec(operations, seed + i)
+        new = mutate_spec(old, change_rate, seed + i)
+        pairs.append((dump_spec(old).encode("utf-8"), dump_spec(new).encode("utf-8")))
+    return pairs * count if same else pairs
+
+
+async def run_stream(client, url, pair, params):
+    """One /analyze/stream request: event timings and how it ended."""
+    result = {"status": None, "diff_s": None, "done_s": None, "outcome": None}
+    started = time.perf_counter()
+    files = {"old": ("old.yaml", pair[0]), "new": ("new.yaml", pair[1])}
+    try:
+        async with client.stream("POST", f"{url}/analyze/stream", files=files, params=params) as response:
+            result["status"] = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                result["outcome"] = "rejected" if response.status_code == 429 else "http_error"
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "diff":
+                    result["diff_s"] = time.perf_counter() - started
+                elif event["type"] == "ai_done":
+                    result["done_s"] = time.perf_counter() - started
+                    analysis = event["ai_analysis"]
+                    result["outcome"] = ("fallback" if "_fallback" in analysis
+                                         else "ai_error" if "error" in analysis
+                                         else "cached" if event.get("cached") else "ok")
+                elif event["type"] == "error":
+                    result["outcome"] = "error"
+    except httpx.HTTPError as e:
+        result["outcome"] = f"transport_error: {type(e).__name__}"
+    if result["outcome"] is None:
+        result["outcome"] = "incomplete"
+    return result
+
+
+async def server_memory(client, url):
+    """Resident bytes from the server's /metrics, or None."""
+    try:
+        response = await client.get(f"{url}/metrics")
+    except httpx.HTTPError:
+        return None
+    match = re.search(r"^process_resident_memory_bytes (\d+)", response.text, re.M)
+    return int(match.group(1)) if match else None
+
+
+async def sample_memory(client, url, interval, samples, stop):
+    while not stop.is_set():
+        value = await server_memory(client, url)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def load_test(url, pairs, concurrency, params, memory_interval, timeout):
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        baseline = await server_memory(client, url)
+        samples = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(client, url, memory_interval, samples, stop))
+
+        pending = iter(pairs)
+        results = []
+
+        async def worker():
+            for pair in pending:
+                results.append(await run_stream(client, url, pair, params))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+    return results, elapsed, baseline, samples
+
+
+def summarize(results, elapsed, baseline, samples):
+    outcomes = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    report = {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "completed_per_s": round(sum(r["done_s"] is not None for r in results) / elapsed, 2),
+        "outcomes": outcomes,
+    }
+    for name, key in (("diff_s", "time_to_diff_ms"), ("done_s", "time_to_ai_done_ms")):
+        values = [r[name] for r in results if r[name] is not None]
+        report[key] = {
+            f"p{pct}": round(percentile(values, pct) * 1000, 1) if values else None for pct in PERCENTILES
+        }
+    mib = lambda value: round(value / 2 ** 20, 1) if value is not None else None
+    report["server_memory_mib"] = {
+        "before": mib(baseline),
+        "peak": mib(max(samples) if samples else None),
+        "after": mib(samples[-1] if samples else None),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent SSE load test for /analyze/stream.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server base URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="streams open at once")
+    parser.add_argument("--requests", type=int, default=50, help="analyses in total")
+    parser.add_argument("--operations", type=int, default=50, help="operations per generated spec")
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--same", action="store_true", help="send one spec pair to every request")
+    parser.add_argument("--deadline", type=float, default=None, help="?deadline= seconds per analysis")
+    parser.add_argument("--timeout", type=float, default=300, help="client timeout per request")
+    parser.add_argument("--memory-interval", type=float, default=0.5, help="seconds between /metrics samples")
+    parser.add_argument("--output", help="write the report (and per-request results) as JSON")
+    args = parser.parse_args()
+
+    pairs = spec_pairs(args.requests, args.operations, args.seed, args.change_rate, args.same)
+    params = {"deadline": args.deadline} if args.deadline is not None else {}
+    results, elapsed, baseline, samples = asyncio.run(
+        load_test(args.url, pairs, args.concurrency, params, args.memory_interval, args.timeout))
+    report = summarize(results, elapsed, baseline, samples)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({**report, "settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Latency instrumentation and Prometheus metrics.
+
+Each /analyze and /analyze/stream request times its phases (YAML parsing,
+compare_specs, insight lookup, prompt building, the AI wait) with a
+PhaseTimer, which reports them in a Server-Timing header / `timings` SSE
+event and feeds the phase histogram. The analyzers record time to first
+token, token throughput, retries and JSON extraction failures per
+generation. GET /metrics renders everything in the Prometheus text format.
+
+Kept dependency-free: a handful of thread-safe counters and histograms.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds; spans a cache hit (~1ms) to a slow local generation (minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                labels = _label_text(self.labels + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _label_text(self.labels + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {round(values[-1], 6)}")
+        return lines
+
+
+phase_seconds = Histogram(
+    "api_guardian_phase_seconds", "Latency of each analysis phase.", labels=("endpoint", "phase"))
+llm_ttft_seconds = Histogram(
+    "api_guardian_llm_time_to_first_token_seconds", "Time from sending a prompt to its first token.",
+    labels=("backend",))
+llm_tokens_per_second = Histogram(
+    "api_guardian_llm_tokens_per_second", "Token throughput of each generation after its first token.",
+    THROUGHPUT_BUCKETS, labels=("backend",))
+llm_retries = Counter(
+    "api_guardian_llm_retries_total", "Generations retried after malformed output or an error.", ("backend",))
+json_extract_failures = Counter(
+    "api_guardian_json_extract_failures_total", "LLM responses extract_json could not turn into JSON.")
+admission_wait_seconds = Histogram(
+    "api_guardian_admission_wait_seconds", "Time analyses waited in the admission queue for an LLM slot.")
+
+REGISTRY = [phase_seconds, llm_ttft_seconds, llm_tokens_per_second, llm_retries, json_extract_failures,
+            admission_wait_seconds]
+
+
+def observe_generation(backend, ttft, tokens, seconds):
+    """One finished generation: time to first token, and `tokens` streamed over `seconds` after it."""
+    llm_ttft_seconds.observe(ttft, backend=backend)
+    if tokens and seconds > 0:
+        llm_tokens_per_second.observe(tokens / seconds, backend=backend)
+
+
+class PhaseTimer:
+    """Per-request phase durations, reported to the client and the phase histogram."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds, observe=True):
+        """Record a phase; `observe=False` reports it without feeding the histogram."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if observe:
+            phase_seconds.observe(seconds, endpoint=self.endpoint, phase=name)
+
+    def finish(self):
+        self.add("total", time.perf_counter() - self.started)
+
+    def header(self):
+        """Server-Timing header value (durations in milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items())
+
+    def event(self):
+        return {"type": "timings", "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}}
+
+
+def _process_memory():
+    """(resident, peak resident) bytes of this process; None where unavailable."""
+    resident = peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+    return resident, peak
+
+
+def render(caches=None):
+    """Prometheus text exposition of every metric, plus hit/miss counters of `caches` ({name: AnalysisCache})."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    resident, peak = _process_memory()
+    for name, help_text, value in (
+        ("process_resident_memory_bytes", "Resident memory size in bytes.", resident),
+        ("process_max_resident_memory_bytes", "Peak resident memory size in bytes.", peak),
+    ):
+        if value is not None:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    if caches:
+        name = "api_guardian_cache_requests_total"
+        lines += [f"# HELP {name} Cache lookups by result.", f"# TYPE {name} counter"]
+        for cache_name, cache in caches.items():
+            lines.append(f'{name}{{cache="{cache_name}",result="hit"}} {cache.hits}')
+            lines.append(f'{name}{{cache="{cache_name}",result="miss"}} {cache.misses}')
+    return "\n".join(lines) + "\n"
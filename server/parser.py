@@ -1,6 +1,236 @@
+"""
+Single-pass index over an OpenAPI spec.
+The diff engine, detectors and AI analyzers all read from a SpecIndex
+instead of re-walking the raw `paths` / `components` trees themselves.
+Schemas are expanded through RefResolver, which follows local `$ref`
+pointers and `allOf`/`oneOf`/`anyOf` compositions.
+"""
+from cache import spec_digest
+from structural_diff import StructuralHasher
+
+# Nested property levels expanded below a schema root
+MAX_FIELD_DEPTH = 8
+COMPOSITION_KEYS = ("allOf", "oneOf", "anyOf")
+
+
 def extract_paths(spec):
     return spec.get("paths", {})
 
 
 def extract_schemas(spec):
     return spec.get("components", {}).get("schemas", {})
+
+
+class RefResolver:
+    """
+    Resolves local JSON pointers ("#/components/schemas/Customer") in one document.
+
+    - Pointers are resolved lazily, on first use, and memoized.
+    - Field expansion of a referenced schema is memoized per (pointer, depth),
+      so a component shared by hundreds of operations is expanded once.
+    - Reference cycles are cut: a pointer that is already being expanded
+      contributes no further fields.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self._targets = {}
+        self._fields = {}
+        self._active = set()
+
+    def resolve(self, ref):
+        """Return the node a `$ref` string points to, or None if it is external or dangling."""
+        if ref in self._targets:
+            return self._targets[ref]
+
+        node = None
+        if isinstance(ref, str) and ref.startswith("#"):
+            node = self.document
+            for token in ref[1:].split("/")[1:]:
+                token = token.replace("~1", "/").replace("~0", "~")
+                if isinstance(node, dict):
+                    node = node.get(token)
+                elif isinstance(node, list) and token.isdigit() and int(token) < len(node):
+                    node = node[int(token)]
+                else:
+                    node = None
+                    break
+
+        self._targets[ref] = node
+        return node
+
+    def deref(self, node):
+        """Follow a chain of `$ref`s to a concrete node; None if the chain dangles or loops."""
+        seen = set()
+        while isinstance(node, dict) and "$ref" in node:
+            ref = node["$ref"]
+            if ref in seen:
+                return None
+            seen.add(ref)
+            node = self.resolve(ref)
+        return node
+
+    def fields(self, schema, depth=MAX_FIELD_DEPTH, follow_refs=True):
+        """
+        Dotted property paths reachable from `schema` ("address", "address.city").
+        Compositions are merged and array `items` are transparent.
+        With follow_refs=False only inline properties are expanded.
+        """
+        if not isinstance(schema, dict) or depth <= 0:
+            return ()
+
+        ref = schema.get("$ref")
+        if ref is not None:
+            if not follow_refs or ref in self._active:
+                return ()
+            key = (ref, depth)
+            cached = self._fields.get(key)
+            if cached is None:
+                self._active.add(ref)
+                try:
+                    cached = self.fields(self.resolve(ref), depth, follow_refs)
+                finally:
+                    self._active.discard(ref)
+                self._fields[key] = cached
+            return cached
+
+        result = {}
+        for key in COMPOSITION_KEYS:
+            for sub in schema.get(key) or []:
+                result.update(dict.fromkeys(self.fields(sub, depth, follow_refs)))
+
+        items = schema.get("items")
+        if isinstance(items, dict):
+            result.update(dict.fromkeys(self.fields(items, depth, follow_refs)))
+
+        props = schema.get("properties")
+        if isinstance(props, dict):
+            for name, sub in props.items():
+                result[name] = None
+                for nested in self.fields(sub, depth - 1, follow_refs):
+                    result[f"{name}.{nested}"] = None
+
+        return tuple(result)
+
+
+def _media_schemas(container):
+    """Schemas carried by a request body / response (OpenAPI 3 `content` or Swagger 2 `schema`)."""
+    if not isinstance(container, dict):
+        return
+    if "schema" in container:
+        yield container["schema"]
+    for media in (container.get("content") or {}).values():
+        if isinstance(media, dict) and "schema" in media:
+            yield media["schema"]
+
+
+class SpecIndex:
+    """
+    Precomputed lookup tables for one spec, built in a single traversal.
+
+    - paths:        path -> {method: operation} (only dict-valued entries)
+    - method_sets:  path -> frozenset of methods
+    - parameters:   (path, method) -> {param_name: param}
+    - responses:    (path, method) -> frozenset of response codes
+    - summaries:    (path, method) -> summary string ("" if absent)
+    - described:    (path, method) -> True if summary or description present
+    - body_fields:  (path, method) -> {"request" | "response <code>": frozenset of field paths}
+    - inline_body_fields: same, but only inline (non-$ref) properties
+    - schemas:      schema_name -> {"fields": [...], "required": [...]}
+    - schema_field_sets: schema_name -> frozenset of dotted field paths
+    - refs:         the RefResolver for this document
+    - hashes:       StructuralHasher memoizing subtree hashes for this document
+    - digest:       normalized content digest (computed on first use)
+    """
+
+    def __init__(self, spec):
+        self.spec = spec or {}
+        self.refs = RefResolver(self.spec)
+        self.hashes = StructuralHasher()
+        self._digest = None
+        self.paths = {}
+        self.method_sets = {}
+        self.parameters = {}
+        self.responses = {}
+        self.summaries = {}
+        self.described = {}
+        self.body_fields = {}
+        self.inline_body_fields = {}
+        self.schemas = {}
+        self.schema_field_sets = {}
+
+        for path, methods in extract_paths(self.spec).items():
+            ops = {}
+            if isinstance(methods, dict):
+                for method, operation in methods.items():
+                    if not isinstance(operation, dict):
+                        continue
+                    ops[method] = operation
+                    key = (path, method)
+                    self.parameters[key] = {
+                        p.get("name", ""): p
+                        for p in operation.get("parameters", []) or []
+                        if isinstance(p, dict)
+                    }
+                    self.responses[key] = frozenset((operation.get("responses") or {}).keys())
+                    self.summaries[key] = operation.get("summary", "")
+                    self.described[key] = bool(operation.get("summary") or operation.get("description"))
+                    self._index_bodies(key, operation)
+            self.paths[path] = ops
+            self.method_sets[path] = frozenset(ops)
+
+        for schema_name, schema_def in (extract_schemas(self.spec) or {}).items():
+            if not isinstance(schema_def, dict):
+                schema_def = {}
+            # Expand through the component's own pointer so its expansion is
+            # memoized for body schemas and self-references are cut at the root
+            pointer = "#/components/schemas/" + str(schema_name).replace("~", "~0").replace("/", "~1")
+            fields = self.refs.fields({"$ref": pointer})
+            self.schemas[schema_name] = {
+                "fields": list(fields),
+                "required": schema_def.get("required", []),
+            }
+            self.schema_field_sets[schema_name] = frozenset(fields)
+
+    def _index_bodies(self, key, operation):
+        """Collect request/response schema fields for one operation."""
+        containers = {"request": [self.refs.deref(operation.get("requestBody"))]}
+        # Swagger 2 body parameters
+        containers["request"].extend(
+            p for p in operation.get("parameters", []) or []
+            if isinstance(p, dict) and p.get("in") == "body"
+        )
+        for code, response in (operation.get("responses") or {}).items():
+            containers[f"response {code}"] = [self.refs.deref(response)]
+
+        full = {}
+        inline = {}
+        for location, items in containers.items():
+            schemas = [schema for container in items for schema in _media_schemas(container)]
+            if not schemas:
+                continue
+            full[location] = frozenset(f for schema in schemas for f in self.refs.fields(schema))
+            inline[location] = frozenset(
+                f for schema in schemas for f in self.refs.fields(schema, follow_refs=False)
+            )
+        self.body_fields[key] = full
+        self.inline_body_fields[key] = inline
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = spec_digest(self.spec)
+        return self._digest
+
+    @classmethod
+    def of(cls, spec):
+        """Return `spec` unchanged if it is already indexed, otherwise index it."""
+        if isinstance(spec, cls):
+            return spec
+        return cls(spec)
+
+    def operations(self):
+        """Iterate (path, method, operation) in document order."""
+        for path, ops in self.paths.items():
+            for method, operation in ops.items():
+                yield path, method, operation
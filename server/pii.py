@@ -0,0 +1,89 @@
+"""
+Compiled PII field-name matcher.
+All patterns are folded into a single alternation regex built once, and
+classification results are memoized per field name, so scanning a large
+spec costs one regex search per distinct field instead of ~45 substring
+scans per occurrence.
+
+Patterns are configurable per deployment:
+- PII_PATTERNS:        comma-separated list that replaces the defaults
+- PII_EXTRA_PATTERNS:  comma-separated list appended to the defaults
+- PII_PATTERNS_FILE:   file with one extra pattern per line (# comments allowed)
+"""
+import os
+import re
+from functools import lru_cache
+
+# --- Known PII field patterns ---
+DEFAULT_PII_PATTERNS = [
+    "ssn", "social_security", "tax_id", "tin",
+    "email", "phone", "mobile", "telephone",
+    "address", "street", "city", "zip", "postal",
+    "date_of_birth", "dob", "birthday",
+    "password", "secret", "token", "api_key",
+    "credit_card", "card_number", "cvv", "expiry",
+    "bank_account", "routing_number", "iban", "swift",
+    "passport", "license_number", "drivers_license",
+    "first_name", "last_name", "full_name", "name",
+    "ip_address", "device_id", "mac_address",
+    "salary", "income", "account_balance",
+]
+
+PII_CACHE_SIZE = int(os.getenv("PII_CACHE_SIZE", "8192"))
+
+
+def _split_patterns(value):
+    return [p.strip().lower() for p in value.split(",") if p.strip()]
+
+
+def load_configured_patterns():
+    """Resolve the deployment's pattern list from the environment."""
+    override = os.getenv("PII_PATTERNS")
+    patterns = _split_patterns(override) if override else list(DEFAULT_PII_PATTERNS)
+    patterns.extend(_split_patterns(os.getenv("PII_EXTRA_PATTERNS", "")))
+
+    patterns_file = os.getenv("PII_PATTERNS_FILE")
+    if patterns_file:
+        with open(patterns_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip().lower()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+    return patterns
+
+
+class PIIMatcher:
+    """
+    Single-regex matcher over a list of substring patterns.
+    Alternatives are ordered longest-first so the reported pattern is the most
+    specific one at the leftmost match position ("first_name" rather than "name").
+    """
+
+    def __init__(self, patterns, cache_size=PII_CACHE_SIZE):
+        self.patterns = list(dict.fromkeys(p.lower().replace("-", "_") for p in patterns if p))
+        ordered = sorted(self.patterns, key=len, reverse=True)
+        self._regex = re.compile("|".join(re.escape(p) for p in ordered)) if ordered else None
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, field_name):
+        """Return the pattern that classifies `field_name` as PII, or None."""
+        if self._regex is None or not field_name:
+            return None
+        m = self._regex.search(field_name.lower().replace("-", "_"))
+        return m.group(0) if m else None
+
+
+PII_PATTERNS = load_configured_patterns()
+_matcher = PIIMatcher(PII_PATTERNS)
+
+
+def set_pii_patterns(patterns):
+    """Recompile the module matcher with a new pattern list (drops the memo cache)."""
+    global _matcher, PII_PATTERNS
+    PII_PATTERNS = list(patterns)
+    _matcher = PIIMatcher(PII_PATTERNS)
+
+
+def match_pii_field(field_name):
+    """Return the matching PII pattern for a field name, or None."""
+    return _matcher.match(field_name)
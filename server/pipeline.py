@@ -0,0 +1,228 @@
+"""
+Analysis pipeline steps shared by the Flask app, the asyncio server and the
+background jobs: deterministic preparation, per-field streaming events,
+final validation and the cached result record.
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import nullcontext
+
+from admission import admission_gate
+from ai_analyzer_local import PROMPT_VERSION, GENERATION_PAYLOAD
+from backends import analyze_prompts, llm_router
+from cache import analysis_key, analysis_cache
+from diff_engine import compare_specs
+from fallback import deterministic_analysis
+from insights import spec_scope, split_known, remember, combine
+from prompts import build_prompts, collect_facts
+from risk_scorer import calculate_risk_score
+from singleflight import SingleFlight
+from utils import extract_json, validate_ai_output, validate_ai_field
+
+# Identical prompts already being generated share one upstream LLM call;
+# new generations pass the admission gate first
+analysis_flights = SingleFlight(analyze_prompts, admission_gate.admit)
+
+# Seconds a request waits for the AI before answering with the deterministic
+# summary (the AI keeps running and caches its result); 0 waits indefinitely
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", "30"))
+
+
+def deadline_seconds(requested=None):
+    """Latency budget for one request (`requested` overrides the default); None = no deadline."""
+    deadline = ANALYSIS_DEADLINE if requested is None else requested
+    return deadline if deadline > 0 else None
+
+
+def _phase(timer, name):
+    return timer.phase(name) if timer else nullcontext()
+
+
+def prepare_analysis(old_index, new_index, timer=None):
+    """
+    Everything the AI phase needs, computed up front so callers can drop the
+    parsed specs before a long LLM generation. `timer` (metrics.PhaseTimer)
+    records the diff, insights and prompt phases.
+    """
+    with _phase(timer, "diff"):
+        diff_result = compare_specs(old_index, new_index)
+    with _phase(timer, "insights"):
+        scope = spec_scope(new_index)
+        known, unseen = split_known(collect_facts(diff_result), scope)
+    new_changes = sum(len(items) for items in unseen.values())
+
+    # Only changes without cached insights go to the LLM: one prompt, or
+    # several when they exceed the token budget. A diff with no changes at
+    # all still gets its (short) analysis.
+    shown = []
+    prompts = []
+    if new_changes or not known:
+        with _phase(timer, "prompt"):
+            prompts = build_prompts(diff_result, new_index, facts=unseen, reused=len(known), shown=shown)
+    return {
+        "diff": diff_result,
+        "preliminary": calculate_risk_score(diff_result, {}),
+        "prompts": prompts,
+        "delta": {"scope": scope, "sent": shown, "known": known, "new_changes": new_changes},
+    }
+
+
+def complete_analysis(prepared, ai_analysis):
+    """Cache insights for the changes the LLM just analyzed and merge in the reused ones."""
+    delta = prepared["delta"]
+    if ai_analysis is not None and "error" not in ai_analysis:
+        remember(delta["sent"], delta["scope"], ai_analysis)
+    return combine(ai_analysis, delta["known"], delta["new_changes"])
+
+
+def analyze_prepared(prepared, deadline=None, cache_key=None, bounded=True, timer=None):
+    """
+    Blocking AI phase for a prepared analysis (coalesced with identical
+    in-flight ones). If the AI has no result after `deadline` seconds the
+    deterministic summary is returned instead, and the late AI result is
+    cached under `cache_key` when it arrives. Raises AdmissionRejected if the
+    LLM queue is full, unless `bounded` is False.
+    """
+    prompts = prepared["prompts"]
+    if not prompts:
+        return complete_analysis(prepared, None)
+    flight = analysis_flights.join(prompt_key(prompts), prompts, bounded)
+    with _phase(timer, "ai"):
+        flight.wait(deadline)
+    if timer:
+        flight_phases(timer, flight)
+    if flight.done:
+        return complete_analysis(prepared, flight.result)
+    return fall_back(prepared, flight, cache_key)
+
+
+def fall_back(prepared, flight, cache_key):
+    """Deterministic analysis for a flight that missed its deadline; its late result fills the cache."""
+    flight.add_done_callback(lambda ai_analysis: cache_late_result(prepared, ai_analysis, cache_key))
+    return deterministic_analysis(prepared["diff"])
+
+
+def cache_late_result(prepared, ai_analysis, cache_key):
+    ai_analysis = complete_analysis(prepared, ai_analysis)
+    if cache_key and "error" not in ai_analysis:
+        analysis_cache.put(cache_key, result_record(prepared["diff"], ai_analysis))
+
+
+def flight_phases(timer, flight):
+    """
+    Add the flight's queue wait, time to first token and generation time to
+    `timer` (as far as it got). They describe the shared generation, so they
+    are reported but not observed again per coalesced request.
+    """
+    end = flight.finished_at or time.monotonic()
+    if flight.started_at is None:
+        timer.add("queue", end - flight.created_at, observe=False)
+        return
+    timer.add("queue", flight.started_at - flight.created_at, observe=False)
+    if flight.first_token_at is not None:
+        timer.add("ttft", flight.first_token_at - flight.started_at, observe=False)
+    timer.add("generation", end - flight.started_at, observe=False)
+
+
+def cache_key_for(old_index, new_index):
+    return analysis_key(old_index, new_index, llm_router.identity, PROMPT_VERSION)
+
+
+def prompt_key(prompts):
+    """Identity of one analysis: same model, settings and prompt texts."""
+    h = hashlib.sha256()
+    h.update(json.dumps([llm_router.identity, GENERATION_PAYLOAD], sort_keys=True).encode("utf-8"))
+    for prompt in prompts:
+        h.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+def field_event(diff_result, key, value):
+    """Validate one completed top-level AI field into an `ai_field` SSE event."""
+    value, warnings = validate_ai_field(key, value)
+    event = {"type": "ai_field", "key": key, "value": value}
+    if warnings:
+        event["warnings"] = warnings
+    if key == "risk_level":
+        early = calculate_risk_score(diff_result, {"risk_level": value})
+        event["risk_score"] = early["score"]
+        event["risk_breakdown"] = early["breakdown"]
+    return event
+
+
+def generation_event(diff_result, event):
+    """Translate an event published by analyze_prompt into its /analyze/stream SSE event."""
+    if event["type"] == "token":
+        return {"type": "ai_token", "token": event["token"], "done": event["done"]}
+    if event["type"] == "field":
+        return field_event(diff_result, event["key"], event["value"])
+    if event["type"] == "prefill":
+        return {**event, "type": "ai_prefill"}
+    if event["type"] == "part":
+        return {"type": "ai_part", "done": event["done"], "total": event["total"]}
+    if event["type"] == "hedge":
+        return {"type": "ai_hedge", "backend": event["backend"]}
+    if event["type"] == "queued":
+        return {"type": "ai_queued", "position": event["position"]}
+    return {"type": "ai_retry", "attempt": event["attempt"]}
+
+
+def finalize_ai_output(parser, parts):
+    """Validated AI analysis from a finished token stream."""
+    # A member the parser couldn't read alone goes through the whole-text pass
+    ai_raw = parser.fields if parser.complete and not parser.malformed else extract_json("".join(parts))
+    if "error" in ai_raw:
+        return ai_raw
+    ai_analysis, warnings = validate_ai_output(ai_raw)
+    if warnings:
+        ai_analysis["_validation_warnings"] = warnings
+    return ai_analysis
+
+
+def result_record(diff_result, ai_analysis):
+    """The /analyze response body (also what the analysis cache stores)."""
+    # A deterministic fallback must not move the score: no AI adjustment
+    final = calculate_risk_score(diff_result, {} if "_fallback" in ai_analysis else ai_analysis)
+    return {
+        "diff": diff_result,
+        "ai_analysis": ai_analysis,
+        "risk_score": final["score"],
+        "risk_breakdown": final["breakdown"],
+    }
+
+
+def diff_event(diff_result, preliminary):
+    return {
+        "type": "diff",
+        "diff": diff_result,
+        "risk_score": preliminary["score"],
+        "risk_breakdown": preliminary["breakdown"],
+    }
+
+
+def done_event(record):
+    return {
+        "type": "ai_done",
+        "ai_analysis": record["ai_analysis"],
+        "risk_score": record["risk_score"],
+        "risk_breakdown": record["risk_breakdown"],
+    }
+
+
+def error_done_event(message, preliminary):
+    return {
+        "type": "ai_done",
+        "ai_analysis": {"error": message},
+        "risk_score": preliminary["score"],
+        "risk_breakdown": preliminary["breakdown"],
+    }
+
+
+def replay_events(cached):
+    """Cache hit: the stored result as the same diff / ai_done events."""
+    return [
+        {**diff_event(cached["diff"], {"score": cached["risk_score"], "breakdown": cached["risk_breakdown"]}), "cached": True},
+        {**done_event(cached), "cached": True},
+    ]
@@ -0,0 +1,351 @@
+"""
+Token-budgeted prompt building for the AI analysis.
+
+The diff is flattened once into short, de-duplicated fact lines grouped by
+priority (breaking changes first, governance nits last) and rendered as
+compact text, with a bounded summary of the new spec. When everything fits
+PROMPT_TOKEN_BUDGET the analysis is a single prompt; otherwise the facts are
+split into up to MAX_PROMPT_PARTS prompts (map), analyzed in parallel, and
+the validated partial results are merged into one analysis (reduce).
+Whatever still does not fit is truncated with counts, never silently dropped.
+
+Every prompt starts with the same static PROMPT_PREFIX (rules + output
+template) so backends can cache its prefill across requests.
+"""
+import os
+
+from parser import SpecIndex
+
+# Rough prompt budget in tokens; leaves room for the answer in a 4k context
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+MAX_PROMPT_PARTS = int(os.getenv("MAX_PROMPT_PARTS", "8"))
+# Cheap token estimate; close enough for budgeting English + identifiers
+CHARS_PER_TOKEN = 4
+# Share of the budget the spec summary may take when facts need the room
+SPEC_SUMMARY_SHARE = 0.25
+
+# (key, heading) in priority order
+FACT_SECTIONS = (
+    ("breaking", "BREAKING CHANGES"),
+    ("pii", "PII FIELDS ALREADY DETECTED BY SCANNER"),
+    ("changes", "OTHER CHANGES"),
+    ("governance", "GOVERNANCE ISSUES ALREADY DETECTED"),
+)
+
+RISK_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+PROMPT_RULES = """You are an API governance analyst. You must base ALL claims on the data that follows.
+
+RULES:
+1. Return ONLY valid JSON — no explanation, no markdown, no commentary.
+2. Do NOT invent endpoints, fields, or issues not present in the data.
+3. Your risk_level MUST match the severity of actual changes listed in the data.
+4. pii_fields should ONLY contain fields you can identify from the schema/paths in the data.
+5. recommendations must be specific and actionable, referencing actual endpoints.
+6. Output must start with { and end with }."""
+
+OUTPUT_TEMPLATE = """Return this JSON:
+
+{
+  "risk_level": "LOW or MEDIUM or HIGH",
+  "pii_fields": [],
+  "breaking_change_explanation": "Explain ONLY actual breaking changes from the diff",
+  "documentation_score": 5,
+  "recommendations": ["specific actionable items referencing real endpoints"],
+  "executive_summary": "2-3 sentence summary of actual findings"
+}"""
+
+# Every prompt starts with these exact bytes and only per-request data
+# follows, so the backend can reuse the prefix's prefill (KV / context cache)
+PROMPT_PREFIX = f"{PROMPT_RULES}\n\n{OUTPUT_TEMPLATE}\n\n"
+PROMPT_SUFFIX = "Based ONLY on the above data, return the JSON object now."
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _operation(method, path):
+    return f"{method.upper()} {path}"
+
+
+def collect_facts(diff_result):
+    """
+    Flatten a compare_specs result into {section: [(line, path or None)]},
+    each line stated once. Raw structural changes are only used for edits
+    not already covered by a more specific fact (summaries, descriptions...).
+    """
+    facts = {key: {} for key, _ in FACT_SECTIONS}
+
+    def add(section, line, path=None):
+        facts[section].setdefault(line, path)
+
+    for path in diff_result.get("removed_endpoints", []):
+        add("breaking", f"removed endpoint {path}", path)
+    for change in diff_result.get("method_changes", []):
+        for method in change.get("removed_methods", []):
+            add("breaking", f"removed method {_operation(method, change['path'])}", change["path"])
+    for change in diff_result.get("parameter_changes", []):
+        for name in change.get("removed_params", []):
+            add("breaking", f"removed parameter '{name}' from {_operation(change['method'], change['path'])}", change["path"])
+    for change in diff_result.get("response_changes", []):
+        for code in change.get("removed_responses", []):
+            add("breaking", f"removed response {code} from {_operation(change['method'], change['path'])}", change["path"])
+    for change in diff_result.get("body_changes", []):
+        where = f"{_operation(change['method'], change['path'])} {change['location']}"
+        for field in change.get("removed_fields", []):
+            add("breaking", f"removed body field '{field}' from {where}", change["path"])
+
+    schema_changes = diff_result.get("schema_changes", {})
+    for name in schema_changes.get("removed_schemas", []):
+        add("breaking", f"removed schema {name}")
+    for change in schema_changes.get("field_changes", []):
+        for field in change.get("removed_fields", []):
+            add("breaking", f"removed field {change['schema']}.{field}")
+    for change in schema_changes.get("type_changes", []):
+        add("breaking", f"type changed at {change['pointer']}: {change.get('old')} -> {change.get('new')}")
+    for change in schema_changes.get("enum_changes", []):
+        if change.get("removed_values"):
+            add("breaking", f"enum values removed at {change['pointer']}: {change['removed_values']}")
+    for change in schema_changes.get("required_changes", []):
+        if change.get("added_required"):
+            add("breaking", f"newly required at {change['pointer']}: {change['added_required']}")
+        if change.get("now_required"):
+            add("breaking", f"now required: {change['pointer']}")
+
+    pii_matches = diff_result.get("pii_matches", {})
+    for location in diff_result.get("pii_fields_detected", []):
+        pattern = pii_matches.get(location)
+        add("pii", f"{location} (matches '{pattern}')" if pattern else location)
+
+    for path in diff_result.get("added_endpoints", []):
+        add("changes", f"added endpoint {path}", path)
+    for change in diff_result.get("method_changes", []):
+        for method in change.get("added_methods", []):
+            add("changes", f"added method {_operation(method, change['path'])}", change["path"])
+    for change in diff_result.get("parameter_changes", []):
+        for name in change.get("added_params", []):
+            add("changes", f"added parameter '{name}' to {_operation(change['method'], change['path'])}", change["path"])
+    for change in diff_result.get("response_changes", []):
+        for code in change.get("added_responses", []):
+            add("changes", f"added response {code} to {_operation(change['method'], change['path'])}", change["path"])
+    for change in diff_result.get("body_changes", []):
+        where = f"{_operation(change['method'], change['path'])} {change['location']}"
+        for field in change.get("added_fields", []):
+            add("changes", f"added body field '{field}' to {where}", change["path"])
+    for name in schema_changes.get("added_schemas", []):
+        add("changes", f"added schema {name}")
+    for change in schema_changes.get("field_changes", []):
+        for field in change.get("added_fields", []):
+            add("changes", f"added field {change['schema']}.{field}")
+    for change in schema_changes.get("enum_changes", []):
+        if change.get("added_values") and not change.get("removed_values"):
+            add("changes", f"enum values added at {change['pointer']}: {change['added_values']}")
+    for change in schema_changes.get("required_changes", []):
+        if change.get("removed_required"):
+            add("changes", f"no longer required at {change['pointer']}: {change['removed_required']}")
+        if change.get("now_required") is False:
+            add("changes", f"now optional: {change['pointer']}")
+    for change in diff_result.get("structural_changes", []):
+        leaf = change["pointer"].rpartition("/")[2]
+        if change["change"] == "modified" and "old" in change and leaf not in ("type", "enum", "required"):
+            add("changes", f"changed {change['pointer']}: {change.get('old')!r} -> {change.get('new')!r}")
+
+    for issue in diff_result.get("naming_issues", []):
+        add("governance", f"naming: {issue}")
+    for item in diff_result.get("missing_descriptions", []):
+        add("governance", f"missing description: {item}")
+
+    return {section: list(lines.items()) for section, lines in facts.items()}
+
+
+def _split_facts(facts, budget, max_parts):
+    """Greedily pack facts (in priority order) into at most `max_parts` chunks of ~`budget` tokens."""
+    chunks = [{key: [] for key, _ in FACT_SECTIONS}]
+    used = 0
+    for section, _ in FACT_SECTIONS:
+        for line, path in facts[section]:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget and used and len(chunks) < max_parts:
+                chunks.append({key: [] for key, _ in FACT_SECTIONS})
+                used = 0
+            chunks[-1][section].append((line, path))
+            used += cost
+    return chunks
+
+
+def _render_facts(facts, budget, shown=None):
+    """
+    Fact lines under their section headings, truncated to `budget` tokens with
+    counts. Appends (section, line) for every fact included to `shown`.
+    """
+    lines = []
+    used = 0
+    for section, heading in FACT_SECTIONS:
+        items = facts[section]
+        if not items:
+            continue
+        lines.append(f"{heading}:")
+        used += estimate_tokens(heading)
+        count = 0
+        for line, _ in items:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            lines.append(f"- {line}")
+            used += cost
+            count += 1
+            if shown is not None:
+                shown.append((section, line))
+        if count < len(items):
+            lines.append(f"- ... and {len(items) - count} more not shown")
+    return "\n".join(lines) if lines else "No major changes detected by automated scanner."
+
+
+def _spec_summary_lines(index, focus_paths):
+    """One line per operation (changed paths first)."""
+    ordered = [p for p in index.paths if p in focus_paths] + [p for p in index.paths if p not in focus_paths]
+    lines = []
+    for path in ordered:
+        for method in index.paths[path]:
+            summary = index.summaries[(path, method)] or ""
+            params = ", ".join(index.parameters[(path, method)])
+            line = _operation(method, path)
+            if summary:
+                line += f": {summary}"
+            if params:
+                line += f" [params: {params}]"
+            lines.append(line)
+    return lines
+
+
+def _render_spec(operations, schema_names, budget):
+    lines = []
+    used = 0
+    for line in operations:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if len(lines) < len(operations):
+        lines.append(f"... and {len(operations) - len(lines)} more operations not shown")
+
+    schemas = []
+    for name in schema_names:
+        cost = estimate_tokens(name) + 1
+        if used + cost > budget:
+            break
+        schemas.append(name)
+        used += cost
+    if schema_names:
+        text = ", ".join(schemas)
+        if len(schemas) < len(schema_names):
+            text += f", ... and {len(schema_names) - len(schemas)} more"
+        lines.append(f"SCHEMAS: {text}")
+    return "\n".join(lines)
+
+
+def _scope_note(part, reused=0):
+    note = ""
+    if part is not None:
+        number, total = part
+        note += (f"This is PART {number} OF {total} of a large diff. Analyze ONLY the changes "
+                 f"listed in this part; other parts are analyzed separately and merged.\n\n")
+    if reused:
+        note += (f"{reused} other changes were already analyzed in earlier comparisons and are "
+                 f"not listed; analyze ONLY the changes below.\n\n")
+    return note
+
+
+def _fixed_tokens(part, reused=0):
+    # Template text plus headings and slack for truncation notes
+    return estimate_tokens(PROMPT_PREFIX) + estimate_tokens(PROMPT_SUFFIX) + estimate_tokens(_scope_note(part, reused)) + 64
+
+
+def _spec_budget(spec_tokens, fact_tokens, available):
+    """The spec summary gets what the facts leave, but at least SPEC_SUMMARY_SHARE of the budget."""
+    return min(spec_tokens, max(available - fact_tokens, int(available * SPEC_SUMMARY_SHARE)))
+
+
+def _cost(lines):
+    return sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def _facts_cost(facts):
+    """Tokens _render_facts needs to show every fact, headings included."""
+    return sum(estimate_tokens(heading) + _cost(line for line, _ in facts[section])
+               for section, heading in FACT_SECTIONS if facts[section])
+
+
+def _render_prompt(facts, index, budget, part=None, reused=0, shown=None):
+    focus_paths = {path for items in facts.values() for _, path in items if path}
+    operations = _spec_summary_lines(index, focus_paths)
+    schema_names = list(index.schemas)
+
+    available = max(budget - _fixed_tokens(part, reused), 0)
+    fact_tokens = _facts_cost(facts)
+    spec_budget = _spec_budget(_cost(operations) + _cost(schema_names), fact_tokens, available)
+
+    return f"""{PROMPT_PREFIX}{_scope_note(part, reused)}=== AUTOMATED SCAN RESULTS (ground truth) ===
+{_render_facts(facts, available - spec_budget, shown)}
+
+=== NEW API SPEC (summary) ===
+{_render_spec(operations, schema_names, spec_budget)}
+
+{PROMPT_SUFFIX}"""
+
+
+def build_prompts(diff_result, new_spec, budget=PROMPT_TOKEN_BUDGET, max_parts=MAX_PROMPT_PARTS,
+                  facts=None, reused=0, shown=None):
+    """
+    Prompts for one analysis: a single prompt when the whole diff fits the
+    budget, otherwise one prompt per chunk of facts (map-reduce).
+    Pass `facts` to analyze only some changes (e.g. the ones not seen before)
+    and `reused` to tell the model how many others were left out; `shown`
+    collects the (section, line) of every fact that made it into a prompt.
+    """
+    index = SpecIndex.of(new_spec)
+    if facts is None:
+        facts = collect_facts(diff_result)
+    fact_tokens = _facts_cost(facts)
+    spec_tokens = _cost(_spec_summary_lines(index, ())) + _cost(index.schemas)
+
+    # Fits as one prompt if the facts leave the spec summary at least its share
+    available = max(budget - _fixed_tokens(None, reused), 0)
+    if fact_tokens <= available - min(spec_tokens, int(available * SPEC_SUMMARY_SHARE)) or max_parts <= 1:
+        return [_render_prompt(facts, index, budget, reused=reused, shown=shown)]
+
+    part_available = max(budget - _fixed_tokens((max_parts, max_parts), reused), 0)
+    headings = sum(estimate_tokens(heading) for _, heading in FACT_SECTIONS)
+    fact_budget = max(part_available - min(spec_tokens, int(part_available * SPEC_SUMMARY_SHARE)) - headings, 1)
+    chunks = _split_facts(facts, fact_budget, max_parts)
+    if len(chunks) == 1:
+        return [_render_prompt(facts, index, budget, reused=reused, shown=shown)]
+    return [_render_prompt(chunk, index, budget, (i + 1, len(chunks)), reused, shown) for i, chunk in enumerate(chunks)]
+
+
+def merge_analyses(partials):
+    """
+    Reduce validated per-part analyses into one: the highest risk level,
+    the union of PII fields and recommendations, the lowest documentation
+    score, and explanations / summaries concatenated in part order.
+    """
+    ok = [p for p in partials if "error" not in p]
+    if not ok:
+        return partials[0]
+
+    merged = {
+        "risk_level": max((p["risk_level"] for p in ok), key=lambda r: RISK_ORDER.get(r, 1)),
+        "pii_fields": list(dict.fromkeys(f for p in ok for f in p["pii_fields"])),
+        "breaking_change_explanation": " ".join(dict.fromkeys(p["breaking_change_explanation"] for p in ok)),
+        "documentation_score": min(p["documentation_score"] for p in ok),
+        "recommendations": list(dict.fromkeys(r for p in ok for r in p["recommendations"])),
+        "executive_summary": " ".join(dict.fromkeys(p["executive_summary"] for p in ok)),
+    }
+    warnings = [w for p in ok for w in p.get("_validation_warnings", [])]
+    if len(ok) < len(partials):
+        warnings.append(f"{len(partials) - len(ok)} of {len(partials)} analysis parts failed and were skipped")
+    if warnings:
+        merged["_validation_warnings"] = list(dict.fromkeys(warnings))
+    return merged
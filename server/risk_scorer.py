@@ -18,6 +18,10 @@ def calculate_risk_score(diff, ai_analysis):
     - Removed responses:     1 pt each  (contract change)
     - Schema removals:       2 pts each (breaking)
     - Schema field removals: 1 pt each  (breaking)
+    - Response field removals: 1 pt each (breaking)
+    - Type changes:          1 pt each  (breaking)
+    - Enum narrowing:        1 pt each  (enum lost values)
+    - Newly required fields: 1 pt each  (breaking for callers)
     - PII fields detected:   1 pt each  (security risk, max 3)
     - Missing descriptions:  0.5 pt each (governance, max 2)
     - Naming issues:         0.5 pt each (anti-pattern, max 1)
@@ -70,6 +74,31 @@ def calculate_risk_score(diff, ai_analysis):
     score += removed_fields * 1
     breakdown["removed_fields"] = removed_fields * 1
 
+    # Breaking: fields removed from response bodies (resolved through $ref)
+    removed_body_fields = sum(
+        len(bc.get("removed_fields", []))
+        for bc in diff.get("body_changes", [])
+        if bc.get("location", "").startswith("response")
+    )
+    score += removed_body_fields * 1
+    breakdown["removed_response_fields"] = removed_body_fields * 1
+
+    # Breaking: type changes, enum narrowing, newly required fields/params
+    type_changes = len(schema_changes.get("type_changes", []))
+    score += type_changes * 1
+    breakdown["type_changes"] = type_changes * 1
+
+    enum_narrowing = sum(1 for ec in schema_changes.get("enum_changes", []) if ec.get("removed_values"))
+    score += enum_narrowing * 1
+    breakdown["enum_narrowing"] = enum_narrowing * 1
+
+    newly_required = sum(
+        len(rc.get("added_required", [])) + (1 if rc.get("now_required") else 0)
+        for rc in schema_changes.get("required_changes", [])
+    )
+    score += newly_required * 1
+    breakdown["newly_required"] = newly_required * 1
+
     # Security: PII exposure (capped at 3 pts)
     pii_count = len(diff.get("pii_fields_detected", []))
     pii_score = min(pii_count * 1, 3)
@@ -0,0 +1,278 @@
+"""
+Single-flight coalescing of identical in-flight AI analyses.
+When several callers submit the same prompt(s) while a generation for it is
+still running (e.g. a monorepo fanning out the same spec pair), they join
+the existing flight instead of starting another upstream LLM call.
+
+A flight records every event its generation publishes, so subscribers that
+join mid-stream first get a replay of the tokens so far, then follow live.
+Flights are removed as soon as they finish; later identical requests are
+served by the analysis cache instead. Callers may stop waiting at a deadline;
+the flight keeps running and its done callbacks still get the result.
+
+With an `admit` hook (admission.AdmissionGate.admit) a new flight first
+reserves its place in the gate, which may refuse it, then waits for its slot
+before generating; joining an existing flight never needs a new place.
+"""
+import asyncio
+import threading
+import time
+
+
+class Flight:
+    """One running generation: its published events and, once done, its result."""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.result = None
+        self.done = False
+        # Monotonic timestamps: created, generation started (after admission),
+        # first token published, finished
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self._callbacks = []
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            if self.first_token_at is None and event["type"] == "token":
+                self.first_token_at = time.monotonic()
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, result):
+        with self._cond:
+            self.finished_at = time.monotonic()
+            self.result = result
+            self.done = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(result)
+
+    def add_done_callback(self, callback):
+        """Call `callback(result)` once the flight finishes (right away if it has)."""
+        with self._cond:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self.result)
+
+    def follow(self, timeout=None):
+        """
+        Every event from the start of the flight, blocking for new ones until
+        it finishes or `timeout` seconds have passed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.events) and not self.done:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self._cond.wait(remaining)
+                events = self.events[index:]
+                finished = self.done
+            index += len(events)
+            for event in events:
+                yield event
+            if finished and index >= len(self.events):
+                return
+
+    def wait(self, timeout=None):
+        """Block until the flight finishes (or `timeout`); returns its result, None if unfinished."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done, timeout)
+            return self.result
+
+
+class SingleFlight:
+    """
+    Runs `runner(prompts, publish)` at most once per key at a time, on its own
+    thread so no single caller (or its disconnect) owns the generation.
+    """
+
+    def __init__(self, runner, admit=None):
+        self.runner = runner
+        self.admit = admit
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key, prompts, bounded=True):
+        """
+        The in-flight Flight for `key`, starting one if none is running.
+        Raises admission.AdmissionRejected if a new flight can't be queued
+        (`bounded=False` queues it regardless).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                ticket = self.admit(prompts, bounded) if self.admit else None
+                flight = Flight(key)
+                self._flights[key] = flight
+                self.started += 1
+                threading.Thread(target=self._run, args=(flight, prompts, ticket),
+                                 name="analysis-flight", daemon=True).start()
+            else:
+                self.coalesced += 1
+        return flight
+
+    def run(self, key, prompts):
+        """Join (or start) the flight for `key` and wait for its result."""
+        return self.join(key, prompts).wait()
+
+    def _run(self, flight, prompts, ticket=None):
+        try:
+            if ticket is not None and not ticket.granted:
+                flight.publish({"type": "queued", "position": ticket.position})
+                ticket.wait()
+            flight.started_at = time.monotonic()
+            result = self.runner(prompts, flight.publish)
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            if ticket is not None:
+                ticket.release()
+        with self._lock:
+            self._flights.pop(flight.key, None)
+        flight.finish(result)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
+
+
+class AsyncFlight:
+    """Event-loop counterpart of Flight for the asyncio server."""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.result = None
+        self.done = False
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self._callbacks = []
+        self._changed = asyncio.Event()
+
+    def publish(self, event):
+        if self.first_token_at is None and event["type"] == "token":
+            self.first_token_at = time.monotonic()
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, result):
+        self.finished_at = time.monotonic()
+        self.result = result
+        self.done = True
+        self._notify()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(result)
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self.result)
+        else:
+            self._callbacks.append(callback)
+
+    def _notify(self):
+        # Wake current waiters, then arm a fresh event for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _changed_within(self, deadline):
+        """Wait for the next change; False once `deadline` (monotonic) has passed."""
+        if deadline is None:
+            await self._changed.wait()
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._changed.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def follow(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            if index >= len(self.events) and not self.done:
+                if not await self._changed_within(deadline):
+                    return
+                continue
+            events = self.events[index:]
+            index += len(events)
+            for event in events:
+                yield event
+            if self.done and index >= len(self.events):
+                return
+
+    async def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done:
+            if not await self._changed_within(deadline):
+                break
+        return self.result
+
+
+class AsyncSingleFlight:
+    """Runs the coroutine `runner(prompts, publish)` at most once per key at a time."""
+
+    def __init__(self, runner, admit=None):
+        self.runner = runner
+        self.admit = admit
+        self._flights = {}
+        self._tasks = set()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key, prompts, bounded=True):
+        flight = self._flights.get(key)
+        if flight is None:
+            ticket = self.admit(prompts, bounded) if self.admit else None
+            flight = AsyncFlight(key)
+            self._flights[key] = flight
+            self.started += 1
+            task = asyncio.get_running_loop().create_task(self._run(flight, prompts, ticket))
+            # Keep a reference so the task isn't garbage-collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.coalesced += 1
+        return flight
+
+    async def run(self, key, prompts):
+        return await self.join(key, prompts).wait()
+
+    async def _run(self, flight, prompts, ticket=None):
+        # Stays the result if the task is cancelled (CancelledError isn't an Exception)
+        result = {"error": "Analysis was cancelled"}
+        try:
+            if ticket is not None and not ticket.granted:
+                flight.publish({"type": "queued", "position": ticket.position})
+                await ticket.wait_async()
+            flight.started_at = time.monotonic()
+            result = await self.runner(prompts, flight.publish)
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            if ticket is not None:
+                ticket.release()
+            # Even when cancelled: followers must not wait on it, and the next
+            # identical request must start a new flight
+            self._flights.pop(flight.key, None)
+            flight.finish(result)
+
+    def stats(self):
+        return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
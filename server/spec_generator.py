@@ -0,0 +1,282 @@
+"""
+Seeded synthetic OpenAPI specs for benchmarks and load tests.
+
+generate_spec builds an OpenAPI 3 document with a given number of operations
+(path + method pairs), parameters, component schemas with nested objects,
+a configurable share of $ref'd (vs inline) schemas, PII-looking field names,
+some undocumented operations and a few badly named paths. mutate_spec
+derives the "next version": a `change_rate` share of operations, parameters
+and schema fields is removed, retyped, made required or enum-narrowed, and
+new endpoints are added, so every detector in compare_specs has work to do.
+
+The same seed and options always give the same documents.
+
+Usage:
+    python spec_generator.py --operations 1000 --change-rate 0.05 --out-dir /tmp/specs
+"""
+import argparse
+import copy
+import json
+import os
+import random
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper
+
+METHODS = ("get", "post", "put", "patch", "delete")
+BODY_METHODS = ("post", "put", "patch")
+RESOURCES = ("customer", "order", "invoice", "product", "account", "payment", "shipment", "user",
+             "review", "ticket", "subscription", "address", "device", "session", "report", "coupon")
+FIELD_NAMES = ("id", "name", "status", "created_at", "updated_at", "amount", "currency", "quantity",
+               "description", "notes", "reference", "priority", "category", "tags", "url", "version")
+PII_NAMES = ("email", "phone", "ssn", "date_of_birth", "first_name", "last_name", "passport_number",
+             "credit_card", "ip_address", "home_address")
+# REST naming anti-patterns (camelCase, verbs) for the naming-issue detector
+BAD_SEGMENTS = ("getAll", "create", "listItems", "fetch", "updateStatus")
+TYPES = ("string", "integer", "number", "boolean")
+ENUM_VALUES = ("active", "pending", "suspended", "closed", "archived", "draft")
+
+
+def _field_name(rng, pii_rate):
+    if rng.random() < pii_rate:
+        return rng.choice(PII_NAMES)
+    return rng.choice(FIELD_NAMES)
+
+
+def _property(rng, depth, pii_rate):
+    """A scalar (sometimes enum) property, or a nested object while `depth` allows."""
+    if depth > 0 and rng.random() < 0.25:
+        return _object(rng, rng.randint(2, 4), depth - 1, pii_rate)
+    prop = {"type": rng.choice(TYPES)}
+    if prop["type"] == "string" and rng.random() < 0.15:
+        prop["enum"] = rng.sample(ENUM_VALUES, rng.randint(3, len(ENUM_VALUES)))
+    if rng.random() < 0.7:
+        prop["description"] = "Synthetic field"
+    return prop
+
+
+def _object(rng, fields, depth, pii_rate):
+    properties = {}
+    while len(properties) < fields:
+        name = _field_name(rng, pii_rate)
+        if name in properties:
+            name = f"{name}_{len(properties)}"
+        properties[name] = _property(rng, depth, pii_rate)
+    required = sorted(rng.sample(sorted(properties), max(1, len(properties) // 3)))
+    return {"type": "object", "required": required, "properties": properties}
+
+
+def _schema_ref(rng, schema_names, ref_density, fields, depth, pii_rate):
+    """A body schema: a $ref to a component (with probability `ref_density`) or an inline object."""
+    if schema_names and rng.random() < ref_density:
+        return {"$ref": f"#/components/schemas/{rng.choice(schema_names)}"}
+    return _object(rng, fields, depth, pii_rate)
+
+
+def _parameter(rng, pii_rate, taken):
+    name = _field_name(rng, pii_rate)
+    while name in taken or name == "id":
+        name = f"{name}_{len(taken)}"
+    taken.add(name)
+    return {
+        "name": name,
+        "in": "query",
+        "required": rng.random() < 0.2,
+        "schema": {"type": rng.choice(TYPES)},
+    }
+
+
+def _operation(rng, path, method, options, schema_names):
+    operation = {}
+    # Some operations are left undocumented for the governance check
+    if rng.random() < 0.9:
+        operation["summary"] = f"{method.upper()} {path}"
+    taken = set()
+    parameters = []
+    if "{id}" in path:
+        parameters.append({"name": "id", "in": "path", "required": True, "schema": {"type": "string"}})
+    for _ in range(options["parameters"]):
+        parameters.append(_parameter(rng, options["pii_rate"], taken))
+    if parameters:
+        operation["parameters"] = parameters
+
+    body = lambda: _schema_ref(rng, schema_names, options["ref_density"], options["fields"],
+                               options["depth"], options["pii_rate"])
+    if method in BODY_METHODS:
+        operation["requestBody"] = {"required": True, "content": {"application/json": {"schema": body()}}}
+    responses = {"200": {"description": "Success", "content": {"application/json": {"schema": body()}}}}
+    if "{id}" in path:
+        responses["404"] = {"description": "Not found"}
+    if method in BODY_METHODS:
+        responses["400"] = {"description": "Invalid request"}
+    operation["responses"] = responses
+    return operation
+
+
+def generate_spec(operations=100, seed=0, parameters=3, schemas=None, fields=8, depth=2,
+                  ref_density=0.5, pii_rate=0.08, methods_per_path=3, title="Synthetic API"):
+    """
+    An OpenAPI 3 document with `operations` path+method pairs.
+    `schemas` component schemas (default: one per four operations) have
+    `fields` properties nested up to `depth` levels; `ref_density` is the
+    share of body schemas that $ref a component instead of inlining one.
+    """
+    rng = random.Random(seed)
+    options = {"parameters": parameters, "fields": fields, "depth": depth,
+               "ref_density": ref_density, "pii_rate": pii_rate}
+    schema_count = schemas if schemas is not None else max(1, operations // 4)
+    schema_names = [f"{rng.choice(RESOURCES).title()}{i}" for i in range(schema_count)]
+    components = {name: _object(rng, fields, depth, pii_rate) for name in schema_names}
+    # Components reference each other at the same density as bodies
+    for name in schema_names:
+        if rng.random() < ref_density:
+            components[name]["properties"]["related"] = {"$ref": f"#/components/schemas/{rng.choice(schema_names)}"}
+
+    paths = {}
+    remaining = operations
+    i = 0
+    while remaining > 0:
+        resource = f"{rng.choice(RESOURCES)}s{i}"
+        path = f"/{resource}/{{id}}" if i % 2 else f"/{resource}"
+        if rng.random() < 0.02:
+            path = f"/{resource}/{rng.choice(BAD_SEGMENTS)}"
+        count = min(remaining, rng.randint(1, methods_per_path))
+        paths[path] = {method: _operation(rng, path, method, options, schema_names)
+                       for method in rng.sample(METHODS, count)}
+        remaining -= count
+        i += 1
+
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": title, "version": "1.0.0"},
+        "paths": paths,
+        "components": {"schemas": components},
+    }
+
+
+def _chosen(rng, items, rate):
+    """A seeded `rate` share of `items` (at least one when there are any and rate > 0)."""
+    items = list(items)
+    if not items or rate <= 0:
+        return []
+    return rng.sample(items, max(1, round(len(items) * rate)))
+
+
+def mutate_spec(spec, change_rate=0.05, seed=0):
+    """
+    The next version of `spec` with about `change_rate` of its operations,
+    parameters and schema fields changed (removed, retyped, made required,
+    enum-narrowed), some endpoints removed and some added. `spec` is not modified.
+    """
+    rng = random.Random(seed + 1)
+    new = copy.deepcopy(spec)
+    new["info"]["version"] = "2.0.0"
+    paths = new["paths"]
+    operations = [(path, method) for path, ops in paths.items() for method in ops]
+
+    removed_paths = set(_chosen(rng, list(paths), change_rate / 4))
+    for path in removed_paths:
+        del paths[path]
+    operations = [(path, method) for path, method in operations if path not in removed_paths]
+
+    for path, method in _chosen(rng, operations, change_rate / 2):
+        if len(paths[path]) > 1:
+            del paths[path][method]
+    operations = [(path, method) for path, method in operations if method in paths[path]]
+
+    parameters = [param for path, method in operations for param in paths[path][method].get("parameters", [])
+                  if param.get("in") == "query"]
+    for param in _chosen(rng, parameters, change_rate):
+        change = rng.random()
+        if change < 0.4:
+            param["required"] = True
+        else:
+            param["schema"] = {"type": rng.choice([t for t in TYPES if t != param["schema"]["type"]])}
+    for path, method in _chosen(rng, operations, change_rate / 2):
+        operation = paths[path][method]
+        query = [p for p in operation.get("parameters", []) if p.get("in") == "query"]
+        if query:
+            operation["parameters"].remove(rng.choice(query))
+        codes = [code for code in operation["responses"] if code != "200"]
+        if codes:
+            del operation["responses"][rng.choice(codes)]
+
+    _mutate_schemas(rng, new["components"]["schemas"], change_rate)
+
+    # New endpoints copy existing operations under fresh paths
+    for i, (path, method) in enumerate(_chosen(rng, operations, change_rate / 2)):
+        paths[f"/v2{path}/added{i}"] = {method: copy.deepcopy(spec["paths"][path][method])}
+    return new
+
+
+def _mutate_schemas(rng, schemas, change_rate):
+    fields = [(props, name) for schema in schemas.values()
+              for props in _all_properties(schema) for name in props]
+    for props, name in _chosen(rng, fields, change_rate):
+        if name not in props:
+            continue
+        prop = props[name]
+        change = rng.random()
+        if change < 0.35 or "$ref" in prop or prop.get("type") == "object":
+            del props[name]
+        elif "enum" in prop and change < 0.65:
+            prop["enum"] = prop["enum"][:-1]
+        else:
+            prop["type"] = rng.choice([t for t in TYPES if t != prop.get("type")])
+            prop.pop("enum", None)
+    for schema in _chosen(rng, list(schemas.values()), change_rate):
+        properties = schema["properties"]
+        name = f"added_{len(properties)}"
+        properties[name] = {"type": "string"}
+        schema["required"] = schema.get("required", []) + [name]
+
+
+def _all_properties(schema):
+    """Every `properties` mapping in an object schema, nested ones included."""
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        props = node.get("properties")
+        if isinstance(props, dict):
+            yield props
+            stack.extend(p for p in props.values() if isinstance(p, dict) and p.get("type") == "object")
+
+
+def dump_spec(spec, fmt="yaml"):
+    if fmt == "json":
+        return json.dumps(spec)
+    return yaml.dump(spec, Dumper=SafeDumper, sort_keys=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a seeded pair of synthetic OpenAPI specs.")
+    parser.add_argument("--operations", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parameters", type=int, default=3, help="query parameters per operation")
+    parser.add_argument("--schemas", type=int, default=None, help="component schemas (default operations/4)")
+    parser.add_argument("--fields", type=int, default=8, help="properties per schema object")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of object properties")
+    parser.add_argument("--ref-density", type=float, default=0.5)
+    parser.add_argument("--pii-rate", type=float, default=0.08)
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--format", choices=("yaml", "json"), default="yaml")
+    parser.add_argument("--out-dir", default=".")
+    args = parser.parse_args()
+
+    old = generate_spec(args.operations, args.seed, args.parameters, args.schemas, args.fields,
+                        args.depth, args.ref_density, args.pii_rate)
+    new = mutate_spec(old, args.change_rate, args.seed)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, spec in (("old", old), ("new", new)):
+        path = os.path.join(args.out_dir, f"{name}_synthetic.{args.format}")
+        with open(path, "w") as f:
+            f.write(dump_spec(spec, args.format))
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Structural-hash (Merkle) diff for OpenAPI documents.
+Every dict/list node gets a content hash computed once from its children's
+hashes; the diff descends only into subtrees whose hashes differ, so two
+large specs that differ in a few places cost roughly O(changes) after
+hashing. Each change is reported with its JSON pointer.
+"""
+import hashlib
+
+# Top-level sections that make up the API contract
+CONTRACT_ROOTS = ("paths", "components", "definitions", "parameters", "responses")
+
+
+def escape_pointer_token(token):
+    """Escape one JSON pointer segment (RFC 6901)."""
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _is_scalar(node):
+    return not isinstance(node, (dict, list))
+
+
+class StructuralHasher:
+    """Memoized Merkle hashes for the container nodes of one document."""
+
+    def __init__(self):
+        self._memo = {}
+
+    def hash(self, node):
+        if _is_scalar(node):
+            return b"s" + repr((type(node).__name__, node)).encode("utf-8")
+
+        key = id(node)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached[1]
+
+        digest = hashlib.blake2b(digest_size=16)
+        if isinstance(node, dict):
+            digest.update(b"{")
+            for k in sorted(node, key=str):
+                digest.update(repr(k).encode("utf-8"))
+                digest.update(b":")
+                digest.update(self.hash(node[k]))
+                digest.update(b",")
+        else:
+            digest.update(b"[")
+            for item in node:
+                digest.update(self.hash(item))
+                digest.update(b",")
+        value = digest.digest()
+        # Keep a reference to the node so its id() cannot be reused while memoized
+        self._memo[key] = (node, value)
+        return value
+
+
+def _reportable(value):
+    """Scalars and scalar lists (enum, required) are reported inline; subtrees are not."""
+    if _is_scalar(value):
+        return value is not None
+    return isinstance(value, list) and all(_is_scalar(v) for v in value)
+
+
+def _change(pointer, kind, old=None, new=None):
+    record = {"pointer": pointer, "change": kind}
+    if _reportable(old):
+        record["old"] = old
+    if _reportable(new):
+        record["new"] = new
+    return record
+
+
+def _named_items(items):
+    """Key a list of parameter-like dicts by (name, in); None if the list isn't one."""
+    keyed = {}
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or "name" not in item:
+            return None
+        keyed[(item.get("name"), item.get("in"))] = i
+    return keyed
+
+
+class StructuralDiff:
+    """Diff two documents, pruning identical subtrees by hash."""
+
+    def __init__(self, old_hasher=None, new_hasher=None):
+        self.old_hasher = old_hasher or StructuralHasher()
+        self.new_hasher = new_hasher or StructuralHasher()
+        self.changes = []
+
+    def diff(self, old, new, pointer=""):
+        if old is new:
+            return
+        if _is_scalar(old) or _is_scalar(new) or type(old) is not type(new):
+            if old != new or type(old) is not type(new):
+                self.changes.append(_change(pointer, "modified", old, new))
+            return
+        if self.old_hasher.hash(old) == self.new_hasher.hash(new):
+            return
+
+        if isinstance(old, dict):
+            self._diff_dict(old, new, pointer)
+        else:
+            self._diff_list(old, new, pointer)
+
+    def _diff_dict(self, old, new, pointer):
+        for key, value in old.items():
+            child = f"{pointer}/{escape_pointer_token(key)}"
+            if key not in new:
+                self.changes.append(_change(child, "removed", old=value))
+            else:
+                self.diff(value, new[key], child)
+        for key, value in new.items():
+            if key not in old:
+                self.changes.append(_change(f"{pointer}/{escape_pointer_token(key)}", "added", new=value))
+
+    def _diff_list(self, old, new, pointer):
+        # Lists of scalars (enum, required, tags) compare as sets
+        if all(_is_scalar(v) for v in old) and all(_is_scalar(v) for v in new):
+            old_values = list(dict.fromkeys(old))
+            new_values = list(dict.fromkeys(new))
+            removed = [v for v in old_values if v not in new_values]
+            added = [v for v in new_values if v not in old_values]
+            if removed or added:
+                self.changes.append({
+                    "pointer": pointer,
+                    "change": "modified",
+                    "removed_values": removed,
+                    "added_values": added,
+                })
+            return
+
+        # Parameter lists are matched by (name, in) rather than position
+        old_named = _named_items(old)
+        new_named = _named_items(new)
+        if old_named is not None and new_named is not None:
+            for key, i in old_named.items():
+                if key not in new_named:
+                    self.changes.append(_change(f"{pointer}/{i}", "removed", old=old[i]))
+                else:
+                    j = new_named[key]
+                    self.diff(old[i], new[j], f"{pointer}/{j}")
+            for key, j in new_named.items():
+                if key not in old_named:
+                    self.changes.append(_change(f"{pointer}/{j}", "added", new=new[j]))
+            return
+
+        for i in range(max(len(old), len(new))):
+            child = f"{pointer}/{i}"
+            if i >= len(new):
+                self.changes.append(_change(child, "removed", old=old[i]))
+            elif i >= len(old):
+                self.changes.append(_change(child, "added", new=new[i]))
+            else:
+                self.diff(old[i], new[i], child)
+
+
+def diff_documents(old, new, old_hasher=None, new_hasher=None, roots=CONTRACT_ROOTS):
+    """Return pointer-level changes between the contract sections of two specs."""
+    differ = StructuralDiff(old_hasher, new_hasher)
+    for root in roots:
+        if root in old or root in new:
+            differ.diff(old.get(root, {}), new.get(root, {}), f"/{escape_pointer_token(root)}")
+    return differ.changes
+
+
+def classify_changes(changes):
+    """
+    Derive contract-relevant change lists from raw pointer changes:
+    - type_changes:     a `type` keyword changed value
+    - enum_changes:     enum values added/removed (removals narrow the contract)
+    - required_changes: fields/parameters that became required or optional
+    """
+    type_changes = []
+    enum_changes = []
+    required_changes = []
+
+    for change in changes:
+        pointer = change["pointer"]
+        parent, _, leaf = pointer.rpartition("/")
+        if parent.endswith("/properties"):
+            # A property that happens to be named "type"/"enum"/"required"
+            continue
+
+        if leaf == "type" and change["change"] == "modified":
+            type_changes.append({"pointer": pointer, "old": change.get("old"), "new": change.get("new")})
+
+        elif leaf == "enum" and "removed_values" in change:
+            enum_changes.append({
+                "pointer": pointer,
+                "removed_values": change["removed_values"],
+                "added_values": change["added_values"],
+            })
+
+        elif leaf == "required":
+            old_value, new_value = change.get("old"), change.get("new")
+            if "removed_values" in change:
+                # Schema `required: [...]` list edited
+                required_changes.append({
+                    "pointer": pointer,
+                    "added_required": change["added_values"],
+                    "removed_required": change["removed_values"],
+                })
+            elif isinstance(new_value, list) or isinstance(old_value, list):
+                # Schema `required: [...]` list added or dropped entirely
+                required_changes.append({
+                    "pointer": pointer,
+                    "added_required": new_value if isinstance(new_value, list) else [],
+                    "removed_required": old_value if isinstance(old_value, list) else [],
+                })
+            elif new_value is True or old_value is True:
+                # Parameter / request body `required: true` toggled
+                required_changes.append({"pointer": pointer, "now_required": new_value is True})
+
+    return {
+        "type_changes": type_changes,
+        "enum_changes": enum_changes,
+        "required_changes": required_changes,
+    }
@@ -0,0 +1,28 @@
+from cache import analysis_key, spec_digest
+from loader import load_spec_index
+
+MIXED_KEY_SPEC = b"""
+openapi: 3.0.0
+info: {title: Orders, version: "1"}
+paths:
+  /orders:
+    get:
+      responses:
+        200:
+          description: OK
+        default:
+          description: Error
+"""
+
+
+def test_digest_of_mixed_int_and_str_keys():
+    # An unquoted `200:` next to `default:` loads as int and str keys
+    index = load_spec_index(MIXED_KEY_SPEC)
+    assert set(index.spec["paths"]["/orders"]["get"]["responses"]) == {200, "default"}
+    assert index.digest == spec_digest(index.spec)
+    assert analysis_key(index, index, "model", 1)
+
+
+def test_digest_ignores_key_order():
+    assert spec_digest({"b": 1, "a": {200: "x", "default": "y"}}) == \
+        spec_digest({"a": {"default": "y", 200: "x"}, "b": 1})
@@ -0,0 +1,16 @@
+from fallback import deterministic_analysis
+
+
+def test_overflow_line_is_not_prefixed():
+    diff_result = {
+        "naming_issues": [f"field_{i} is not camelCase" for i in range(8)],
+        "missing_descriptions": [f"/path{i} GET" for i in range(17)],
+    }
+    recommendations = deterministic_analysis(diff_result)["recommendations"]
+
+    naming = [r for r in recommendations if r.startswith("Fix naming issue: ")]
+    described = [r for r in recommendations if r.startswith("Add a description: ")]
+    assert len(naming) == 5 and len(described) == 5
+    assert "... and 3 more" in recommendations
+    assert "... and 12 more" in recommendations
+    assert not any("more" in r for r in naming + described)
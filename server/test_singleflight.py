@@ -0,0 +1,30 @@
+import asyncio
+
+from singleflight import AsyncSingleFlight
+
+
+def test_cancelled_leader_does_not_strand_the_key():
+    calls = []
+
+    async def runner(prompts, publish):
+        calls.append(prompts)
+        if len(calls) == 1:
+            await asyncio.Event().wait()  # never finishes on its own
+        return {"ok": True}
+
+    async def scenario():
+        flights = AsyncSingleFlight(runner)
+        first = flights.join("key", ["prompt"])
+        await asyncio.sleep(0)
+        for task in list(flights._tasks):
+            task.cancel()
+        await asyncio.sleep(0)
+
+        assert first.done and "error" in first.result
+        assert flights.stats()["in_flight"] == 0
+
+        second = await asyncio.wait_for(flights.run("key", ["prompt"]), 1)
+        assert second == {"ok": True}
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
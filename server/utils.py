@@ -4,6 +4,8 @@ Utility functions for JSON extraction and AI output validation.
 import re
 import json
 
+from metrics import json_extract_failures
+
 
 # Expected schema for AI output
 AI_OUTPUT_SCHEMA = {
@@ -16,11 +18,75 @@ AI_OUTPUT_SCHEMA = {
 }
 
 
+class JsonObjectTracker:
+    """
+    Incrementally tracks brace balance of the first top-level JSON object in a
+    stream of text chunks (string- and escape-aware), so a caller can stop an
+    LLM generation as soon as that object is closed.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape_next = False
+        self.started = False
+        self.complete = False
+        # Per feed(): offset just past the opening brace if it was in this
+        # chunk, and offsets of the commas between the object's members
+        self.opened_at = -1
+        self.separators = []
+
+    def feed(self, chunk):
+        """
+        Consume the next chunk. Returns the offset just past the closing brace
+        if the object completed inside this chunk, otherwise -1.
+        """
+        self.opened_at = -1
+        self.separators = []
+        if self.complete:
+            return 0
+        for i, c in enumerate(chunk):
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.opened_at = i + 1
+                continue
+            if self.escape_next:
+                self.escape_next = False
+                continue
+            if c == "\\":
+                self.escape_next = True
+                continue
+            if c == '"':
+                self.in_string = not self.in_string
+                continue
+            if self.in_string:
+                continue
+            if c in "{[":
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    return i + 1
+            elif c == "," and self.depth == 1:
+                self.separators.append(i)
+        return -1
+
+
 def extract_json(text):
     """
     Extract valid JSON from LLM text output.
     Handles markdown code fences, extra text, and common LLM quirks.
     """
+    result = _extract_json(text)
+    if isinstance(result, dict) and "error" in result:
+        json_extract_failures.inc()
+    return result
+
+
+def _extract_json(text):
     if not text or not isinstance(text, str):
         return {"error": "Empty or invalid response from AI"}
 
@@ -36,36 +102,14 @@ def extract_json(text):
         pass
 
     # Step 3: Find the outermost { ... } block
-    # Use a bracket-counting approach instead of greedy regex
+    # Use a bracket-counting approach instead of greedy regex (shared with
+    # the streaming early-termination check)
     start_idx = text.find("{")
     if start_idx == -1:
         return {"error": "No JSON object found in AI response"}
 
-    depth = 0
-    end_idx = -1
-    in_string = False
-    escape_next = False
-
-    for i in range(start_idx, len(text)):
-        c = text[i]
-        if escape_next:
-            escape_next = False
-            continue
-        if c == "\\":
-            escape_next = True
-            continue
-        if c == '"':
-            in_string = not in_string
-            continue
-        if in_string:
-            continue
-        if c == "{":
-            depth += 1
-        elif c == "}":
-            depth -= 1
-            if depth == 0:
-                end_idx = i
-                break
+    end = JsonObjectTracker().feed(text[start_idx:])
+    end_idx = start_idx + end - 1 if end != -1 else -1
 
     if end_idx == -1:
         return {"error": "Malformed JSON: unmatched braces"}
@@ -78,6 +122,73 @@ def extract_json(text):
         return {"error": f"JSON parse failed: {e}"}
 
 
+def _validate_risk_level(value):
+    risk = str(value or "").strip().upper()
+    # Sometimes AI returns "LOW | MEDIUM | HIGH" literally
+    if risk in ("LOW", "MEDIUM", "HIGH"):
+        return risk, []
+    # Try to infer from partial matches
+    if "HIGH" in risk:
+        return "HIGH", []
+    if "MEDIUM" in risk:
+        return "MEDIUM", []
+    if "LOW" in risk:
+        return "LOW", []
+    return "MEDIUM", [f"AI returned invalid risk_level '{risk}', defaulting to MEDIUM"]
+
+
+def _validate_pii_fields(pii):
+    if isinstance(pii, list):
+        return [str(f) for f in pii], []
+    if isinstance(pii, str):
+        return ([pii] if pii.strip() else []), ["pii_fields was a string, converted to list"]
+    return [], ["pii_fields had unexpected type, defaulting to empty list"]
+
+
+def _validate_explanation(explanation):
+    return (str(explanation) if explanation else "No breaking changes identified."), []
+
+
+def _validate_documentation_score(doc_score):
+    try:
+        return max(1, min(int(doc_score), 10)), []
+    except (ValueError, TypeError):
+        return 5, [f"documentation_score '{doc_score}' was not a number, defaulting to 5"]
+
+
+def _validate_recommendations(recs):
+    if isinstance(recs, list):
+        return [str(r) for r in recs if r], []
+    if isinstance(recs, str):
+        return ([recs] if recs.strip() else []), ["recommendations was a string, converted to list"]
+    return [], []
+
+
+def _validate_summary(summary):
+    return (str(summary) if summary else "No summary provided."), []
+
+
+# field -> (default when missing, validator returning (value, warnings))
+FIELD_VALIDATORS = {
+    "risk_level": ("", _validate_risk_level),
+    "pii_fields": ([], _validate_pii_fields),
+    "breaking_change_explanation": ("", _validate_explanation),
+    "documentation_score": (5, _validate_documentation_score),
+    "recommendations": ([], _validate_recommendations),
+    "executive_summary": ("", _validate_summary),
+}
+
+
+def validate_ai_field(key, value):
+    """
+    Validate a single top-level AI output field (used while streaming).
+    Returns (validated_value, warnings); unknown keys pass through with a warning.
+    """
+    if key not in FIELD_VALIDATORS:
+        return value, [f"AI returned unexpected field: {key}"]
+    return FIELD_VALIDATORS[key][1](value)
+
+
 def validate_ai_output(ai_result):
     """
     Validate and sanitize AI output against the expected schema.
@@ -93,60 +204,9 @@ def validate_ai_output(ai_result):
     warnings = []
     validated = {}
 
-    # --- risk_level ---
-    risk = ai_result.get("risk_level", "").strip().upper()
-    # Sometimes AI returns "LOW | MEDIUM | HIGH" literally
-    if risk in ("LOW", "MEDIUM", "HIGH"):
-        validated["risk_level"] = risk
-    else:
-        # Try to infer from partial matches
-        if "HIGH" in risk:
-            validated["risk_level"] = "HIGH"
-        elif "MEDIUM" in risk:
-            validated["risk_level"] = "MEDIUM"
-        elif "LOW" in risk:
-            validated["risk_level"] = "LOW"
-        else:
-            validated["risk_level"] = "MEDIUM"
-            warnings.append(f"AI returned invalid risk_level '{risk}', defaulting to MEDIUM")
-
-    # --- pii_fields ---
-    pii = ai_result.get("pii_fields", [])
-    if isinstance(pii, list):
-        validated["pii_fields"] = [str(f) for f in pii]
-    elif isinstance(pii, str):
-        validated["pii_fields"] = [pii] if pii.strip() else []
-        warnings.append("pii_fields was a string, converted to list")
-    else:
-        validated["pii_fields"] = []
-        warnings.append("pii_fields had unexpected type, defaulting to empty list")
-
-    # --- breaking_change_explanation ---
-    explanation = ai_result.get("breaking_change_explanation", "")
-    validated["breaking_change_explanation"] = str(explanation) if explanation else "No breaking changes identified."
-
-    # --- documentation_score ---
-    doc_score = ai_result.get("documentation_score", 5)
-    try:
-        doc_score = int(doc_score)
-        validated["documentation_score"] = max(1, min(doc_score, 10))
-    except (ValueError, TypeError):
-        validated["documentation_score"] = 5
-        warnings.append(f"documentation_score '{doc_score}' was not a number, defaulting to 5")
-
-    # --- recommendations ---
-    recs = ai_result.get("recommendations", [])
-    if isinstance(recs, list):
-        validated["recommendations"] = [str(r) for r in recs if r]
-    elif isinstance(recs, str):
-        validated["recommendations"] = [recs] if recs.strip() else []
-        warnings.append("recommendations was a string, converted to list")
-    else:
-        validated["recommendations"] = []
-
-    # --- executive_summary ---
-    summary = ai_result.get("executive_summary", "")
-    validated["executive_summary"] = str(summary) if summary else "No summary provided."
+    for key, (default, validator) in FIELD_VALIDATORS.items():
+        validated[key], field_warnings = validator(ai_result.get(key, default))
+        warnings.extend(field_warnings)
 
     # --- Flag any extra unexpected fields ---
     expected_keys = set(AI_OUTPUT_SCHEMA.keys())
@@ -158,3 +218,64 @@ def validate_ai_output(ai_result):
             validated[k] = ai_result[k]
 
     return validated, warnings
+
+
+class IncrementalJsonParser:
+    """
+    Parses the first top-level JSON object of a token stream member by member.
+    Each call to feed() returns the (key, value) pairs that became complete in
+    that chunk, so callers can act on a field before the object is finished.
+    Text is buffered only for the member currently being read.
+
+    Members that don't parse on their own are counted in `malformed`; `fields`
+    is then incomplete and the whole text needs the extract_json pass.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.malformed = 0
+        self.complete = False
+        self.end_offset = -1
+        self._tracker = JsonObjectTracker()
+        self._member = []
+
+    def feed(self, chunk):
+        """
+        Consume the next chunk. When the object closes inside this chunk,
+        `complete` is set and `end_offset` is the offset just past the brace.
+        """
+        completed = []
+        if self.complete:
+            return completed
+
+        tracker = self._tracker
+        end = tracker.feed(chunk)
+        if not tracker.started:
+            return completed
+        start = max(tracker.opened_at, 0)
+        for separator in tracker.separators:
+            self._member.append(chunk[start:separator])
+            self._flush(completed)
+            start = separator + 1
+        if end == -1:
+            self._member.append(chunk[start:])
+            return completed
+        self._member.append(chunk[start:end - 1])
+        self._flush(completed)
+        self.complete = True
+        self.end_offset = end
+        return completed
+
+    def _flush(self, completed):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        try:
+            member = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return
+        for key, value in member.items():
+            self.fields[key] = value
+            completed.append((key, value))